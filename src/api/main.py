@@ -1,7 +1,13 @@
 import uvicorn
+import asyncio
+import os
 import pathlib
 import sys
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
 
 # При запуске через -m src.api.main Python сам добавит корень в path,
@@ -14,37 +20,190 @@ from src.api.models import RewriteRequest, RewriteResponse
 from src.rag.retriever import VacancyRetriever
 from src.rag.llm import VacancyOptimizer
 
+# Сколько поисков референсов идет одновременно (пул потоков, общий для всех клиентов).
+# Параллельность запросов к LLM ограничивается отдельно: LLM_MAX_CONCURRENCY в llm.py
+MAX_IN_FLIGHT = int(os.getenv("OPTIMIZE_MAX_IN_FLIGHT", "8"))
+# Как часто проверять, не опубликована ли новая версия индекса (0 — не проверять)
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "30"))
+
 retriever = None
 optimizer = None
+executor = None
+warm_up_task = None
+warm_up_error = None
+index_watch_task = None
+
+
+async def _warm_up():
+    """Загрузка модели и индекса в фоне: порт открыт сразу, готовность — по /health/ready"""
+    global warm_up_error
+    started = time.monotonic()
+    try:
+        await asyncio.to_thread(retriever.warm_up)
+        print(f"✅ AI ядро прогрето за {time.monotonic() - started:.1f} c")
+    except Exception as e:
+        warm_up_error = repr(e)
+        print(f"❌ Ошибка прогрева: {warm_up_error}")
+
+
+async def _warm_up_tokenizer():
+    """Токенизатор LLM для бюджета промпта; не влияет на готовность (до загрузки — оценка)"""
+    await asyncio.to_thread(optimizer.budget.counter.warm_up)
+
+
+async def _watch_index():
+    """Горячая подмена индекса: новая версия от build_index подхватывается без рестарта"""
+    await warm_up_task
+    while warm_up_error is None:
+        await asyncio.sleep(INDEX_POLL_SECONDS)
+        try:
+            await asyncio.to_thread(retriever.refresh)
+        except Exception as e:
+            print(f"❌ Ошибка обновления индекса: {e!r}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global retriever, optimizer
-    data_path = root_dir / "data" / "vacancies_processed.parquet"
+    global retriever, optimizer, executor, warm_up_task, warm_up_error, index_watch_task
 
     print("🚀 Инициализация AI ядра...")
-    retriever = VacancyRetriever(str(data_path) if data_path.exists() else None)
+    # Индекс собирается офлайн (python -m src.rag.build_index), сервис только загружает готовый
+    retriever = VacancyRetriever(lazy=True)
     optimizer = VacancyOptimizer()
+    executor = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="optimize")
+    warm_up_error = None
+    warm_up_task = asyncio.create_task(_warm_up())
+    tokenizer_task = asyncio.create_task(_warm_up_tokenizer())
+    index_watch_task = asyncio.create_task(_watch_index()) if INDEX_POLL_SECONDS > 0 else None
     yield
+    if index_watch_task is not None:
+        index_watch_task.cancel()
+    warm_up_task.cancel()
+    tokenizer_task.cancel()
+    await optimizer.aclose()
+    executor.shutdown(wait=False, cancel_futures=True)
     print("🛑 Остановка ядра.")
 
 
 app = FastAPI(lifespan=lifespan)
 
 
+@app.get("/health/live")
+async def health_live():
+    # Процесс жив и event loop отвечает — даже если модель еще грузится
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    if warm_up_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": warm_up_error})
+    if retriever is None or optimizer is None or not retriever.ready:
+        return JSONResponse(status_code=503, content={"status": "warming"})
+    return {"status": "ready", "index_version": retriever.version}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    result = {}
+    if retriever is not None:
+        result["index_version"] = retriever.version
+        result["query_cache"] = retriever.query_cache.stats()
+        if retriever.encoder is not None:
+            result["query_encoder"] = retriever.encoder.stats()
+    if optimizer is not None and optimizer.cache is not None:
+        result["rewrite_cache"] = optimizer.cache.stats()
+    if optimizer is not None:
+        result["llm_tokens"] = optimizer.budget.stats()
+    return result
+
+
+def _search_references(vacancies) -> list:
+    """Референсы для всего батча одним вызовом: один encode и один kneighbors на группу фильтров"""
+    if not retriever:
+        return [[] for _ in vacancies]
+    queries = [f"{vac.vacancy_title} {vac.specialization}" for vac in vacancies]
+    # Референсы из того же города/профиля/специализации, с расширением, если таких мало
+    filters = [{"city": vac.city, "profile": vac.profile, "specialization": vac.specialization} for vac in vacancies]
+    return retriever.search_many(queries, filters=filters)
+
+
+async def _batch_references(vacancies) -> list:
+    # Поиск блокирующий (энкодер + индекс): уводим в пул потоков, чтобы не морозить event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _search_references, vacancies)
+
+
+def _deadline(req: RewriteRequest):
+    return time.monotonic() + req.deadline_seconds if req.deadline_seconds else None
+
+
 @app.post("/optimize", response_model=RewriteResponse)
 async def optimize_endpoint(req: RewriteRequest):
-    results = []
-    for vac in req.vacancies:
-        # Поиск референсов
-        query = f"{vac.vacancy_title} {vac.specialization}"
-        refs = retriever.search(query) if retriever else []
-
-        # Генерация
-        res = optimizer.optimize(vac, refs)
-        results.append(res)
-    return RewriteResponse(results=results)
+    deadline = _deadline(req)
+    references = await _batch_references(req.vacancies)
+    # Генерация: асинхронный клиент с повторами и общим лимитом параллельности;
+    # gather сохраняет порядок входных вакансий
+    results = await asyncio.gather(*(
+        optimizer.aoptimize(vac, refs, deadline=deadline) for vac, refs in zip(req.vacancies, references)
+    ))
+    return RewriteResponse(results=list(results))
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_vacancy(index: int, vac, refs, deadline, events: asyncio.Queue):
+    try:
+        async for kind, payload in optimizer.astream_optimize(vac, refs, deadline=deadline):
+            if kind == "token":
+                await events.put(_sse("token", {"index": index, "input_id": vac.input_id, "delta": payload}))
+            else:
+                await events.put(_sse("result", {"index": index, "result": payload.model_dump()}))
+    except Exception as e:
+        # Сбой одной вакансии не обрывает поток: остальные вакансии и done дойдут до клиента
+        print(f"❌ Ошибка потоковой оптимизации {vac.input_id}: {e!r}")
+        await events.put(_sse("error", {"index": index, "input_id": vac.input_id,
+                                        "error": str(e) or type(e).__name__}))
+
+
+@app.post("/optimize/stream")
+async def optimize_stream_endpoint(req: RewriteRequest):
+    """
+    То же, что /optimize, но через Server-Sent Events:
+    token  — очередной кусок ответа LLM для вакансии index,
+    result — готовый VacancyOut для вакансии index,
+    error  — вакансию index обработать не удалось (вместо result),
+    done   — весь батч обработан.
+    """
+    deadline = _deadline(req)
+
+    async def event_stream():
+        events = asyncio.Queue()
+        references = await _batch_references(req.vacancies)
+        tasks = [
+            asyncio.create_task(_stream_vacancy(i, vac, refs, deadline, events))
+            for i, (vac, refs) in enumerate(zip(req.vacancies, references))
+        ]
+        waiter = asyncio.ensure_future(asyncio.gather(*tasks))
+        try:
+            while not (waiter.done() and events.empty()):
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            waiter.result()
+            yield _sse("done", {"count": len(req.vacancies)})
+        finally:
+            # Клиент отключился: не тратим LLM на ответы, которые никто не прочитает
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
@@ -22,10 +22,15 @@ class VacancyOut(BaseModel):
     improvement_notes: List[str] = Field(default_factory=list)
     # Используем то же имя, что в llm.py
     predicted_efficiency_score: Optional[float] = Field(default=None)
+    # True, если ответ взят из кэша переписываний без вызова LLM
+    cache_hit: bool = Field(default=False)
 
 
 class RewriteRequest(BaseModel):
     vacancies: List[VacancyIn]
+    deadline_seconds: Optional[float] = Field(
+        default=None, gt=0, description="Сколько секунд клиент готов ждать ответ на весь батч"
+    )
 
 
 class RewriteResponse(BaseModel):
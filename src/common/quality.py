@@ -0,0 +1,129 @@
+import re
+
+# Правила: имя -> (ключевые подстроки, уточняющая регулярка или None).
+# Проверяются по тексту в нижнем регистре. Первые пять — блоки
+# VacancyAdvisor._analyze_quality, последние две — text.basic_issues.
+RULES = {
+    "duties": (("обязанност", "задачи"), None),
+    "requirements": (("требован", "ищем"), None),
+    "conditions": (("условия", "предлагаем"), None),
+    "salary": (("руб", "₽", "оклад", "доход", "зарплат", "на руки"), None),
+    "schedule": (("график", "5/2", "2/2", "удален"), None),
+    "basic_salary": (("₽", "руб", "€", "$", "k", "тыс"), r"\b(₽|руб|руб\.|€|\$|k\b|тыс)\b"),
+    "basic_format": (("удаленк", "remote", "гибрид", "hybrid"), r"\b(удаленк|remote|гибрид|hybrid)\b"),
+}
+
+# Списки проверяются по исходному тексту (с учетом регистра)
+LIST_MARKERS = ("<ul>", "<li>", "•")
+
+
+class QualityAnalyzer:
+    """
+    Скоринг вакансии по скомпилированному один раз набору правил.
+
+    Текст приводится к нижнему регистру один раз на оба анализа. Ключевые
+    подстроки ищутся через str.__contains__ (поиск в C, быстрее любой
+    регулярки-объединения в CPython), а регулярки с границами слов
+    запускаются, только если в тексте есть хотя бы одна их подстрока.
+    Баллы и порядок замечаний совпадают с прежними _analyze_quality и basic_issues.
+    """
+
+    def __init__(self, rules: dict = None):
+        rules = rules or RULES
+        self.rules = [
+            (name, keywords, re.compile(pattern) if pattern else None)
+            for name, (keywords, pattern) in rules.items()
+        ]
+
+    def scan(self, text_lower: str) -> set:
+        """Имена правил, сработавших в тексте (текст уже в нижнем регистре)"""
+        found = set()
+        for name, keywords, regex in self.rules:
+            for keyword in keywords:
+                if keyword in text_lower:
+                    if regex is None or regex.search(text_lower):
+                        found.add(name)
+                    break
+        return found
+
+    def analyze(self, text: str, found: set = None) -> dict:
+        """Анализ качества (0-100) — то же, что VacancyAdvisor._analyze_quality"""
+        if len(text) < 50:
+            return {"score": 0, "issues": ["Текст отсутствует"]}
+        if found is None:
+            found = self.scan(text.lower())
+
+        score = 0
+        issues = []
+
+        # 1. ОБЪЕМ
+        if len(text) < 300:
+            issues.append("❌ Критически мало текста")
+        elif len(text) > 800:
+            score += 20
+        else:
+            score += 10
+
+        # 2. СТРУКТУРА
+        blocks_found = 0
+        for name, issue in (("duties", "❓ Нет блока 'Обязанности'"),
+                            ("requirements", "❓ Нет блока 'Требования'"),
+                            ("conditions", "❓ Нет блока 'Условия'")):
+            if name in found:
+                score += 15
+                blocks_found += 1
+            else:
+                issues.append(issue)
+
+        # БОНУС за полную структуру
+        if blocks_found == 3:
+            score += 10
+
+        # 3. ДЕТАЛИ
+        if "salary" in found:
+            score += 10
+        else:
+            issues.append("💰 Не указана зарплата")
+
+        if "schedule" in found:
+            score += 10
+        else:
+            issues.append("📅 Не указан график")
+
+        # 4. ОФОРМЛЕНИЕ
+        if any(marker in text for marker in LIST_MARKERS):
+            score += 10
+        else:
+            issues.append("📄 Нет списков")
+
+        return {"score": min(score, 100), "issues": issues}
+
+    def basic_issues(self, text: str, found: set = None) -> list:
+        """То же, что text.basic_issues"""
+        if found is None:
+            found = self.scan(text.lower())
+        issues = []
+        if len(text) < 300:
+            issues.append("Слишком короткое описание — мало конкретики")
+        if len(text) > 6000:
+            issues.append("Слишком длинный текст — вероятно, тяжело читать")
+        if "basic_salary" not in found:
+            issues.append("Не найдена зарплатная вилка/упоминание компенсации")
+        if "basic_format" not in found:
+            issues.append("Не найдено явное указание формата работы (удалёнка/гибрид/офис)")
+        return issues
+
+    def evaluate(self, text: str) -> dict:
+        """Оба анализа по одному проходу"""
+        text = text or ""
+        found = self.scan(text.lower())
+        return {"quality": self.analyze(text, found), "basic_issues": self.basic_issues(text, found)}
+
+    def analyze_many(self, texts) -> list:
+        return [self.analyze(t or "") for t in texts]
+
+    def evaluate_many(self, texts) -> list:
+        return [self.evaluate(t) for t in texts]
+
+
+analyzer = QualityAnalyzer()
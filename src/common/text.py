@@ -1,23 +1,21 @@
 import re
 
+from src.common.quality import analyzer as quality_analyzer
+
 def normalize_text(t: str) -> str:
     t = re.sub(r"<[^>]+>", " ", t)      # простая очистка HTML
     t = re.sub(r"\s+", " ", t).strip()
     return t
 
+def reference_snippet(description, limit: int = 300) -> str:
+    """Начало описания референса для промпта: одной строкой, не длиннее limit"""
+    if description is None:
+        return ""
+    return str(description).replace("\n", " ")[:limit]
+
 def basic_issues(text: str) -> list[str]:
-    issues = []
-    if len(text) < 300:
-        issues.append("Слишком короткое описание — мало конкретики")
-    if len(text) > 6000:
-        issues.append("Слишком длинный текст — вероятно, тяжело читать")
-    # простые эвристики: “зарплата”
-    if not re.search(r"\b(₽|руб|руб\.|€|\$|k\b|тыс)\b", text.lower()):
-        issues.append("Не найдена зарплатная вилка/упоминание компенсации")
-    # “удалёнка”
-    if not re.search(r"\b(удаленк|remote|гибрид|hybrid)\b", text.lower()):
-        issues.append("Не найдено явное указание формата работы (удалёнка/гибрид/офис)")
-    return issues
+    # Правила (“зарплата”, “удалёнка”) скомпилированы один раз в src.common.quality
+    return quality_analyzer.basic_issues(text)
 
 def heuristic_quality_score(text: str, issues: list[str]) -> int:
     score = 85
@@ -0,0 +1,212 @@
+"""
+Потоковый (out-of-core) режим prepare.py для истории, которая не влезает в память.
+
+1. Сырые данные читаются порциями и раскладываются по hash(vacancy_id) в spill-файлы,
+   так что вся история одной вакансии попадает в один файл.
+2. Каждый spill-файл по отдельности считается тем же calculate_peak_efficiency_batch;
+   от него остается одна строка на вакансию (свежайшее описание + efficiency).
+3. Порог Top-20% считается по массиву efficiency, итог дописывается в OUTPUT_FILE потоком.
+
+Число spill-файлов и размер порции подбираются из бюджета памяти.
+
+Запуск: python src/data/prepare.py --memory-budget-mb 2048
+"""
+import math
+import resource
+import shutil
+import sys
+import tempfile
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from src.data import prepare
+
+# Во сколько раз обработка партиции дороже самих данных (сортировки, копии, результат)
+WORK_FACTOR = 3
+# По этой выборке оцениваем, сколько памяти занимает одна строка
+SAMPLE_ROWS = 10_000
+NUMERIC_COLS = ('loaded_at', 'total_responses')
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    """
+    Пиковый RSS процесса (ru_maxrss на Linux — в килобайтах).
+    children=True — пик самого большого из завершенных дочерних процессов (воркеров --workers)
+    """
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def iter_raw(batch_rows: int, since=None):
+    """Сырые данные порциями по batch_rows строк (Parquet-партиции или единый CSV)"""
+    parts = prepare.raw_parts()
+    if parts:
+        dataset = ds.dataset([str(p) for p in parts], format="parquet")
+        columns = [c for c in prepare.REQUIRED_COLS if c in dataset.schema.names]
+        batches = dataset.to_batches(
+            columns=columns, filter=prepare.since_filter(dataset, since), batch_size=batch_rows
+        )
+        for batch in batches:
+            if batch.num_rows:
+                yield batch.to_pandas()
+    elif prepare.RAW_FILE.exists():
+        chunks = pd.read_csv(
+            prepare.RAW_FILE, usecols=lambda c: c in prepare.REQUIRED_COLS,
+            chunksize=batch_rows, low_memory=False
+        )
+        for chunk in chunks:
+            if since is not None:
+                chunk = chunk[pd.to_datetime(chunk['loaded_at']) >= pd.Timestamp(since)]
+            if len(chunk):
+                yield chunk
+
+
+def estimate_rows(sample: pd.DataFrame) -> int:
+    parts = prepare.raw_parts()
+    if parts:
+        return sum(pq.ParquetFile(p).metadata.num_rows for p in parts)
+    # Для CSV: размер файла / средний размер строки выборки в CSV
+    csv_row_bytes = len(sample.to_csv(index=False).encode("utf-8")) / len(sample)
+    return int(prepare.RAW_FILE.stat().st_size / csv_row_bytes) + 1
+
+
+def bucket_of(vacancy_ids: pd.Series, n_buckets: int) -> np.ndarray:
+    """Стабильный (между запусками) номер spill-файла по vacancy_id"""
+    return (pd.util.hash_array(vacancy_ids.to_numpy(dtype=object)) % np.uint64(n_buckets)).astype(np.int64)
+
+
+def text_schema(schema: pa.Schema) -> pa.Schema:
+    """Текстовые колонки всегда string: в отдельной порции они могут оказаться целиком пустыми"""
+    return pa.schema([
+        f if f.name in NUMERIC_COLS or f.name == 'efficiency' else pa.field(f.name, pa.string())
+        for f in schema
+    ])
+
+
+class SpillWriter:
+    """Раскладывает порции по n_buckets Parquet-файлам по hash(vacancy_id)"""
+
+    def __init__(self, spill_dir: pathlib.Path, n_buckets: int):
+        self.n_buckets = n_buckets
+        self.paths = [spill_dir / f"bucket-{i:04d}.parquet" for i in range(n_buckets)]
+        self.writers = {}
+        self.schema = None
+
+    def write(self, chunk: pd.DataFrame):
+        chunk = prepare.cast_raw_types(chunk)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.schema is None:
+            self.schema = text_schema(table.schema).remove_metadata()
+        table = table.cast(self.schema)
+
+        buckets = bucket_of(chunk['vacancy_id'], self.n_buckets)
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.searchsorted(buckets[order], np.arange(self.n_buckets + 1))
+        for b in range(self.n_buckets):
+            if bounds[b] == bounds[b + 1]:
+                continue
+            if b not in self.writers:
+                self.writers[b] = pq.ParquetWriter(self.paths[b], self.schema)
+            self.writers[b].write_table(table.take(order[bounds[b]:bounds[b + 1]]))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def written_paths(self) -> list:
+        return [self.paths[b] for b in sorted(self.writers)]
+
+
+def run_chunked(memory_budget_mb: int, since=None, output_file=None, workers: int = 1) -> dict:
+    output_file = output_file or prepare.OUTPUT_FILE
+    budget = memory_budget_mb * 1024 ** 2
+    # Интерпретатор и библиотеки уже заняли память, бюджет считаем сверх нее
+    baseline = peak_rss_mb()
+    print(f"🚀 Потоковый режим, бюджет памяти: {memory_budget_mb} МБ")
+
+    sample = next(iter_raw(SAMPLE_ROWS, since), None)
+    if sample is None:
+        print(f"❌ Не найдены ни {prepare.RAW_DIR}, ни {prepare.RAW_FILE}!")
+        return {}
+
+    row_bytes = max(sample.memory_usage(deep=True).sum() / len(sample), 1.0)
+    total_rows = estimate_rows(sample)
+    del sample
+    n_buckets = max(1, math.ceil(total_rows * row_bytes * WORK_FACTOR / budget))
+    # Порция + ее разбивка по бакетам должны занимать малую долю бюджета
+    batch_rows = max(1000, int(budget / (4 * row_bytes)))
+    print(f"📐 ~{total_rows} строк по ~{row_bytes:.0f} байт: {n_buckets} партиций, порция {batch_rows} строк")
+
+    spill_dir = pathlib.Path(tempfile.mkdtemp(prefix="prepare-spill-", dir=prepare.DATA_DIR))
+    try:
+        # 1. Раскладываем историю по бакетам
+        spill = SpillWriter(spill_dir, n_buckets)
+        rows = 0
+        try:
+            for chunk in iter_raw(batch_rows, since):
+                spill.write(chunk)
+                rows += len(chunk)
+        finally:
+            spill.close()
+        print(f"📦 Разложено строк: {rows}")
+
+        # 2. Эффективность по каждому бакету отдельно
+        print("🧠 Расчет пиковой эффективности по партициям...")
+        result_paths, efficiencies = [], []
+        result_schema = None
+        # Один пул процессов на все партиции: старт воркеров не повторяется на каждом бакете
+        with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+            for i, path in enumerate(spill.written_paths()):
+                result = prepare.compute_efficiency(pd.read_parquet(path), workers, pool=pool)
+                path.unlink()
+                efficiencies.append(result['efficiency'].to_numpy())
+
+                table = pa.Table.from_pandas(result, preserve_index=False)
+                if result_schema is None:
+                    result_schema = text_schema(table.schema).remove_metadata()
+                result_path = spill_dir / f"result-{i:04d}.parquet"
+                pq.write_table(table.cast(result_schema), result_path)
+                result_paths.append(result_path)
+                del result, table
+
+        efficiency = np.concatenate(efficiencies)
+        print(f"🆔 Уникальных вакансий: {len(efficiency)}")
+
+        # 3. Порог и потоковая запись итогового файла
+        threshold = prepare.top_threshold(efficiency)
+        print(f"🌟 Эталонных вакансий отобрано: {int((efficiency >= threshold).sum())}")
+
+        print(f"💾 Сохранение в Parquet...")
+        writer = pq.ParquetWriter(output_file, result_schema.append(pa.field('is_top_performer', pa.bool_())))
+        try:
+            for path in result_paths:
+                table = pq.read_table(path)
+                flags = pa.array(table.column('efficiency').to_numpy() >= threshold)
+                writer.write_table(table.append_column('is_top_performer', flags))
+        finally:
+            writer.close()
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    peak = peak_rss_mb()
+    # Воркеры к этому моменту завершены (пул закрыт), их пики видны в RUSAGE_CHILDREN
+    workers_peak = peak_rss_mb(children=True) if workers > 1 else 0.0
+    print(f"✅ Успешно! Файл готов: {output_file}")
+    print(f"📈 Пиковый RSS: {peak:.0f} МБ, прирост за обработку: {peak - baseline:.0f} МБ (бюджет {memory_budget_mb} МБ)")
+    if workers > 1:
+        print(f"📈 Пиковый RSS воркера: {workers_peak:.0f} МБ (воркеров: {workers})")
+    if peak - baseline + workers_peak > memory_budget_mb:
+        print("⚠️ Пиковый RSS превысил бюджет — уменьшите порцию или увеличьте число партиций")
+
+    return {"rows": rows, "vacancies": len(efficiency), "n_buckets": n_buckets,
+            "batch_rows": batch_rows, "peak_rss_mb": peak, "baseline_rss_mb": baseline,
+            "workers_peak_rss_mb": workers_peak}
@@ -0,0 +1,223 @@
+"""
+Инкрементальный ежедневный пересчет эффективности.
+
+Вместо пересчета по всей истории храним состояние по каждой вакансии
+(data/efficiency_state.parquet):
+  settled_best    — максимум по окнам, которые уже не изменятся
+                    (окно целиком раньше последнего снимка минус 7 дней),
+  tail_loaded_at,
+  tail_responses  — снимки за последние 7 дней: окна, начинающиеся в них,
+                    еще могут дотянуться до новых данных,
+  best_efficiency — текущая эффективность,
+  + поля свежайшего описания вакансии.
+Водяной знак (максимальный обработанный loaded_at) лежит в метаданных файла.
+
+При запуске читаются только строки новее водяного знака. Для затронутых вакансий
+хвост склеивается с новыми снимками и пересчитывается тем же window_efficiency_sorted,
+окна, выпавшие из хвоста, сворачиваются в settled_best. Итог совпадает с полным
+пересчетом, а работа пропорциональна дневной дельте. Затем заново считается
+порог Top-20% и перезаписывается vacancies_processed.parquet.
+
+Ограничение: строки с loaded_at не новее водяного знака (опоздавшие) не учитываются —
+для них нужен --rebuild.
+
+Запуск: python -m src.data.incremental [--rebuild]
+"""
+import argparse
+import os
+import sys
+import pathlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from src.data import prepare
+
+STATE_FILE = prepare.DATA_DIR / "efficiency_state.parquet"
+WINDOW_DAYS = 7
+# Все нужные колонки, кроме временного ряда (vacancy_id + описание)
+TEXT_COLS = [c for c in prepare.REQUIRED_COLS if c not in ('loaded_at', 'total_responses')]
+
+
+def state_schema(text_cols: list) -> pa.Schema:
+    return pa.schema(
+        [pa.field(c, pa.string()) for c in text_cols] + [
+            pa.field('settled_best', pa.float64()),
+            pa.field('best_efficiency', pa.float64()),
+            pa.field('tail_loaded_at', pa.list_(pa.timestamp('ns'))),
+            pa.field('tail_responses', pa.list_(pa.int64())),
+        ]
+    )
+
+
+def read_state(path: pathlib.Path):
+    """(таблица состояния, водяной знак) или (None, None), если состояния еще нет"""
+    if not path.exists():
+        return None, None
+    table = pq.read_table(path)
+    watermark = (table.schema.metadata or {}).get(b"watermark")
+    return table, pd.Timestamp(watermark.decode()) if watermark else None
+
+
+def write_state(table: pa.Table, watermark: pd.Timestamp, path: pathlib.Path):
+    table = table.replace_schema_metadata({"watermark": watermark.isoformat()})
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_new_rows(watermark):
+    """Строки новее водяного знака (при первом запуске — вся история)"""
+    parts = prepare.raw_parts()
+    if parts and watermark is not None:
+        # Партиции старше дня водяного знака не открываем вовсе
+        day = watermark.strftime("%Y-%m-%d")
+        parts = [p for p in parts if p.stem != "part-null" and p.stem[len("part-"):] >= day]
+        df = prepare.read_raw_parquet(parts, since=watermark) if parts else None
+    else:
+        df = prepare.load_raw(since=watermark)
+
+    if df is None:
+        if watermark is None:
+            return None
+        df = pd.DataFrame(columns=prepare.REQUIRED_COLS)
+
+    df = prepare.cast_raw_types(df)
+    df = df[df['loaded_at'].notna()]
+    if watermark is not None:
+        df = df[df['loaded_at'] > watermark]
+    return df.reset_index(drop=True)
+
+
+def update_state(state, new_df: pd.DataFrame, window_days: int = WINDOW_DAYS) -> pa.Table:
+    """Новое состояние: затронутые вакансии пересчитаны, остальные без изменений"""
+    text_cols = [c for c in TEXT_COLS if c in new_df.columns]
+    schema = state_schema(text_cols)
+
+    new_ids = new_df['vacancy_id'].to_numpy(dtype=object)
+    new_dates = new_df['loaded_at'].values.astype('datetime64[ns]').astype(np.int64)
+    new_resp = new_df['total_responses'].to_numpy(dtype=np.int64)
+
+    # 1. Хвосты затронутых вакансий из состояния
+    keep = None
+    tail_ids = np.zeros(0, dtype=object)
+    tail_dates = np.zeros(0, dtype=np.int64)
+    tail_resp = np.zeros(0, dtype=np.int64)
+    old_settled = {}
+    if state is not None:
+        touched = pc.is_in(state['vacancy_id'], value_set=pa.array(pd.unique(new_ids), type=pa.string()))
+        affected = state.filter(touched)
+        keep = state.filter(pc.invert(touched)).cast(schema)
+
+        lengths = pc.list_value_length(affected['tail_loaded_at']).to_numpy(zero_copy_only=False)
+        affected_ids = affected['vacancy_id'].to_numpy(zero_copy_only=False)
+        tail_ids = np.repeat(affected_ids, lengths)
+        tail_dates = pc.list_flatten(affected['tail_loaded_at']).cast(pa.int64()).to_numpy(zero_copy_only=False)
+        tail_resp = pc.list_flatten(affected['tail_responses']).to_numpy(zero_copy_only=False)
+        old_settled = dict(zip(affected_ids, affected['settled_best'].to_numpy(zero_copy_only=False)))
+
+    # 2. Хвост + новые снимки, сортировка по (вакансия, время)
+    n_tail = len(tail_ids)
+    ids = np.concatenate([tail_ids, new_ids])
+    dates_ns = np.concatenate([tail_dates, new_dates])
+    resp = np.concatenate([tail_resp, new_resp])
+
+    uniq_ids, seg = np.unique(ids.astype(str), return_inverse=True)
+    order = np.lexsort((dates_ns, seg))
+    seg, dates_ns, resp = seg[order], dates_ns[order], resp[order]
+    n = len(order)
+    if n == 0:
+        return keep if keep is not None else schema.empty_table()
+
+    seg_starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+    seg_ends = np.r_[seg_starts[1:], n] - 1
+
+    # 3. Окна от каждой строки; окна раньше (последний снимок - 7 дней) больше не изменятся
+    eff = prepare.window_efficiency_sorted(seg, dates_ns, resp, window_days)
+    window_ns = np.timedelta64(window_days, 'D').astype('timedelta64[ns]').astype(np.int64)
+    settled = dates_ns < (dates_ns[seg_ends] - window_ns)[seg]
+
+    prev_settled = np.array([old_settled.get(v, 0.0) for v in uniq_ids], dtype=float)
+    settled_best = np.maximum(prev_settled, np.maximum.reduceat(np.where(settled, eff, 0), seg_starts))
+    best = np.maximum(settled_best, np.maximum.reduceat(eff, seg_starts))
+
+    # 4. Новый хвост — суффикс каждой вакансии, который еще не "устоялся"
+    tail = ~settled
+    offsets = np.r_[0, np.cumsum(np.add.reduceat(tail.astype(np.int64), seg_starts))].astype(np.int32)
+    tail_loaded_at = pa.ListArray.from_arrays(
+        pa.array(offsets), pa.array(dates_ns[tail].view('datetime64[ns]'))
+    )
+    tail_responses = pa.ListArray.from_arrays(pa.array(offsets), pa.array(resp[tail]))
+
+    # 5. Свежайшее описание: последний снимок всегда из новых строк
+    latest = new_df.iloc[order[seg_ends] - n_tail][text_cols].reset_index(drop=True)
+    columns = {
+        c: pa.array(latest[c].to_numpy(dtype=object), type=pa.string(), from_pandas=True) for c in text_cols
+    }
+    columns.update(
+        settled_best=pa.array(settled_best, type=pa.float64()),
+        best_efficiency=pa.array(best, type=pa.float64()),
+        tail_loaded_at=tail_loaded_at,
+        tail_responses=tail_responses,
+    )
+    updated = pa.Table.from_pydict(columns, schema=schema)
+
+    tables = [keep, updated] if keep is not None else [updated]
+    return pa.concat_tables(tables).sort_by('vacancy_id')
+
+
+def write_processed(state: pa.Table, output_file: pathlib.Path) -> float:
+    """vacancies_processed.parquet из состояния: тот же формат, что и у полного пересчета"""
+    text_cols = [c for c in TEXT_COLS if c in state.schema.names]
+    result_df = state.select(text_cols).to_pandas()
+    result_df['efficiency'] = np.maximum(state['best_efficiency'].to_numpy(), 0).astype(float)
+
+    threshold = prepare.top_threshold(result_df['efficiency'].values)
+    result_df['is_top_performer'] = result_df['efficiency'] >= threshold
+    print(f"🌟 Эталонных вакансий отобрано: {result_df['is_top_performer'].sum()}")
+
+    result_df.to_parquet(output_file, index=False)
+    return threshold
+
+
+def run_incremental(rebuild: bool = False, state_file=None, output_file=None,
+                    window_days: int = WINDOW_DAYS) -> dict:
+    state_file = state_file or STATE_FILE
+    output_file = output_file or prepare.OUTPUT_FILE
+
+    state, watermark = (None, None) if rebuild else read_state(state_file)
+    print(f"🔁 Инкрементальный пересчет, водяной знак: {watermark or 'нет (полная сборка)'}")
+
+    new_df = read_new_rows(watermark)
+    if new_df is None:
+        print(f"❌ Не найдены ни {prepare.RAW_DIR}, ни {prepare.RAW_FILE}!")
+        return {}
+    print(f"📦 Новых строк: {len(new_df)}, затронуто вакансий: {new_df['vacancy_id'].nunique()}")
+
+    if len(new_df) == 0 and state is not None:
+        print("✅ Новых данных нет, состояние актуально")
+        return {"new_rows": 0, "vacancies": state.num_rows, "watermark": watermark}
+
+    state = update_state(state, new_df, window_days)
+    new_watermark = new_df['loaded_at'].max()
+    if watermark is not None:
+        new_watermark = max(watermark, new_watermark)
+    write_state(state, new_watermark, state_file)
+    print(f"🆔 Вакансий в состоянии: {state.num_rows}")
+
+    print(f"💾 Сохранение в Parquet...")
+    write_processed(state, output_file)
+    print(f"✅ Успешно! Файл готов: {output_file}")
+    return {"new_rows": len(new_df), "vacancies": state.num_rows, "watermark": new_watermark}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Инкрементальный пересчет эффективности")
+    parser.add_argument("--rebuild", action="store_true", help="Игнорировать состояние и пересобрать по всей истории")
+    args = parser.parse_args()
+    run_incremental(rebuild=args.rebuild)
@@ -1,7 +1,15 @@
 import os
 import sys
+import json
+import argparse
+import datetime
+import decimal
+import threading
 import pandas as pd
-from sqlalchemy import create_engine, text
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import create_engine, inspect, text
 from dotenv import load_dotenv
 from pathlib import Path
 from tqdm import tqdm
@@ -10,68 +18,243 @@ from tqdm import tqdm
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
-OUTPUT_FILE = DATA_DIR / "fact_vacancies_raw.csv"
+# Выгрузка разбита на партиции по дням loaded_at: data/fact_vacancies_raw/part-YYYY-MM-DD.parquet
+OUTPUT_DIR = DATA_DIR / "fact_vacancies_raw"
+MANIFEST_NAME = "_manifest.json"
+# Партиция для строк без loaded_at
+NULL_PARTITION = "null"
+
+# Parquet: zstd + статистики min/max по row group'ам (для фильтров при чтении)
+PARQUET_COMPRESSION = "zstd"
+ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "50000"))
 
 # --- 2. Загрузка конфига ---
 dotenv_path = BASE_DIR / ".env"
 load_dotenv(dotenv_path)
 
 
-def load_data():
-    print("--- 🚀 Старт загрузки (Режим стриминга) ---")
+class ExportManifest:
+    """
+    Чекпоинт выгрузки: какие партиции уже записаны и сколько в них строк.
+    Обновляется после каждой партиции, на диск пишется атомарно (tmp + os.replace),
+    поэтому упавшая выгрузка продолжается с того места, где остановилась.
+    """
 
-    db_dsn = os.getenv("DB_DSN")
-    table_name = os.getenv("DB_TABLE_NAME", "fact_vacancies_cleaned")
+    def __init__(self, path: Path, table_name: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {"table": table_name, "partitions": {}}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("table") == table_name:
+                self.data = saved
+
+    def is_done(self, partition: str, out_dir: Path) -> bool:
+        info = self.data["partitions"].get(partition)
+        if info is None:
+            return False
+        # Для пустого дня файла нет
+        return info["file"] is None or (out_dir / info["file"]).exists()
+
+    def last_day(self):
+        """Самый свежий выгруженный день: на момент выгрузки он мог еще заполняться"""
+        days = [p for p in self.data["partitions"] if p != NULL_PARTITION]
+        return max(days) if days else None
+
+    def mark_done(self, partition: str, file_name, rows: int):
+        with self.lock:
+            self.data["partitions"][partition] = {"file": file_name, "rows": rows}
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def plan_partitions(engine, table_name: str) -> list:
+    """Список партиций (день, следующий день) от первого до последнего loaded_at"""
+    with engine.connect() as conn:
+        row = conn.execute(text(f"SELECT MIN(loaded_at), MAX(loaded_at) FROM {table_name}")).one()
+        has_nulls = conn.execute(
+            text(f"SELECT COUNT(*) FROM {table_name} WHERE loaded_at IS NULL")
+        ).scalar() > 0
+
+    partitions = []
+    if row[0] is not None:
+        days = pd.date_range(pd.Timestamp(row[0]).normalize(), pd.Timestamp(row[1]).normalize(), freq="D")
+        partitions = [(d.strftime("%Y-%m-%d"), (d + pd.Timedelta(days=1)).strftime("%Y-%m-%d")) for d in days]
+    if has_nulls:
+        partitions.append((NULL_PARTITION, None))
+    return partitions
+
+
+# Python-тип колонки SQLAlchemy -> тип Arrow (остальное пишется строкой)
+ARROW_TYPES = {
+    bool: pa.bool_(),
+    int: pa.int64(),
+    float: pa.float64(),
+    decimal.Decimal: pa.float64(),
+    datetime.date: pa.date32(),
+    bytes: pa.binary(),
+}
+
+
+def _arrow_type(name: str, sql_type) -> pa.DataType:
+    try:
+        python_type = sql_type.python_type
+    except NotImplementedError:
+        python_type = str
+    if python_type is datetime.datetime or name == "loaded_at":
+        # loaded_at — всегда timestamp, даже если в источнике хранится строкой
+        return pa.timestamp("ns", tz="UTC" if getattr(sql_type, "timezone", False) else None)
+    return ARROW_TYPES.get(python_type, pa.string())
 
-    if not db_dsn:
-        print("❌ ОШИБКА: DB_DSN не найден в .env")
-        sys.exit(1)
+
+def table_schema(engine, table_name: str) -> pa.Schema:
+    """
+    Одна Arrow-схема для всех партиций — по типам колонок таблицы в БД.
+    По самим данным тип выводить нельзя: в одном дне колонка целиком NULL,
+    в другом целые числа с пропусками приходят из pandas как float.
+    """
+    columns = inspect(engine).get_columns(table_name)
+    return pa.schema([pa.field(c["name"], _arrow_type(c["name"], c["type"])) for c in columns])
+
+
+def _to_arrow(chunk: pd.DataFrame, schema: pa.Schema = None) -> pa.Table:
+    """Чанк из БД -> типизированная Arrow-таблица (в заданной схеме, если она есть)"""
+    if "loaded_at" in chunk.columns:
+        chunk["loaded_at"] = pd.to_datetime(chunk["loaded_at"])
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    if schema is not None:
+        return table.select(schema.names).cast(schema)
+    # Колонка целиком из NULL не должна зафиксировать тип null для всего файла
+    schema = pa.schema([
+        pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in table.schema
+    ])
+    return table.cast(schema)
+
+
+def write_parquet(chunks, path: Path, row_group_size: int = None, schema: pa.Schema = None) -> int:
+    """
+    Пишет поток чанков в один Parquet-файл. Мелкие чанки из БД копятся
+    до row_group_size строк, чтобы row group'ы были крупными. schema — общая схема
+    (table_schema), без нее типы берутся из первого чанка. Возвращает число строк.
+    """
+    row_group_size = row_group_size or ROW_GROUP_SIZE
+    writer = None
+    buffer, rows = [], 0
 
     try:
-        # Создаем engine
-        engine = create_engine(db_dsn)
+        for chunk in chunks:
+            table = _to_arrow(chunk, schema)
+            if writer is None:
+                writer = pq.ParquetWriter(
+                    path, schema or table.schema, compression=PARQUET_COMPRESSION, write_statistics=True
+                )
+            buffer.append(table.cast(writer.schema))
+            rows += len(table)
+            if sum(len(t) for t in buffer) >= row_group_size:
+                pending = pa.concat_tables(buffer)
+                full = len(pending) - len(pending) % row_group_size
+                writer.write_table(pending.slice(0, full), row_group_size=row_group_size)
+                buffer = [pending.slice(full)]
+        if sum(len(t) for t in buffer):
+            writer.write_table(pa.concat_tables(buffer), row_group_size=row_group_size)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_partition(engine, table_name: str, day: str, next_day: str, out_dir: Path,
+                     chunk_size: int = 2000, schema: pa.Schema = None) -> int:
+    """Выгружает одну партицию во временный файл и атомарно переименовывает его"""
+    file_path = out_dir / f"part-{day}.parquet"
+    tmp_path = out_dir / f"part-{day}.parquet.tmp"
+
+    if day == NULL_PARTITION:
+        query, params = text(f"SELECT * FROM {table_name} WHERE loaded_at IS NULL"), {}
+    else:
+        query = text(f"SELECT * FROM {table_name} WHERE loaded_at >= :start AND loaded_at < :end")
+        params = {"start": day, "end": next_day}
+
+    # stream_results=True ОБЯЗАТЕЛЕН, чтобы не грузить память
+    with engine.connect().execution_options(stream_results=True) as conn:
+        chunks = pd.read_sql(query, conn, params=params, chunksize=chunk_size)
+        rows = write_parquet(chunks, tmp_path, schema=schema)
 
-        # 1. Считаем количество (быстрое соединение)
-        print("1️⃣  Считаем количество строк...")
-        with engine.connect() as conn:
-            count_query = text(f"SELECT COUNT(*) FROM {table_name}")
-            total_rows = conn.execute(count_query).scalar()
+    # Пустой день: файла нет, в чекпоинте отмечается с file=None
+    if rows > 0:
+        os.replace(tmp_path, file_path)
+    elif tmp_path.exists():
+        tmp_path.unlink()
+    return rows
 
-        print(f"📊 Всего строк: {total_rows}")
 
-        # 2. Настраиваем потоковую выгрузку
-        # stream_results=True ОБЯЗАТЕЛЕН, чтобы не грузить память
-        conn = engine.connect().execution_options(stream_results=True)
+def export_table(engine, table_name: str, out_dir: Path, workers: int = 4,
+                 chunk_size: int = 2000, fresh: bool = False) -> int:
+    """Параллельная выгрузка таблицы по дням с продолжением после сбоя"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_NAME
+    if fresh and manifest_path.exists():
+        manifest_path.unlink()
+    manifest = ExportManifest(manifest_path, table_name)
 
-        chunk_size = 2000
+    partitions = plan_partitions(engine, table_name)
+    schema = table_schema(engine, table_name)
+    # Последний выгруженный день и строки без loaded_at перевыгружаются всегда: новые строки
+    # в них после прошлой выгрузки иначе не попадут ни в партицию, ни в инкрементальный пересчет
+    refresh = {manifest.last_day(), NULL_PARTITION}
+    todo = [
+        (day, nxt) for day, nxt in partitions
+        if day in refresh or not manifest.is_done(day, out_dir)
+    ]
+    print(f"📅 Партиций: {len(partitions)}, уже выгружено: {len(partitions) - len(todo)}")
 
-        print(f"2️⃣  Начинаю скачивание (по {chunk_size} строк)...")
-        print("    Если сейчас не пойдет — значит интернет совсем плохой.")
+    total_rows = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(export_partition, engine, table_name, day, nxt, out_dir, chunk_size, schema): day
+            for day, nxt in todo
+        }
+        with tqdm(total=len(futures), unit="day", desc="Скачивание") as pbar:
+            for future in as_completed(futures):
+                day = futures[future]
+                rows = future.result()
+                manifest.mark_done(day, f"part-{day}.parquet" if rows else None, rows)
+                total_rows += rows
+                pbar.update(1)
+    return total_rows
 
-        # Передаем conn (соединение), а не engine
-        chunks = pd.read_sql(
-            text(f"SELECT * FROM {table_name}"),
-            conn,
-            chunksize=chunk_size
-        )
 
-        with tqdm(total=total_rows, unit="row", desc="Скачивание") as pbar:
-            for i, chunk in enumerate(chunks):
-                mode = 'w' if i == 0 else 'a'
-                header = (i == 0)
+def load_data(workers: int = 4, fresh: bool = False):
+    print("--- 🚀 Старт загрузки (параллельно по дням) ---")
 
-                chunk.to_csv(OUTPUT_FILE, mode=mode, index=False, header=header)
-                pbar.update(len(chunk))
+    db_dsn = os.getenv("DB_DSN")
+    table_name = os.getenv("DB_TABLE_NAME", "fact_vacancies_cleaned")
+
+    if not db_dsn:
+        print("❌ ОШИБКА: DB_DSN не найден в .env")
+        sys.exit(1)
+
+    try:
+        # Пул соединений: по одному на воркер
+        engine = create_engine(db_dsn, pool_size=workers, max_overflow=0, pool_pre_ping=True)
 
-        # Не забываем закрыть соединение
-        conn.close()
-        print(f"\n✅ Готово! Файл сохранен: {OUTPUT_FILE}")
+        print(f"2️⃣  Начинаю скачивание в {workers} потоков...")
+        rows = export_table(engine, table_name, OUTPUT_DIR, workers=workers, fresh=fresh)
+        print(f"\n✅ Готово! Скачано строк: {rows}. Партиции: {OUTPUT_DIR}")
 
     except KeyboardInterrupt:
-        print("\n🛑 Прервано пользователем.")
+        print("\n🛑 Прервано пользователем. Повторный запуск продолжит с места остановки.")
     except Exception as e:
         print(f"\n❌ ОШИБКА: {e}")
+        print("   Повторный запуск продолжит с места остановки.")
 
 
 if __name__ == "__main__":
-    load_data()
+    parser = argparse.ArgumentParser(description="Выгрузка fact_vacancies из БД")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("EXPORT_WORKERS", "4")))
+    parser.add_argument("--fresh", action="store_true", help="Игнорировать чекпоинт и выгрузить все заново")
+    args = parser.parse_args()
+    load_data(workers=args.workers, fresh=args.fresh)
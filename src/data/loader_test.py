@@ -10,9 +10,13 @@ from tqdm import tqdm
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 DATA_DIR = BASE_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
+sys.path.append(str(BASE_DIR))
+
+# Тот же формат, что и у основной выгрузки (loader.py)
+from src.data.loader import table_schema, write_parquet
 
 # Имя итогового файла
-OUTPUT_FILE = DATA_DIR / "fact_vacancies_test.csv"
+OUTPUT_FILE = DATA_DIR / "fact_vacancies_test.parquet"
 
 # --- 2. Загрузка конфига ---
 dotenv_path = BASE_DIR / ".env"
@@ -61,13 +65,13 @@ def load_test_data():
             chunksize=chunk_size
         )
 
-        with tqdm(total=total_rows, unit="row", desc="Скачивание") as pbar:
-            for i, chunk in enumerate(chunks):
-                mode = 'w' if i == 0 else 'a'
-                header = (i == 0)
+        def progress(chunks):
+            with tqdm(total=total_rows, unit="row", desc="Скачивание") as pbar:
+                for chunk in chunks:
+                    pbar.update(len(chunk))
+                    yield chunk
 
-                chunk.to_csv(OUTPUT_FILE, mode=mode, index=False, header=header)
-                pbar.update(len(chunk))
+        write_parquet(progress(chunks), OUTPUT_FILE, schema=table_schema(engine, table_name))
 
         conn.close()
         print(f"\n✅ Успешно! Тестовый файл сохранен: {OUTPUT_FILE}")
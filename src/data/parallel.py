@@ -0,0 +1,171 @@
+"""
+Многопроцессный расчет эффективности (prepare.py --workers N).
+
+Строки группируются по vacancy_id, затем режутся на N непрерывных шардов
+примерно равного размера (граница шарда всегда между вакансиями).
+Числовые массивы (код вакансии, loaded_at, отклики) кладутся в shared memory
+один раз: воркеры берут свой срез без копирования и пиклинга DataFrame,
+а обратно отдают только результат по своим вакансиям. Шарды склеиваются
+в порядке кодов, поэтому результат совпадает с однопроцессным.
+
+Замер масштабирования: python -m src.data.parallel --workers 8 [--synthetic 2000000]
+"""
+import argparse
+import sys
+import time
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from src.data.prepare import calculate_peak_efficiency_batch
+
+
+class SharedArrays:
+    """Набор numpy-массивов в shared memory; descriptors() передается воркерам"""
+
+    def __init__(self, **arrays):
+        self.blocks = {}
+        self.meta = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+            self.blocks[key] = shm
+            self.meta[key] = (shm.name, array.shape, array.dtype.str)
+
+    def descriptors(self) -> dict:
+        return dict(self.meta)
+
+    def close(self):
+        for shm in self.blocks.values():
+            shm.close()
+            shm.unlink()
+
+
+def _efficiency_shard(descriptors: dict, start: int, end: int, window_days: int):
+    """Воркер: расчет по строкам [start, end) общих массивов"""
+    blocks = {key: SharedMemory(name=name) for key, (name, _, _) in descriptors.items()}
+    try:
+        arrays = {
+            key: np.ndarray(shape, dtype=dtype, buffer=blocks[key].buf)[start:end]
+            for key, (_, shape, dtype) in descriptors.items()
+        }
+        codes, efficiency, last_idx, _ = calculate_peak_efficiency_batch(
+            arrays['codes'], arrays['dates_ns'].view('datetime64[ns]'), arrays['responses'], window_days
+        )
+        # Срезы ссылаются на буферы shared memory — отпускаем до close()
+        del arrays
+        return codes, efficiency, last_idx + start
+    finally:
+        for shm in blocks.values():
+            shm.close()
+
+
+def shard_bounds(codes_sorted: np.ndarray, n_shards: int) -> list:
+    """Границы [start, end) шардов примерно равного числа строк, не разрезая вакансии"""
+    n = len(codes_sorted)
+    seg_starts = np.flatnonzero(np.r_[True, codes_sorted[1:] != codes_sorted[:-1]]) if n else np.zeros(0, int)
+    targets = np.linspace(0, n, n_shards + 1)[1:-1]
+    cuts = seg_starts[np.minimum(np.searchsorted(seg_starts, targets), len(seg_starts) - 1)] if n else []
+    edges = np.unique(np.r_[0, cuts, n]).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def _run_shards(pool: ProcessPoolExecutor, shared: SharedArrays, bounds: list, window_days: int) -> list:
+    futures = [
+        pool.submit(_efficiency_shard, shared.descriptors(), start, end, window_days)
+        for start, end in bounds
+    ]
+    # Склейка в порядке шардов = в порядке кодов, независимо от того, кто закончил первым
+    return [f.result() for f in futures]
+
+
+def parallel_peak_efficiency(vacancy_ids, dates, responses, workers: int, window_days: int = 7,
+                             pool: ProcessPoolExecutor = None):
+    """
+    То же, что calculate_peak_efficiency_batch, но на пуле процессов.
+    pool — готовый пул (при многократных вызовах, например по партициям chunked),
+    без него пул создается на один вызов. Возвращает (uniq_ids, efficiency, last_idx).
+    """
+    codes, uniq_ids = pd.factorize(np.asarray(vacancy_ids), sort=True)
+    dates_ns = np.asarray(dates).astype('datetime64[ns]').astype(np.int64)
+    responses = np.asarray(responses).astype(np.int64)
+
+    # Стабильная группировка: внутри вакансии сохраняется исходный порядок строк
+    group_order = np.argsort(codes, kind='stable')
+    codes_sorted = codes[group_order].astype(np.int64)
+    shared = SharedArrays(
+        codes=codes_sorted, dates_ns=dates_ns[group_order], responses=responses[group_order]
+    )
+    try:
+        bounds = shard_bounds(codes_sorted, workers)
+        if pool is not None:
+            results = _run_shards(pool, shared, bounds, window_days)
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, max(len(bounds), 1))) as own_pool:
+                results = _run_shards(own_pool, shared, bounds, window_days)
+    finally:
+        shared.close()
+
+    if not results:
+        return np.asarray(uniq_ids), np.zeros(0), np.zeros(0, dtype=np.int64)
+    efficiency = np.concatenate([r[1] for r in results])
+    last_idx = group_order[np.concatenate([r[2] for r in results])]
+    return np.asarray(uniq_ids), efficiency, last_idx
+
+
+def scaling_report(vacancy_ids, dates, responses, worker_counts: list) -> list:
+    """Время, ускорение и эффективность масштабирования (ускорение / число воркеров)"""
+    start = time.perf_counter()
+    calculate_peak_efficiency_batch(vacancy_ids, dates, responses)
+    serial = time.perf_counter() - start
+    print(f"   workers=1 (без пула): {serial:.2f} c")
+
+    report = []
+    for workers in worker_counts:
+        start = time.perf_counter()
+        parallel_peak_efficiency(vacancy_ids, dates, responses, workers)
+        elapsed = time.perf_counter() - start
+        speedup = serial / elapsed
+        report.append({"workers": workers, "seconds": elapsed,
+                       "speedup": speedup, "scaling_efficiency": speedup / workers})
+        print(f"   workers={workers}: {elapsed:.2f} c, ускорение x{speedup:.2f}, "
+              f"эффективность {speedup / workers:.0%}")
+    return report
+
+
+def synthetic_history(n_rows: int, n_vacancies: int = None, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n_vacancies = n_vacancies or max(n_rows // 20, 1)
+    ids = rng.integers(0, n_vacancies, n_rows).astype(str)
+    dates = np.datetime64('2024-01-01') + rng.integers(0, 90 * 86_400, n_rows).astype('timedelta64[s]')
+    responses = rng.integers(0, 500, n_rows)
+    return ids, dates, responses
+
+
+if __name__ == "__main__":
+    from src.data import prepare
+
+    parser = argparse.ArgumentParser(description="Масштабирование расчета эффективности по процессам")
+    parser.add_argument("--workers", type=int, default=8, help="Максимальное число воркеров")
+    parser.add_argument("--synthetic", type=int, default=0, help="Синтетическая история из N строк вместо data/")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        ids, dates, responses = synthetic_history(args.synthetic)
+    else:
+        df = prepare.load_raw()
+        if df is None:
+            print("❌ Нет сырых данных, используйте --synthetic N")
+            sys.exit(1)
+        df = prepare.cast_raw_types(df)
+        ids, dates, responses = df['vacancy_id'].values, df['loaded_at'].values, df['total_responses'].values
+
+    counts = sorted({w for w in [2 ** i for i in range(args.workers.bit_length())] + [args.workers] if w >= 1})
+    print(f"📈 Масштабирование на {len(ids)} строках:")
+    scaling_report(ids, dates, responses, counts)
@@ -1,7 +1,9 @@
+import argparse
 import pandas as pd
 import numpy as np
 import pathlib
-from tqdm import tqdm  # Нужна библиотека tqdm для прогресс-бара
+import pyarrow as pa
+import pyarrow.dataset as ds
 
 # --- НАСТРОЙКА ПУТЕЙ ---
 CURRENT_DIR = pathlib.Path(__file__).resolve().parent
@@ -10,6 +12,8 @@ DATA_DIR = ROOT_DIR / "data"
 
 # Переключаемся на БОЛЬШОЙ файл
 RAW_FILE = DATA_DIR / "fact_vacancies_raw.csv"
+# Партиционированная выгрузка из loader.py (part-YYYY-MM-DD.parquet), приоритетнее RAW_FILE
+RAW_DIR = DATA_DIR / "fact_vacancies_raw"
 OUTPUT_FILE = DATA_DIR / "vacancies_processed.parquet"
 
 # Колонки, которые нам реально нужны (чтобы экономить память)
@@ -74,86 +78,184 @@ def calculate_peak_efficiency(dates, responses, window_days=7):
     return float(best_eff)
 
 
-def main():
-    print(f"🚀 Рабочая директория: {ROOT_DIR}")
-    print(f"📂 Загрузка большого файла: {RAW_FILE.name}...")
+def window_efficiency_sorted(seg, dates_ns, resp, window_days=7):
+    """
+    Эффективность окна, начинающегося в каждой строке.
+    Массивы уже отсортированы по (сегмент, время); seg — номер вакансии.
+    """
+    n = len(seg)
 
-    if not RAW_FILE.exists():
-        print(f"❌ Файл {RAW_FILE} не найден!")
-        return
+    # Сегментный поиск конца окна.
+    # Время переводим в ранги, чтобы ключ (сегмент, ранг) влез в int64 без переполнения
+    window_ns = np.timedelta64(window_days, 'D').astype('timedelta64[ns]').astype(np.int64)
+    uniq_times, rank = np.unique(dates_ns, return_inverse=True)
+    end_rank = np.searchsorted(uniq_times, dates_ns + window_ns, side='right') - 1
+    n_ranks = len(uniq_times)
+    key = seg.astype(np.int64) * n_ranks + rank
+    end_idx = np.searchsorted(key, seg.astype(np.int64) * n_ranks + end_rank, side='right') - 1
+
+    # "Первый ненулевой в окне": для каждой позиции ближайший справа индекс с откликами > 0.
+    # Обратный кумулятивный минимум по индексам ненулевых значений.
+    nonzero_pos = np.where(resp > 0, np.arange(n), n)
+    next_nonzero = np.minimum.accumulate(nonzero_pos[::-1])[::-1]
+
+    # Если val_start > 0, то next_nonzero == i, и формула совпадает с val_end - val_start
+    has_nonzero = (next_nonzero <= end_idx) & (end_idx > np.arange(n))
+    first_val = resp[np.minimum(next_nonzero, n - 1)]
+    return np.where(has_nonzero, resp[end_idx] - first_val, 0)
+
+
+def calculate_peak_efficiency_batch(vacancy_ids, dates, responses, window_days=7):
+    """
+    Векторизованный расчет эффективности сразу для всех вакансий.
+    Дает те же значения, что и calculate_peak_efficiency по каждой группе.
+
+    Возвращает (uniq_ids, efficiency, last_idx, order):
+    last_idx — позиция самой свежей записи каждой вакансии в исходных массивах.
+    """
+    vacancy_ids = np.asarray(vacancy_ids)
+    dates_ns = np.asarray(dates).astype('datetime64[ns]').astype(np.int64)
+    responses = np.asarray(responses)
 
-    # 1. Загружаем только нужные колонки
+    # 1. Один глобальный сорт по (vacancy_id, loaded_at)
+    uniq_ids, seg = np.unique(vacancy_ids, return_inverse=True)
+    order = np.lexsort((dates_ns, seg))
+    seg = seg[order]
+    dates_ns = dates_ns[order]
+    resp = responses[order]
+    n = len(order)
+
+    if n == 0:
+        return uniq_ids, np.zeros(0), np.zeros(0, dtype=np.int64), order
+
+    seg_starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+    seg_ends = np.r_[seg_starts[1:], n] - 1
+
+    # 2. Эффективность окна от каждой строки
+    current_eff = window_efficiency_sorted(seg, dates_ns, resp, window_days)
+
+    # 3. Максимум по сегменту (не меньше нуля, как best_eff = 0.0 в исходной версии)
+    best = np.maximum.reduceat(current_eff, seg_starts)
+    efficiency = np.maximum(best, 0).astype(float)
+
+    return uniq_ids, efficiency, order[seg_ends], order
+
+
+def read_raw_csv(path) -> pd.DataFrame:
     try:
-        df = pd.read_csv(
-            RAW_FILE,
+        return pd.read_csv(
+            path,
             usecols=lambda c: c in REQUIRED_COLS,  # Грузим только то, что есть в списке
             low_memory=False
         )
     except ValueError as e:
         # Если вдруг названия колонок отличаются (например нет profile), пробуем загрузить всё
         print(f"⚠️ Ошибка фильтрации колонок ({e}), пробуем загрузить всё...")
-        df = pd.read_csv(RAW_FILE, low_memory=False)
-
-    print(f"📦 Загружено строк: {len(df)}")
+        return pd.read_csv(path, low_memory=False)
 
-    # Приводим типы
-    df['loaded_at'] = pd.to_datetime(df['loaded_at'])
-    df['total_responses'] = df['total_responses'].fillna(0).astype(int)
-    # Приводим ID к строке, чтобы избежать путаницы int/str
-    df['vacancy_id'] = df['vacancy_id'].astype(str)
 
-    print("⏳ Группировка данных по вакансиям...")
-    grouped = df.groupby('vacancy_id')
-    unique_vacancies = len(grouped)
-    print(f"🆔 Уникальных вакансий: {unique_vacancies}")
+def since_filter(dataset, since):
+    """Фильтр loaded_at >= since в типе колонки датасета (None — без фильтра)"""
+    if since is None:
+        return None
+    loaded_at_type = dataset.schema.field("loaded_at").type
+    return ds.field("loaded_at") >= pa.scalar(pd.Timestamp(since).to_pydatetime(), type=loaded_at_type)
 
-    print("🧠 Расчет пиковой эффективности (это займет время)...")
 
-    results = []
+def read_raw_parquet(parts: list, since=None) -> pd.DataFrame:
+    """
+    Читает только REQUIRED_COLS. Фильтр по loaded_at уходит в сканер:
+    row group'ы, у которых max(loaded_at) < since, не читаются вовсе.
+    """
+    dataset = ds.dataset([str(p) for p in parts], format="parquet")
+    columns = [c for c in REQUIRED_COLS if c in dataset.schema.names]
+    return dataset.to_table(columns=columns, filter=since_filter(dataset, since)).to_pandas()
 
-    # Используем tqdm для отображения прогресс-бара
-    for vac_id, group in tqdm(grouped, total=unique_vacancies, unit="vac"):
-        # Сортировка обязательна для логики окна
-        group = group.sort_values('loaded_at')
 
-        # Извлекаем numpy массивы для скорости
-        dates = group['loaded_at'].values
-        responses = group['total_responses'].values
+def raw_parts() -> list:
+    return sorted(RAW_DIR.glob("part-*.parquet")) if RAW_DIR.exists() else []
 
-        eff = calculate_peak_efficiency(dates, responses)
 
-        # Сохраняем "свежайшую" версию описания
-        # (iloc[-1] берет последнюю запись по времени)
-        best_row = group.iloc[-1].to_dict()
-        best_row['efficiency'] = eff
+def load_raw(since=None):
+    """Читает партиции из RAW_DIR, а если их нет — единый RAW_FILE"""
+    parts = raw_parts()
+    if parts:
+        return read_raw_parquet(parts, since)
+    if RAW_FILE.exists():
+        df = read_raw_csv(RAW_FILE)
+        if since is not None:
+            df = df[pd.to_datetime(df['loaded_at']) >= pd.Timestamp(since)]
+        return df
+    return None
 
-        # Удаляем лишнее из словаря, чтобы не дублировать память
-        # (loaded_at и total_responses нам в RAG уже не нужны, нужна только метрика)
-        del best_row['loaded_at']
-        del best_row['total_responses']
 
-        results.append(best_row)
+def cast_raw_types(df: pd.DataFrame) -> pd.DataFrame:
+    df['loaded_at'] = pd.to_datetime(df['loaded_at'])
+    df['total_responses'] = df['total_responses'].fillna(0).astype(int)
+    # Приводим ID к строке, чтобы избежать путаницы int/str
+    df['vacancy_id'] = df['vacancy_id'].astype(str)
+    return df
 
-    result_df = pd.DataFrame(results)
 
-    # Аналитика по метрике
-    max_eff = result_df['efficiency'].max()
-    avg_eff = result_df['efficiency'].mean()
+def compute_efficiency(df: pd.DataFrame, workers: int = 1, pool=None) -> pd.DataFrame:
+    """
+    Одна строка на вакансию: самая свежая версия описания + efficiency.
+    pool — общий пул процессов для многократных вызовов (при workers > 1)
+    """
+    args = (df['vacancy_id'].values, df['loaded_at'].values, df['total_responses'].values)
+    if workers > 1:
+        from src.data.parallel import parallel_peak_efficiency
+        uniq_ids, efficiency, last_idx = parallel_peak_efficiency(*args, workers=workers, pool=pool)
+    else:
+        uniq_ids, efficiency, last_idx, _ = calculate_peak_efficiency_batch(*args)
+    # Сохраняем "свежайшую" версию описания (последняя запись по времени).
+    # loaded_at и total_responses нам в RAG уже не нужны, нужна только метрика
+    result_df = df.iloc[last_idx].drop(columns=['loaded_at', 'total_responses']).reset_index(drop=True)
+    result_df['efficiency'] = efficiency
+    return result_df
+
+
+def top_threshold(efficiency: np.ndarray) -> float:
+    """Печатает статистику и возвращает порог Top-20%"""
+    efficiency = pd.Series(efficiency, dtype=float)
+    max_eff = efficiency.max()
+    avg_eff = efficiency.mean()
     print(f"\n📊 Статистика эффективности:")
     print(f"   Максимум: {max_eff:.1f} откликов/неделю")
     print(f"   Среднее:  {avg_eff:.1f} откликов/неделю")
 
     # Топ перформеры (Top 20%)
     # Если данных мало или все нули, берем хотя бы > 0
-    threshold = result_df['efficiency'].quantile(0.8)
+    threshold = efficiency.quantile(0.8)
     if threshold == 0 and max_eff > 0:
         print("⚠️ 80-й перцентиль равен 0. Будем считать топами всех, у кого > 0.")
         threshold = 1.0
+    print(f"🏆 Порог Top-20%: {threshold:.1f}")
+    return threshold
 
+
+def main(since=None, workers: int = 1):
+    print(f"🚀 Рабочая директория: {ROOT_DIR}")
+    print(f"📂 Загрузка сырых данных: {RAW_DIR.name if RAW_DIR.exists() else RAW_FILE.name}...")
+
+    df = load_raw(since)
+    if df is None:
+        print(f"❌ Не найдены ни {RAW_DIR}, ни {RAW_FILE}!")
+        return
+
+    print(f"📦 Загружено строк: {len(df)}")
+
+    # Приводим типы
+    df = cast_raw_types(df)
+
+    print(f"🧠 Расчет пиковой эффективности (векторизованно, процессов: {workers})...")
+    result_df = compute_efficiency(df, workers)
+    print(f"🆔 Уникальных вакансий: {len(result_df)}")
+
+    threshold = top_threshold(result_df['efficiency'].values)
     result_df['is_top_performer'] = result_df['efficiency'] >= threshold
 
     top_count = result_df['is_top_performer'].sum()
-    print(f"🏆 Порог Top-20%: {threshold:.1f}")
     print(f"🌟 Эталонных вакансий отобрано: {top_count}")
 
     # Сохранение
@@ -163,4 +265,17 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Расчет эффективности вакансий")
+    parser.add_argument("--since", default=None, help="Учитывать только историю с этой даты (YYYY-MM-DD)")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="Потоковый режим: обрабатывать данные порциями в пределах бюджета памяти")
+    parser.add_argument("--workers", type=int, default=1, help="Число процессов для расчета эффективности")
+    args = parser.parse_args()
+
+    import sys
+    sys.path.append(str(ROOT_DIR))
+    if args.memory_budget_mb:
+        from src.data.chunked import run_chunked
+        run_chunked(args.memory_budget_mb, since=args.since, workers=args.workers)
+    else:
+        main(since=args.since, workers=args.workers)
@@ -0,0 +1,107 @@
+"""
+Ночной скоринг качества всего корпуса vacancies_processed.parquet.
+
+Файл читается порциями (row group'ами) — в памяти одновременно только
+несколько порций. Каждая порция описаний уходит в пул процессов,
+результат дописывается в sidecar-файл vacancies_quality.parquet
+(vacancy_id + колонки скоринга) в исходном порядке строк.
+
+Запуск: python -m src.data.score [--workers N] [--batch-rows 20000]
+"""
+import argparse
+import os
+import sys
+import time
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from src.common.quality import analyzer
+from src.common.text import heuristic_quality_score
+
+DATA_DIR = ROOT_DIR / "data"
+INPUT_FILE = DATA_DIR / "vacancies_processed.parquet"
+OUTPUT_FILE = DATA_DIR / "vacancies_quality.parquet"
+BATCH_ROWS = 20_000
+
+SCORE_SCHEMA = pa.schema([
+    pa.field("vacancy_id", pa.string()),
+    pa.field("quality_score", pa.int32()),
+    pa.field("quality_issues", pa.list_(pa.string())),
+    pa.field("basic_issues", pa.list_(pa.string())),
+    pa.field("heuristic_score", pa.int32()),
+])
+
+
+def score_texts(texts: list) -> dict:
+    """Скоринг порции описаний: колонки для SCORE_SCHEMA (без vacancy_id)"""
+    columns = {"quality_score": [], "quality_issues": [], "basic_issues": [], "heuristic_score": []}
+    for text in texts:
+        text = text or ""
+        result = analyzer.evaluate(text)
+        columns["quality_score"].append(result["quality"]["score"])
+        columns["quality_issues"].append(result["quality"]["issues"])
+        columns["basic_issues"].append(result["basic_issues"])
+        columns["heuristic_score"].append(heuristic_quality_score(text, result["basic_issues"]))
+    return columns
+
+
+def _to_table(ids: list, columns: dict) -> pa.Table:
+    return pa.Table.from_pydict({"vacancy_id": ids, **columns}, schema=SCORE_SCHEMA)
+
+
+def score_corpus(input_file=None, output_file=None, workers: int = None, batch_rows: int = BATCH_ROWS) -> dict:
+    input_file = pathlib.Path(input_file or INPUT_FILE)
+    output_file = pathlib.Path(output_file or OUTPUT_FILE)
+    workers = workers or os.cpu_count() or 1
+
+    source = pq.ParquetFile(input_file)
+    total = source.metadata.num_rows
+    print(f"📂 {input_file.name}: {total} вакансий, {source.metadata.num_row_groups} row group'ов, процессов: {workers}")
+
+    batches = source.iter_batches(batch_size=batch_rows, columns=["vacancy_id", "vacancy_description"])
+    tmp_path = output_file.with_suffix(".tmp")
+    rows = 0
+    start = time.perf_counter()
+
+    with pq.ParquetWriter(tmp_path, SCORE_SCHEMA) as writer:
+        if workers == 1:
+            for batch in batches:
+                writer.write_table(_to_table(batch["vacancy_id"].to_pylist(),
+                                             score_texts(batch["vacancy_description"].to_pylist())))
+                rows += batch.num_rows
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Не больше 2 порций на воркер в полете: память ограничена, порядок сохраняется
+                in_flight = []
+                for batch in batches:
+                    texts = batch["vacancy_description"].to_pylist()
+                    in_flight.append((batch["vacancy_id"].to_pylist(), pool.submit(score_texts, texts)))
+                    if len(in_flight) >= 2 * workers:
+                        ids, future = in_flight.pop(0)
+                        writer.write_table(_to_table(ids, future.result()))
+                        rows += len(ids)
+                for ids, future in in_flight:
+                    writer.write_table(_to_table(ids, future.result()))
+                    rows += len(ids)
+
+    os.replace(tmp_path, output_file)
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(f"✅ Оценено {rows} вакансий за {elapsed:.1f} c: {rate:.0f} строк/с ({rate * 60:.0f} строк/мин)")
+    print(f"💾 Результат: {output_file}")
+    return {"rows": rows, "seconds": elapsed, "rows_per_second": rate}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скоринг качества всех вакансий корпуса")
+    parser.add_argument("--input", default=str(INPUT_FILE))
+    parser.add_argument("--output", default=str(OUTPUT_FILE))
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию — все ядра)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+    score_corpus(args.input, args.output, workers=args.workers, batch_rows=args.batch_rows)
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import os
 
 # --- 1. Настройка страницы ---
@@ -7,6 +8,24 @@ st.set_page_config(page_title="Job Optimizer MVP", layout="wide", page_icon="
 
 # БЕРЕМ URL ИЗ .ENV ИЛИ ИСПОЛЬЗУЕМ LOCALHOST (если запуск без Docker)
 API_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000/optimize")
+# Потоковая версия эндпоинта (Server-Sent Events)
+STREAM_URL = API_URL.rstrip("/") + "/stream"
+
+
+def iter_sse(response):
+    """Разбирает поток Server-Sent Events на пары (event, data)"""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if line == "":
+            if event and data:
+                yield event, json.loads("\n".join(data))
+            event, data = None, []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
 
 # --- 2. Инициализация полей (Session State) ---
 if 'in_profile' not in st.session_state: st.session_state['in_profile'] = ""
@@ -100,52 +119,68 @@ if submit:
     if not (title and description):
         st.error("⚠️ Заполните хотя бы Заголовок и Описание!")
     else:
-        with st.spinner("🤖 ИИ анализирует рынок и генерирует улучшения..."):
-            payload = {
-                "vacancies": [{
-                    "input_id": "demo_real",
-                    "profile": profile,
-                    "city": city,
-                    "specialization": specialization,
-                    "vacancy_title": title,
-                    "vacancy_description": description
-                }]
-            }
-
-            try:
-                response = requests.post(API_URL, json=payload)
+        payload = {
+            "vacancies": [{
+                "input_id": "demo_real",
+                "profile": profile,
+                "city": city,
+                "specialization": specialization,
+                "vacancy_title": title,
+                "vacancy_description": description
+            }]
+        }
+
+        try:
+            res = None
+            error = None
+            st.caption("🤖 ИИ анализирует рынок и генерирует улучшения...")
+            # Текст показываем по мере генерации, а не после полного ответа
+            live_output = st.empty()
+            generated = ""
+
+            with requests.post(STREAM_URL, json=payload, stream=True, timeout=300) as response:
                 response.raise_for_status()
-                data = response.json()
-
-                if not data["results"]:
-                    st.error("Ответ от сервера пустой.")
-                else:
-                    res = data["results"][0]
-
-                    st.subheader("✅ Результат оптимизации")
-
-                    c_orig, c_new = st.columns(2)
-
-                    with c_orig:
-                        st.info("📄 Было")
-                        st.text_input("Старый Title", title, disabled=True)
-                        st.text_area("Старое Desc", description, height=500, disabled=True)
-
-                    with c_new:
-                        st.success("✨ Стало")
-                        st.text_input("Новый Title", res['vacancy_title'])
-                        st.text_area("Новое Desc", res['vacancy_description'], height=500)
-
-                    with st.expander("💡 Комментарии ИИ (Improvement Notes)", expanded=True):
-                        if res.get('improvement_notes'):
-                            for note in res['improvement_notes']:
-                                st.write(f"- {note}")
-                        else:
-                            st.write("Структура улучшена для повышения читаемости.")
-
-            except Exception as e:
-                st.error(f"❌ Ошибка соединения: {e}")
-                st.warning("Проверьте, запущен ли backend: python -m src.api.main")
+                response.encoding = "utf-8"
+                for event, data in iter_sse(response):
+                    if event == "token":
+                        generated += data["delta"]
+                        live_output.code(generated, language="json")
+                    elif event == "result":
+                        res = data["result"]
+                    elif event == "error":
+                        error = data["error"]
+
+            live_output.empty()
+
+            if error is not None:
+                st.error(f"❌ Ошибка оптимизации: {error}")
+            elif res is None:
+                st.error("Ответ от сервера пустой.")
+            else:
+                st.subheader("✅ Результат оптимизации")
+
+                c_orig, c_new = st.columns(2)
+
+                with c_orig:
+                    st.info("📄 Было")
+                    st.text_input("Старый Title", title, disabled=True)
+                    st.text_area("Старое Desc", description, height=500, disabled=True)
+
+                with c_new:
+                    st.success("✨ Стало")
+                    st.text_input("Новый Title", res['vacancy_title'])
+                    st.text_area("Новое Desc", res['vacancy_description'], height=500)
+
+                with st.expander("💡 Комментарии ИИ (Improvement Notes)", expanded=True):
+                    if res.get('improvement_notes'):
+                        for note in res['improvement_notes']:
+                            st.write(f"- {note}")
+                    else:
+                        st.write("Структура улучшена для повышения читаемости.")
+
+        except Exception as e:
+            st.error(f"❌ Ошибка соединения: {e}")
+            st.warning("Проверьте, запущен ли backend: python -m src.api.main")
 
 else:
     st.info("👈 Выберите шаблон слева (Пятерочка / Магнит) для теста.")
@@ -4,6 +4,7 @@ import html
 import time
 from src.rag.llm import LocalLLM
 from src.api.models import VacancyIn, VacancyOut
+from src.common.quality import analyzer as quality_analyzer
 
 
 class VacancyAdvisor:
@@ -20,63 +21,7 @@ class VacancyAdvisor:
 
     def _analyze_quality(self, text: str) -> Dict:
         """Анализ качества (0-100)"""
-        score = 0
-        issues = []
-        text_lower = text.lower()
-
-        if len(text) < 50:
-            return {"score": 0, "issues": ["Текст отсутствует"]}
-
-        # 1. ОБЪЕМ
-        if len(text) < 300:
-            issues.append("❌ Критически мало текста")
-        elif len(text) > 800:
-            score += 20
-        else:
-            score += 10
-
-        # 2. СТРУКТУРА (Самое важное)
-        blocks_found = 0
-        if "обязанност" in text_lower or "задачи" in text_lower:
-            score += 15;
-            blocks_found += 1
-        else:
-            issues.append("❓ Нет блока 'Обязанности'")
-
-        if "требован" in text_lower or "ищем" in text_lower:
-            score += 15;
-            blocks_found += 1
-        else:
-            issues.append("❓ Нет блока 'Требования'")
-
-        if "условия" in text_lower or "предлагаем" in text_lower:
-            score += 15;
-            blocks_found += 1
-        else:
-            issues.append("❓ Нет блока 'Условия'")
-
-        # БОНУС за полную структуру
-        if blocks_found == 3: score += 10
-
-        # 3. ДЕТАЛИ
-        money_words = ["руб", "₽", "оклад", "доход", "зарплат", "на руки"]
-        if any(w in text_lower for w in money_words):
-            score += 10
-        else:
-            issues.append("💰 Не указана зарплата")
-
-        if any(w in text_lower for w in ["график", "5/2", "2/2", "удален"]):
-            score += 10
-        else:
-            issues.append("📅 Не указан график")
-
-        # 4. ОФОРМЛЕНИЕ
-        if "<ul>" in text or "<li>" in text or "•" in text:
-            score += 10
-        else:
-            issues.append("📄 Нет списков")
-
-        return {"score": min(score, 100), "issues": issues}
+        return quality_analyzer.analyze(text)
 
     def _parse_llm_response(self, raw_text: str, original_title: str) -> Dict:
         """Парсит неструктурированный ответ LLM"""
@@ -0,0 +1,110 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+class MicroBatchEncoder:
+    """
+    Собирает запросы из параллельных потоков в один вызов model.encode.
+
+    Первый пришедший запрос открывает окно max_wait_ms; батч уходит в модель,
+    когда окно закрылось или набралось max_batch_size запросов. Каждый вызывающий
+    получает свой вектор. При max_batch_size <= 1 работает как прямой вызов модели.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="micro-batch-encoder", daemon=True)
+                self._thread.start()
+
+    def encode(self, text: str) -> np.ndarray:
+        if self.max_batch_size <= 1:
+            self._record(1)
+            return self.model.encode([text])[0]
+
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def encode_many(self, texts: list) -> np.ndarray:
+        """
+        Несколько текстов одного вызывающего (search_many). Полный батч уходит в модель
+        сразу; маленький — через общую очередь, чтобы объединиться с параллельными запросами
+        """
+        if self.max_batch_size <= 1 or len(texts) >= self.max_batch_size:
+            vectors = self.model.encode(texts)
+            # В статистике — как ceil(n / max_batch_size) полных батчей очереди: fill_ratio <= 1
+            self._record(len(texts), batches=math.ceil(len(texts) / max(self.max_batch_size, 1)))
+            return vectors
+
+        self._ensure_started()
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future))
+            futures.append(future)
+        return np.stack([future.result() for future in futures])
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Одинаковые запросы внутри батча кодируем один раз
+            unique = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = self.model.encode(unique)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            by_text = dict(zip(unique, vectors))
+            for text, future in batch:
+                future.set_result(by_text[text])
+            self._record(len(batch))
+
+    def _record(self, size: int, batches: int = 1):
+        with self._stats_lock:
+            self.batches += batches
+            self.items += size
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches, items = self.batches, self.items
+        return {
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            # Насколько заполнены батчи относительно max_batch_size
+            "fill_ratio": round(items / (batches * self.max_batch_size), 4) if batches else 0.0,
+        }
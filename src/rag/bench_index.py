@@ -0,0 +1,124 @@
+"""
+Бенчмарк индексов поиска: recall@k приближенного индекса относительно точного,
+задержка одного запроса (p50/p99) и объем сканируемых данных
+(для квантованных sq8/pq — относительно float32-матрицы).
+
+Запуск:
+    python -m src.rag.bench_index --sizes 10000,100000,1000000 --n-probe 4,8,16
+    python -m src.rag.bench_index --vectors data/embeddings.npy  # на реальных векторах
+    python -m src.rag.bench_index --index-dir data/vector_index  # на текущей версии индекса
+"""
+import argparse
+import pathlib
+import sys
+import time
+import numpy as np
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent.parent
+if str(root_dir) not in sys.path:
+    sys.path.append(str(root_dir))
+
+from src.rag.index import create_index
+
+# Размерность rubert-tiny2
+DIM = 312
+
+
+def synthetic_vectors(n: int, dim: int = DIM, n_clusters: int = 500, seed: int = 0) -> np.ndarray:
+    """Кластеризованные векторы: похожи на эмбеддинги вакансий (много близких профессий)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32) * 1.5
+    return centers[labels] + noise
+
+
+def measure(index, queries, k: int):
+    latencies = []
+    found = []
+    for q in queries:
+        t0 = time.perf_counter()
+        _, idx = index.kneighbors(q[None, :], n_neighbors=k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found.append(idx[0])
+    return np.array(found), np.array(latencies)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def report(label: str, index, found, lat, truth, k: int, base_bytes: int):
+    mem = index.memory_bytes()
+    print(f"{label:<22} recall@{k}={recall_at_k(found, truth):.3f}  "
+          f"p50={np.percentile(lat, 50):7.2f}ms  p99={np.percentile(lat, 99):7.2f}ms  "
+          f"mem={mem / 2 ** 20:8.1f}MB (x{base_bytes / mem:.1f} меньше)")
+
+
+def run(vectors: np.ndarray, n_queries: int, k: int, n_probes, n_lists, reranks=(0, 4)):
+    rng = np.random.default_rng(1)
+    # Запросы — зашумленные точки корпуса
+    queries = vectors[rng.choice(len(vectors), n_queries, replace=False)]
+    queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.5
+
+    exact = create_index("exact").fit(vectors)
+    truth, exact_lat = measure(exact, queries, k)
+    base_bytes = exact.memory_bytes()
+    report("exact", exact, truth, exact_lat, truth, k, base_bytes)
+
+    t0 = time.perf_counter()
+    ivf = create_index("ivf", n_lists=n_lists).fit(vectors)
+    print(f"   (ivf build: {time.perf_counter() - t0:.1f}s, lists={len(ivf.centroids)})")
+    for n_probe in n_probes:
+        ivf.n_probe = n_probe
+        found, lat = measure(ivf, queries, k)
+        report(f"ivf n_probe={n_probe}", ivf, found, lat, truth, k, base_bytes)
+
+    # Квантование: сканируются только коды, rerank — точный пересчет rerank*k кандидатов
+    for backend in ("sq8", "pq"):
+        t0 = time.perf_counter()
+        quantized = create_index(backend).fit(vectors)
+        print(f"   ({backend} build: {time.perf_counter() - t0:.1f}s)")
+        for rerank in reranks:
+            quantized.rerank = rerank
+            found, lat = measure(quantized, queries, k)
+            report(f"{backend} rerank={rerank}", quantized, found, lat, truth, k, base_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк индексов VacancyRetriever")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Размеры корпуса через запятую")
+    parser.add_argument("--vectors", default=None, help="Путь к .npy с реальными эмбеддингами")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-probe", default="4,8,16,32")
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--rerank", default="0,4", help="Множители кандидатов для точного переранжирования")
+    parser.add_argument("--index-dir", default=None, help="Каталог индекса: берутся векторы текущей версии")
+    args = parser.parse_args()
+
+    n_probes = [int(x) for x in args.n_probe.split(",")]
+    reranks = [int(x) for x in args.rerank.split(",")]
+
+    if args.index_dir:
+        from src.rag.store import EmbeddingStore, current_version_path
+        path = current_version_path(args.index_dir)
+        vectors = np.asarray(EmbeddingStore(path).vectors)
+        print(f"\n📊 Корпус: {path} ({len(vectors)} векторов)")
+        run(vectors, args.queries, args.k, n_probes, args.n_lists, reranks)
+        return
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+        print(f"\n📊 Корпус: {args.vectors} ({len(vectors)} векторов)")
+        run(vectors, args.queries, args.k, n_probes, args.n_lists, reranks)
+        return
+
+    for size in [int(x) for x in args.sizes.split(",")]:
+        print(f"\n📊 N = {size}")
+        run(synthetic_vectors(size), args.queries, args.k, n_probes, args.n_lists, reranks)
+
+
+if __name__ == "__main__":
+    main()
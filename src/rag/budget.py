@@ -0,0 +1,195 @@
+"""
+Бюджет токенов для запросов к LLM.
+
+Промпт собирается из секций с разным приоритетом:
+  1. шаблон (инструкции, JSON-схема, поля вакансии) — не сокращается, но короткие
+     поля (заголовок, профиль, город, специализация) заранее ограничены FIELD_TOKENS;
+  2. описание вакансии пользователя — при нехватке места сначала сжимается
+     (HTML и лишние пробелы), затем обрезается по токенам;
+  3. референсы — берутся по порядку, пока помещаются.
+
+max_tokens ответа считается от длины описания: короткой вакансии не нужно
+резервировать 2500 токенов, а длинной — не дать упереться в окно контекста.
+
+Токены считает локальный токенизатор модели (transformers.AutoTokenizer).
+Он загружается в фоне (warm_up); пока его нет или он недоступен офлайн,
+используется оценка по длине текста (CHARS_PER_TOKEN).
+"""
+import math
+import os
+import threading
+
+from src.common.text import normalize_text
+
+# Пустая строка — не загружать токенизатор, считать по длине текста
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "Qwen/Qwen2.5-72B-Instruct")
+# Окно контекста модели и потолок входа (задержка и стоимость растут с длиной промпта)
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "32768"))
+LLM_PROMPT_TOKENS = int(os.getenv("LLM_PROMPT_TOKENS", "6000"))
+LLM_MIN_OUTPUT_TOKENS = int(os.getenv("LLM_MIN_OUTPUT_TOKENS", "512"))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "2500"))
+# Потолок одного короткого поля вакансии в промпте (у VacancyIn нет ограничений длины)
+FIELD_TOKENS = int(os.getenv("LLM_FIELD_TOKENS", "64"))
+# Ответ — переписанное описание (с разметкой секций) плюс заголовок, поля и заметки
+OUTPUT_PER_INPUT_TOKEN = 1.5
+OUTPUT_OVERHEAD = 400
+# Оценка без токенизатора: BPE Qwen дает ~2.5-3 символа кириллицы на токен, берем с запасом
+CHARS_PER_TOKEN = 2.5
+# Служебные токены chat-шаблона на одно сообщение (<|im_start|>role ... <|im_end|>)
+MESSAGE_OVERHEAD = 4
+TRUNCATION_MARK = " …"
+
+
+class TokenCounter:
+    """Счетчик токенов: токенизатор модели или оценка по длине текста"""
+
+    def __init__(self, name: str = LLM_TOKENIZER):
+        self.name = name
+        self.tokenizer = None
+        self._attempted = False
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        return self.tokenizer is not None
+
+    def warm_up(self):
+        """Одна попытка загрузки (блокирующая: вызывать в потоке). Ошибка — остаемся на оценке"""
+        with self._lock:
+            if self._attempted or not self.name:
+                return self.tokenizer
+            self._attempted = True
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(self.name)
+                print(f"✅ Токенизатор {self.name} загружен")
+            except Exception as e:
+                print(f"⚠️ Токенизатор {self.name} недоступен, токены оцениваются по длине текста: {e!r}")
+        return self.tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Начало текста не длиннее max_tokens (по границе слова, с пометкой об обрезке)"""
+        if self.count(text) <= max_tokens:
+            return text
+        limit = max_tokens - self.count(TRUNCATION_MARK)
+        if limit <= 0:
+            return ""
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            head = text[:int(limit * CHARS_PER_TOKEN)]
+        else:
+            head = tokenizer.decode(tokenizer.encode(text, add_special_tokens=False)[:limit])
+        # Не рвем слово пополам, если пробел недалеко от конца
+        cut = head.rfind(" ")
+        if cut > len(head) * 0.8:
+            head = head[:cut]
+        return head.rstrip() + TRUNCATION_MARK
+
+
+class PromptBudget:
+    """Раскладка бюджета по секциям промпта и max_tokens ответа"""
+
+    def __init__(self, counter: TokenCounter = None, prompt_tokens: int = LLM_PROMPT_TOKENS,
+                 context_tokens: int = LLM_CONTEXT_TOKENS):
+        self.counter = counter or TokenCounter()
+        self.prompt_tokens = prompt_tokens
+        self.context_tokens = context_tokens
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.trimmed = 0
+        self.total_prompt_tokens = 0
+        self.total_completion_tokens = 0
+
+    def cap_field(self, text: str) -> str:
+        """Короткое поле вакансии (заголовок, город...) не длиннее FIELD_TOKENS"""
+        if self.counter.count(text) <= FIELD_TOKENS:
+            return text
+        return self.counter.truncate(normalize_text(text), FIELD_TOKENS)
+
+    def plan(self, template: list, description: str, references: list) -> dict:
+        """
+        template — тексты сообщений без описания и референсов, references — готовые строки
+        референсов в порядке приоритета. Возвращает описание и референсы, которые уходят
+        в промпт, оценку токенов промпта и max_tokens для ответа.
+        ValueError — если даже без описания и референсов на ответ не остается
+        LLM_MIN_OUTPUT_TOKENS (слишком маленькие LLM_PROMPT_TOKENS / LLM_CONTEXT_TOKENS).
+        """
+        count = self.counter.count
+        fixed = sum(count(text) + MESSAGE_OVERHEAD for text in template)
+        limit = min(self.prompt_tokens, self.context_tokens - LLM_MIN_OUTPUT_TOKENS)
+        if fixed > limit:
+            raise ValueError(
+                f"Шаблон промпта ({fixed} токенов) не помещается в бюджет {limit} токенов: "
+                f"проверьте LLM_PROMPT_TOKENS / LLM_CONTEXT_TOKENS"
+            )
+        available = limit - fixed
+
+        description = description or ""
+        description_tokens = count(description)
+        trimmed = False
+        if description_tokens > available:
+            description = normalize_text(description)
+            description = self.counter.truncate(description, available)
+            description_tokens = count(description)
+            trimmed = True
+
+        used = fixed + description_tokens
+        kept = []
+        for line in references:
+            tokens = count(line)
+            if used + tokens > limit:
+                trimmed = True
+                break
+            kept.append(line)
+            used += tokens
+
+        max_tokens = int(description_tokens * OUTPUT_PER_INPUT_TOKEN) + OUTPUT_OVERHEAD
+        max_tokens = max(LLM_MIN_OUTPUT_TOKENS, min(max_tokens, LLM_MAX_OUTPUT_TOKENS))
+        # used <= limit, поэтому остаток окна не меньше LLM_MIN_OUTPUT_TOKENS (с точностью до обрезки)
+        max_tokens = max(min(max_tokens, self.context_tokens - used), 1)
+        return {
+            "description": description,
+            "references": kept,
+            "prompt_tokens": used,
+            "max_tokens": max_tokens,
+            "trimmed": trimmed,
+        }
+
+    def record(self, plan: dict, completion_tokens: int, latency: float, usage=None):
+        """
+        Учет одного вызова: usage — ответ сервера (prompt_tokens / completion_tokens),
+        если он есть; иначе — наши подсчеты
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or plan["prompt_tokens"]
+        completion_tokens = getattr(usage, "completion_tokens", None) or completion_tokens
+        with self._stats_lock:
+            self.calls += 1
+            self.trimmed += plan["trimmed"]
+            self.total_prompt_tokens += prompt_tokens
+            self.total_completion_tokens += completion_tokens
+        note = " (сокращен)" if plan["trimmed"] else ""
+        print(f"🧮 LLM: промпт {prompt_tokens}{note}, ответ {completion_tokens}/{plan['max_tokens']} "
+              f"токенов, референсов {len(plan['references'])}, {latency:.2f} c")
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            calls = self.calls
+            prompt_tokens, completion_tokens = self.total_prompt_tokens, self.total_completion_tokens
+            trimmed = self.trimmed
+        return {
+            "calls": calls,
+            "trimmed": trimmed,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "avg_prompt_tokens": round(prompt_tokens / calls, 1) if calls else 0.0,
+            "avg_completion_tokens": round(completion_tokens / calls, 1) if calls else 0.0,
+            "exact_tokenizer": self.counter.exact,
+        }
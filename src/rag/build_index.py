@@ -0,0 +1,95 @@
+"""
+Офлайн-сборка поискового индекса.
+
+Собирает новую версию data/vector_index/<version>/ (манифест с моделью и
+sha256 файлов), проверяет ее и атомарно переключает CURRENT. Сервис API
+индекс не строит: он подхватывает новую версию сам (см. INDEX_POLL_SECONDS
+в src/api/main.py), без перезапуска.
+
+Эмбеддинги неизменившихся вакансий берутся из текущей версии, поэтому
+ежедневное обновление кодирует только новые и измененные вакансии.
+Одновременно может идти только одна сборка (lock-файл в каталоге индекса).
+
+Запуск: python -m src.rag.build_index [путь к parquet] [--migrate-pickle]
+"""
+import argparse
+import os
+import sys
+import pathlib
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from src.rag.retriever import VacancyRetriever
+from src.rag.store import EmbeddingStore, current_version_path
+
+DEFAULT_SOURCE = ROOT_DIR / "data" / "vacancies_processed.parquet"
+LOCK_NAME = "BUILD.lock"
+
+
+class BuildLock:
+    """Эксклюзивный lock-файл: вторая сборка не стартует, пока идет первая"""
+
+    def __init__(self, index_dir: pathlib.Path):
+        self.path = pathlib.Path(index_dir) / LOCK_NAME
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            raise RuntimeError(
+                f"Сборка индекса уже идет ({self.path}). Если процесс упал, удалите lock-файл."
+            )
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return self
+
+    def __exit__(self, *exc):
+        self.path.unlink(missing_ok=True)
+
+
+def build(source=None, migrate_pickle: bool = False, retriever: VacancyRetriever = None) -> pathlib.Path:
+    """Собирает и публикует новую версию, возвращает ее каталог"""
+    retriever = retriever or VacancyRetriever(lazy=True)
+
+    with BuildLock(retriever.index_dir):
+        previous = current_version_path(retriever.index_dir)
+        if previous:
+            # Текущая версия — источник эмбеддингов для переиспользования. Если она собрана
+            # другой моделью или повреждена, собираем с нуля, а не падаем
+            try:
+                retriever._load_store()
+            except Exception as e:
+                print(f"⚠️ Текущая версия {previous.name} не переиспользуется: {e}")
+
+        if migrate_pickle:
+            retriever._migrate_pickle()
+        else:
+            retriever._build_index(str(source or DEFAULT_SOURCE))
+
+    path = current_version_path(retriever.index_dir)
+    if path is None or path == previous:
+        raise RuntimeError("Новая версия индекса не создана")
+
+    broken = EmbeddingStore.verify(path)
+    if broken:
+        raise RuntimeError(f"Версия {path.name} повреждена: {', '.join(broken)}")
+
+    manifest = retriever.store.manifest
+    print(f"📦 Версия {path.name}: {manifest['count']} вакансий, модель {manifest['model']}, "
+          f"индекс {manifest['index']['backend']}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-сборка поискового индекса")
+    parser.add_argument("source", nargs="?", default=str(DEFAULT_SOURCE), help="vacancies_processed.parquet")
+    parser.add_argument("--migrate-pickle", action="store_true",
+                        help="Сконвертировать старый data/vector_index.pkl вместо сборки")
+    args = parser.parse_args()
+    build(args.source, migrate_pickle=args.migrate_pickle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+from src.common.text import normalize_text
+
+
+def normalize_query(query: str) -> str:
+    """
+    Ключ кэша: без HTML и лишних пробелов. Регистр сохраняется: эмбеддинги корпуса
+    построены по тексту с регистром, и модель различает "Продавец" и "продавец"
+    """
+    return normalize_text(query or "")
+
+
+class EmbeddingCache:
+    """
+    Потокобезопасный LRU-кэш эмбеддингов запросов.
+
+    max_size    — сколько векторов держать в памяти процесса,
+    ttl         — время жизни записи в секундах (None — без ограничения),
+    shared_path — путь к sqlite-файлу, общему для всех воркеров (None — только память).
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = None, shared_path: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+        self._db = None
+        if shared_path:
+            self._db = sqlite3.connect(shared_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB, dtype TEXT, created REAL)"
+            )
+            self._db.commit()
+            self._db_puts = 0
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _get_shared(self, key: str):
+        row = self._db.execute(
+            "SELECT vector, dtype, created FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or self._expired(row[2]):
+            return None, None
+        return np.frombuffer(row[0], dtype=row[1]), row[2]
+
+    def _put_shared(self, key: str, vector: np.ndarray, created: float):
+        self._db.execute(
+            "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+            (key, vector.tobytes(), str(vector.dtype), created)
+        )
+        self._db_puts += 1
+        # Изредка подрезаем общий файл до max_size самых свежих записей
+        if self._db_puts % 1000 == 0:
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE key NOT IN "
+                "(SELECT key FROM query_embeddings ORDER BY created DESC LIMIT ?)", (self.max_size,)
+            )
+        self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray, created: float):
+        self._items[key] = (vector, created)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and not self._expired(item[1]):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._items[key]
+
+            if self._db is not None:
+                vector, created = self._get_shared(key)
+                if vector is not None:
+                    self._remember(key, vector, created)
+                    self.hits += 1
+                    self.shared_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        created = time.time()
+        with self._lock:
+            self._remember(key, vector, created)
+            if self._db is not None:
+                self._put_shared(key, vector, created)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def rewrite_cache_key(fields: list, reference_ids: list, model: str, prompt_version: str) -> str:
+    """
+    Ключ кэша переписываний: нормализованные поля вакансии, id референсов,
+    модель и версия промпта. Правки только в пробелах/HTML дают тот же ключ.
+    """
+    payload = json.dumps({
+        "fields": [normalize_text(str(f or "")) for f in fields],
+        "refs": [str(r) for r in reference_ids],
+        "model": model,
+        "prompt": prompt_version,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RewriteCache:
+    """
+    Дисковый (sqlite) кэш ответов LLM, переживает рестарты и общий для воркеров.
+    Размер ограничен max_entries: при переполнении удаляются давно не читанные записи.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rewrites "
+            "(key TEXT PRIMARY KEY, value TEXT, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS rewrites_access ON rewrites (last_access)")
+        self._db.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM rewrites WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE rewrites SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO rewrites VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM rewrites").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM rewrites WHERE key IN "
+                    "(SELECT key FROM rewrites ORDER BY last_access LIMIT ?)", (count - self.max_entries,)
+                )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM rewrites").fetchone()[0]
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,170 @@
+"""
+Лексический поиск: BM25 по инвертированному индексу в памяти процесса.
+
+Эмбеддинги rubert-tiny2 размывают точные токены ("Продавец-кассир",
+"категории C"), поэтому рядом с векторным индексом строится разреженный:
+  vocab.json   — термины (после нормализации и стемминга)
+  off.npy      — границы постингов термина (CSR, int64, len(vocab) + 1)
+  docs.npy     — номера строк (int32)
+  weights.npy  — готовый вклад BM25 термина в документ (float32)
+
+Постинги каждого термина отсортированы по убыванию вклада, поэтому запрос
+читает не больше max_postings лучших документов на термин — кандидаты
+генерируются за доли миллисекунды даже для частых слов.
+"""
+import json
+import pathlib
+import re
+from functools import lru_cache
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+STOPWORDS = frozenset(
+    "и в во на с со по к ко о об от до для за из у над под при без не а но или "
+    "что как мы вы наш наша наши ваш ваша ваши это".split()
+)
+# Окончания для легкого стемминга (самые длинные проверяются первыми)
+ENDINGS = tuple(sorted((
+    "иями", "ями", "ами", "ией", "ого", "его", "ому", "ему", "ыми", "ими", "ых", "их",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой", "ом", "ем", "ам", "ям", "ах", "ях",
+    "ов", "ев", "ей", "ью", "ия", "ии", "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+), key=len, reverse=True))
+MIN_STEM = 3
+
+
+# Словарь вакансий невелик по сравнению с числом токенов: стемминг кэшируется
+@lru_cache(maxsize=200_000)
+def stem(token: str) -> str:
+    """Отрезает словоизменительное окончание: кассира / кассиры -> кассир"""
+    if token.isdigit() or len(token) <= MIN_STEM + 1:
+        return token
+    for ending in ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM:
+            return token[:-len(ending)]
+    return token
+
+
+def tokenize(text) -> list:
+    """Нижний регистр, ё -> е, дефисные слова — отдельными токенами, без стоп-слов"""
+    if not text:
+        return []
+    tokens = TOKEN_RE.findall(str(text).lower().replace("ё", "е"))
+    return [stem(t) for t in tokens if t not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings, limit: int, k: int = 60) -> list:
+    """RRF: score(d) = sum 1 / (k + rank_i(d)); rankings — списки номеров строк по убыванию"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank + 1)
+    # При равенстве — порядок первого появления (sorted стабилен)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+class LexicalIndex:
+    """BM25 (k1, b) с постингами, упорядоченными по вкладу"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_postings: int = 2000):
+        self.k1 = k1
+        self.b = b
+        self.max_postings = max_postings
+        self.vocab = {}
+        self.offsets = None
+        self.docs = None
+        self.weights = None
+        self.n_docs = 0
+
+    def __len__(self):
+        return self.n_docs
+
+    def fit(self, texts):
+        vocab = {}
+        term_ids, doc_ids = [], []
+        lengths = []
+        for doc, text in enumerate(texts):
+            ids = [vocab.setdefault(token, len(vocab)) for token in tokenize(text)]
+            lengths.append(len(ids))
+            term_ids.extend(ids)
+            doc_ids.extend([doc] * len(ids))
+
+        self.vocab = vocab
+        self.n_docs = len(lengths)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        # tf: число повторов пары (термин, документ)
+        pairs, tf = np.unique(term_ids * max(self.n_docs, 1) + doc_ids, return_counts=True)
+        terms, docs = np.divmod(pairs, max(self.n_docs, 1))
+        df = np.bincount(terms, minlength=len(vocab)).astype(np.float32)
+
+        idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+        avgdl = lengths.mean() if self.n_docs and lengths.mean() > 0 else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avgdl)
+        weights = (idf[terms] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+
+        # Внутри термина — по убыванию вклада
+        order = np.lexsort((-weights, terms))
+        self.docs = docs[order].astype(np.int32)
+        self.weights = weights[order]
+        self.offsets = np.r_[0, np.cumsum(df)].astype(np.int64)
+        return self
+
+    def save(self, path: pathlib.Path) -> dict:
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(path / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(path / "off.npy", self.offsets)
+        np.save(path / "docs.npy", self.docs)
+        np.save(path / "weights.npy", self.weights)
+        return {"k1": self.k1, "b": self.b, "max_postings": self.max_postings, "n_docs": self.n_docs}
+
+    @classmethod
+    def load(cls, path: pathlib.Path, params: dict):
+        path = pathlib.Path(path)
+        index = cls(k1=params["k1"], b=params["b"], max_postings=params["max_postings"])
+        index.n_docs = params["n_docs"]
+        with open(path / "vocab.json", encoding="utf-8") as f:
+            index.vocab = {term: i for i, term in enumerate(json.load(f))}
+        index.offsets = np.load(path / "off.npy", mmap_mode="r")
+        index.docs = np.load(path / "docs.npy", mmap_mode="r")
+        index.weights = np.load(path / "weights.npy", mmap_mode="r")
+        return index
+
+    def search(self, query: str, limit: int = 10, subset: np.ndarray = None):
+        """
+        (номера строк, BM25) лучших документов по убыванию.
+        subset — отсортированные номера строк, среди которых искать. С ним постинги
+        читаются целиком: лучшие по вкладу документы могут не попасть в фильтр.
+        """
+        docs, weights = [], []
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            if subset is None:
+                end = min(end, start + self.max_postings)
+            docs.append(self.docs[start:end])
+            weights.append(self.weights[start:end])
+        if not docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        docs = np.concatenate(docs)
+        weights = np.concatenate(weights)
+        if subset is not None:
+            keep = np.isin(docs, subset)
+            docs, weights = docs[keep], weights[keep]
+
+        uniq, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights, minlength=len(uniq))
+        k = min(limit, len(uniq))
+        if k < len(uniq):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(uniq))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return uniq[top].astype(np.int64), scores[top].astype(np.float32)
@@ -1,33 +1,137 @@
 import os
 import json
-from huggingface_hub import InferenceClient, get_token
+import time
+import random
+import asyncio
+import httpx
+import pathlib
+from contextlib import asynccontextmanager
+from huggingface_hub import InferenceClient, AsyncInferenceClient, get_token
+from huggingface_hub.errors import HfHubHTTPError
 from src.api.models import VacancyOut, VacancyIn
+from src.common.text import reference_snippet
+from src.rag.budget import PromptBudget, LLM_MAX_OUTPUT_TOKENS
+from src.rag.cache import RewriteCache, rewrite_cache_key
+
+MODEL_NAME = "Qwen/Qwen2.5-72B-Instruct"
+# Меняйте при любой правке промпта или параметров генерации: это сбрасывает кэш ответов
+PROMPT_VERSION = "2"
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# Сколько запросов к LLM одновременно держит один процесс (общий лимит на все батчи)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Повторы на 429/5xx: экспоненциальная задержка base * 2^attempt с полным джиттером
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "10"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Кэш переписываний (sqlite на диске). REWRITE_CACHE_SIZE=0 выключает кэш
+DEFAULT_CACHE_PATH = pathlib.Path(__file__).resolve().parent.parent.parent / "data" / "rewrite_cache.sqlite"
+REWRITE_CACHE_PATH = os.getenv("REWRITE_CACHE_PATH", str(DEFAULT_CACHE_PATH))
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "50000"))
+# Сколько референсов реально уходит в промпт
+MAX_REFERENCES = 2
+# Короткие поля вакансии в шаблоне промпта (каждое ограничено budget.FIELD_TOKENS)
+PROMPT_FIELDS = ("profile", "city", "vacancy_title", "specialization")
+
+# max_tokens считается на каждый запрос от длины промпта (src/rag/budget.py)
+GENERATION_PARAMS = {
+    "temperature": 0.2,  # Низкая температура для строгости JSON
+    "top_p": 0.9,
+}
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, HfHubHTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUSES
+    # Обрыв соединения / таймаут отдельной попытки
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    # Если сервер сказал, сколько ждать, слушаемся его
+    if isinstance(error, HfHubHTTPError) and error.response is not None:
+        retry_after = error.response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
 
 
 class VacancyOptimizer:
     def __init__(self):
-        token = os.getenv("HUGGINGFACEHUB_API_TOKEN") or get_token()
+        self.token = os.getenv("HUGGINGFACEHUB_API_TOKEN") or get_token()
 
-        if not token:
+        if not self.token:
             print("⚠️ HUGGINGFACE TOKEN НЕ НАЙДЕН. Убедитесь, что настроили .env или сделали hf login")
 
         # Инициализируем клиент напрямую
         # Qwen/Qwen2.5-72B-Instruct - это мощнейшая модель, она требует chat-интерфейса
         self.client = InferenceClient(
-            model="Qwen/Qwen2.5-72B-Instruct",
-            token=token,
-            timeout=120
+            model=MODEL_NAME,
+            token=self.token,
+            timeout=LLM_TIMEOUT
         )
 
-    def optimize(self, vac: VacancyIn, references: list) -> VacancyOut:
+        # Асинхронный клиент (один httpx-пул соединений) и семафор живут в event loop API,
+        # поэтому создаются лениво при первом вызове внутри цикла
+        self._loop = None
+        self.async_client = None
+        self._semaphore = None
+
+        self.cache = None
+        if REWRITE_CACHE_SIZE > 0:
+            pathlib.Path(REWRITE_CACHE_PATH).parent.mkdir(parents=True, exist_ok=True)
+            self.cache = RewriteCache(REWRITE_CACHE_PATH, REWRITE_CACHE_SIZE)
+
+        # Токенизатор грузится в фоне (budget.counter.warm_up), до этого — оценка по длине
+        self.budget = PromptBudget()
+
+    def _cache_key(self, vac: VacancyIn, references: list) -> str:
+        fields = [vac.vacancy_title, vac.vacancy_description, vac.specialization, vac.profile, vac.city]
+        ref_ids = [r.get('vacancy_id', r.get('vacancy_title')) for r in references[:MAX_REFERENCES]]
+        return rewrite_cache_key(fields, ref_ids, MODEL_NAME, PROMPT_VERSION)
+
+    def _from_cache(self, vac: VacancyIn, key: str):
+        if self.cache is None:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        cached["input_id"] = vac.input_id
+        return VacancyOut(**cached, cache_hit=True)
+
+    def _to_cache(self, key: str, result: VacancyOut):
+        if self.cache is not None:
+            self.cache.put(key, result.model_dump(exclude={"input_id", "cache_hit"}))
+
+    def _build_prompt(self, vac: VacancyIn, references: list):
+        """Сообщения, уложенные в бюджет токенов, и план бюджета (max_tokens, подсчеты)"""
         # 1. Подготовка контекста (референсов)
-        refs_text = ""
-        for i, r in enumerate(references[:2]):
+        ref_lines = []
+        for i, r in enumerate(references[:MAX_REFERENCES]):
             title = r.get('vacancy_title', 'Без заголовка')
-            # Обрезаем описание, чтобы не забить контекст
-            desc = str(r.get('vacancy_description', '')).replace('\n', ' ')[:300]
-            refs_text += f"- Пример {i + 1}: {title} | {desc}...\n"
+            # Обрезанное описание хранится в индексе готовым; полный текст не читаем
+            desc = r.get('vacancy_snippet')
+            if desc is None:
+                desc = reference_snippet(r.get('vacancy_description', ''))
+            ref_lines.append(f"- Пример {i + 1}: {title} | {desc}...\n")
+
+        # Короткие поля ограничены заранее: шаблон с ними не сокращается
+        capped = {name: self.budget.cap_field(getattr(vac, name)) for name in PROMPT_FIELDS}
+        trimmed = any(capped[name] != getattr(vac, name) for name in PROMPT_FIELDS)
+        vac = vac.model_copy(update=capped)
 
+        # Шаблон без описания и референсов — несокращаемая часть промпта
+        template = [m["content"] for m in self._render_messages(vac, "", "")]
+        plan = self.budget.plan(template, vac.vacancy_description, ref_lines)
+        plan["trimmed"] = plan["trimmed"] or trimmed
+        messages = self._render_messages(vac, plan["description"], "".join(plan["references"]))
+        return messages, plan
+
+    def _build_messages(self, vac: VacancyIn, references: list) -> list:
+        return self._build_prompt(vac, references)[0]
+
+    def _render_messages(self, vac: VacancyIn, description: str, refs_text: str) -> list:
         # 2. Формируем сообщения для чата (System + User)
         system_message = """You are a professional HR Expert and Copywriter. 
 Your goal is to rewrite job descriptions to maximize applicant conversion.
@@ -41,7 +145,7 @@ Profile: {vac.profile}
 City: {vac.city}
 Title: {vac.vacancy_title}
 Specialization: {vac.specialization}
-Description: {vac.vacancy_description}
+Description: {description}
 
 SUCCESSFUL EXAMPLES (Use style and structure from here):
 {refs_text}
@@ -68,56 +172,196 @@ JSON SCHEMA:
             {"role": "user", "content": user_content}
         ]
 
+        return messages
+
+    def _parse_response(self, vac: VacancyIn, raw_content: str) -> VacancyOut:
+        # 4. Чистка JSON (Qwen любит оборачивать в ```json ... ```)
+        clean_json = raw_content.strip()
+
+        if "```json" in clean_json:
+            clean_json = clean_json.split("```json")[1].split("```")[0]
+        elif "```" in clean_json:
+            clean_json = clean_json.split("```")[1].split("```")[0]
+
+        # Убираем лишний текст до и после JSON
+        start_idx = clean_json.find("{")
+        end_idx = clean_json.rfind("}")
+        if start_idx != -1 and end_idx != -1:
+            clean_json = clean_json[start_idx: end_idx + 1]
+
+        # 5. Парсинг
+        data = json.loads(clean_json)
+
+        return VacancyOut(
+            input_id=vac.input_id,
+            profile=data.get("profile", vac.profile),
+            city=data.get("city", vac.city),
+            vacancy_title=data.get("vacancy_title", vac.vacancy_title),
+            specialization=data.get("specialization", vac.specialization),
+            vacancy_description=data.get("vacancy_description", vac.vacancy_description),
+            improvement_notes=data.get("improvement_notes", ["Оптимизация структуры и стиля"]),
+            predicted_efficiency_score=None
+        )
+
+    def _error_result(self, vac: VacancyIn, e: Exception) -> VacancyOut:
+        print(f"❌ Ошибка Qwen API: {e!r}")
+        # Если сломалось - возвращаем исходник с ошибкой
+        return VacancyOut(
+            input_id=vac.input_id,
+            profile=vac.profile,
+            city=vac.city,
+            vacancy_title=vac.vacancy_title,
+            specialization=vac.specialization,
+            vacancy_description=vac.vacancy_description,
+            improvement_notes=[f"API Error: {str(e) or type(e).__name__}"],
+            predicted_efficiency_score=None
+        )
+
+    def optimize(self, vac: VacancyIn, references: list) -> VacancyOut:
+        key = self._cache_key(vac, references)
+        cached = self._from_cache(vac, key)
+        if cached is not None:
+            return cached
+
         try:
+            messages, plan = self._build_prompt(vac, references)
             # 3. Отправляем запрос как ЧАТ (chat_completion)
+            started = time.monotonic()
             response = self.client.chat_completion(
-                messages=messages,
-                max_tokens=2500,
-                temperature=0.2,  # Низкая температура для строгости JSON
-                top_p=0.9
+                messages=messages, max_tokens=plan["max_tokens"], **GENERATION_PARAMS
             )
-
             # Получаем текст ответа
             raw_content = response.choices[0].message.content
+            self._record_usage(plan, raw_content, started, response)
+            result = self._parse_response(vac, raw_content)
+        except Exception as e:
+            return self._error_result(vac, e)
+        # Ошибки не кэшируем, только удачные ответы
+        self._to_cache(key, result)
+        return result
 
-            # 4. Чистка JSON (Qwen любит оборачивать в ```json ... ```)
-            clean_json = raw_content.strip()
-
-            if "```json" in clean_json:
-                clean_json = clean_json.split("```json")[1].split("```")[0]
-            elif "```" in clean_json:
-                clean_json = clean_json.split("```")[1].split("```")[0]
-
-            # Убираем лишний текст до и после JSON
-            start_idx = clean_json.find("{")
-            end_idx = clean_json.rfind("}")
-            if start_idx != -1 and end_idx != -1:
-                clean_json = clean_json[start_idx: end_idx + 1]
-
-            # 5. Парсинг
-            data = json.loads(clean_json)
-
-            return VacancyOut(
-                input_id=vac.input_id,
-                profile=data.get("profile", vac.profile),
-                city=data.get("city", vac.city),
-                vacancy_title=data.get("vacancy_title", vac.vacancy_title),
-                specialization=data.get("specialization", vac.specialization),
-                vacancy_description=data.get("vacancy_description", vac.vacancy_description),
-                improvement_notes=data.get("improvement_notes", ["Оптимизация структуры и стиля"]),
-                predicted_efficiency_score=None
-            )
+    def _async_resources(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.async_client = AsyncInferenceClient(model=MODEL_NAME, token=self.token, timeout=LLM_TIMEOUT)
+            self._semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        return self.async_client, self._semaphore
+
+    @staticmethod
+    def _time_left(deadline: float = None) -> float:
+        """Таймаут очередного ожидания: не больше LLM_TIMEOUT и не дольше дедлайна"""
+        if deadline is None:
+            return LLM_TIMEOUT
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise asyncio.TimeoutError("Истек дедлайн запроса")
+        return min(LLM_TIMEOUT, left)
+
+    def _record_usage(self, plan: dict, raw_content: str, started: float, response=None):
+        # Сервер может не вернуть usage (и никогда не возвращает его в потоке) — досчитываем сами
+        usage = getattr(response, "usage", None)
+        completion_tokens = self.budget.counter.count(raw_content)
+        self.budget.record(plan, completion_tokens, time.monotonic() - started, usage)
+
+    @asynccontextmanager
+    async def _slot(self, semaphore: asyncio.Semaphore, deadline: float = None):
+        """Слот общего лимита LLM; ожидание слота тоже ограничено дедлайном"""
+        timeout = None if deadline is None else self._time_left(deadline)
+        await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+        try:
+            yield
+        finally:
+            semaphore.release()
 
+    async def _chat_with_retries(self, messages: list, deadline: float = None, stream: bool = False,
+                                 max_tokens: int = LLM_MAX_OUTPUT_TOKENS):
+        """
+        chat_completion с повторами на 429/5xx и обрывы соединения.
+        deadline — момент time.monotonic(), после которого ответ уже никому не нужен.
+
+        Возвращает ответ сервера целиком (текст и usage). При stream=True — асинхронный
+        итератор чанков; семафор в этом случае держит вызывающий код на все время чтения потока.
+        """
+        params = dict(GENERATION_PARAMS, max_tokens=max_tokens)
+        client, semaphore = self._async_resources()
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                if stream:
+                    call = client.chat_completion(messages=messages, stream=True, **params)
+                    return await asyncio.wait_for(call, timeout=self._time_left(deadline))
+                async with self._slot(semaphore, deadline):
+                    # Таймаут — от момента получения слота: ожидание в очереди уже съело часть дедлайна
+                    call = client.chat_completion(messages=messages, **params)
+                    return await asyncio.wait_for(call, timeout=self._time_left(deadline))
+            except Exception as e:
+                if attempt == LLM_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = _backoff_delay(attempt, e)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise
+                print(f"🔁 LLM повтор {attempt + 1}/{LLM_MAX_RETRIES} через {delay:.1f}с: {e!r}")
+                await asyncio.sleep(delay)
+
+    async def aoptimize(self, vac: VacancyIn, references: list, deadline: float = None) -> VacancyOut:
+        """Асинхронная версия optimize: не блокирует event loop, переиспользует соединения"""
+        key = self._cache_key(vac, references)
+        # sqlite — блокирующий ввод-вывод, в event loop его не делаем
+        cached = await asyncio.to_thread(self._from_cache, vac, key)
+        if cached is not None:
+            return cached
+
+        try:
+            messages, plan = self._build_prompt(vac, references)
+            started = time.monotonic()
+            response = await self._chat_with_retries(messages, deadline, max_tokens=plan["max_tokens"])
+            raw_content = response.choices[0].message.content
+            self._record_usage(plan, raw_content, started, response)
+            result = self._parse_response(vac, raw_content)
         except Exception as e:
-            print(f"❌ Ошибка Qwen API: {e}")
-            # Если сломалось - возвращаем исходник с ошибкой
-            return VacancyOut(
-                input_id=vac.input_id,
-                profile=vac.profile,
-                city=vac.city,
-                vacancy_title=vac.vacancy_title,
-                specialization=vac.specialization,
-                vacancy_description=vac.vacancy_description,
-                improvement_notes=[f"API Error: {str(e)}"],
-                predicted_efficiency_score=None
-            )
+            return self._error_result(vac, e)
+        await asyncio.to_thread(self._to_cache, key, result)
+        return result
+
+    async def astream_optimize(self, vac: VacancyIn, references: list, deadline: float = None):
+        """
+        Потоковая версия: отдает ("token", кусок текста) по мере генерации
+        и в конце ("result", VacancyOut). Повтор возможен только до первого токена.
+        """
+        key = self._cache_key(vac, references)
+        cached = await asyncio.to_thread(self._from_cache, vac, key)
+        if cached is not None:
+            yield "result", cached
+            return
+
+        _, semaphore = self._async_resources()
+        chunks = []
+        try:
+            messages, plan = self._build_prompt(vac, references)
+            async with self._slot(semaphore, deadline):
+                started = time.monotonic()
+                stream = await self._chat_with_retries(messages, deadline, stream=True, max_tokens=plan["max_tokens"])
+                iterator = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(iterator), timeout=self._time_left(deadline))
+                    except StopAsyncIteration:
+                        break
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        chunks.append(delta)
+                        yield "token", delta
+            raw_content = "".join(chunks)
+            self._record_usage(plan, raw_content, started)
+            result = self._parse_response(vac, raw_content)
+        except Exception as e:
+            yield "result", self._error_result(vac, e)
+            return
+        await asyncio.to_thread(self._to_cache, key, result)
+        yield "result", result
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+            self._loop = None
@@ -1,46 +1,237 @@
+import os
+import hashlib
+import numpy as np
 import pandas as pd
 import pathlib
 import pickle
 import logging
+import threading
 import warnings
-from transformers import logging as hf_logging
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
 from typing import List, Dict
+from src.rag.index import create_index
+from src.rag.cache import EmbeddingCache, normalize_query
+from src.rag.batcher import MicroBatchEncoder
+from src.rag.lexical import reciprocal_rank_fusion
+from src.rag.store import (
+    EmbeddingStore, current_version_path, new_version_name, normalize_value, publish_version,
+    vectors_from_legacy_index
+)
 
-# --- 🔇 ТИШИНА В ЭФИРЕ ---
-# Отключаем технические предупреждения HuggingFace и лишний шум
-hf_logging.set_verbosity_error()
-logging.getLogger("sentence_transformers").setLevel(logging.ERROR)
-warnings.filterwarnings("ignore", category=UserWarning)
-warnings.filterwarnings("ignore", category=FutureWarning)
 
+# Тип индекса: "exact" (полный скан), "ivf" (приближенный, быстрее на больших корпусах),
+# "sq8" / "pq" (квантованные коды: в 4 / ~30 раз меньше памяти)
+INDEX_BACKEND = os.getenv("RETRIEVER_INDEX", "exact")
+# Параметры IVF: число кластеров (0 = авто, ~sqrt(N)) и сколько из них сканировать
+IVF_N_LISTS = int(os.getenv("RETRIEVER_IVF_LISTS", "0"))
+IVF_N_PROBE = int(os.getenv("RETRIEVER_IVF_PROBE", "8"))
+# Квантование: во сколько раз больше кандидатов пересчитать точно (0 — без пересчета)
+# и число подвекторов PQ (0 = авто, по 8 измерений)
+QUANT_RERANK = int(os.getenv("RETRIEVER_RERANK", "4"))
+PQ_SUBVECTORS = int(os.getenv("RETRIEVER_PQ_SUBVECTORS", "0"))
+
+
+def make_index():
+    if INDEX_BACKEND == "ivf":
+        return create_index("ivf", n_lists=IVF_N_LISTS or None, n_probe=IVF_N_PROBE)
+    if INDEX_BACKEND == "sq8":
+        return create_index("sq8", rerank=QUANT_RERANK)
+    if INDEX_BACKEND == "pq":
+        return create_index("pq", n_subvectors=PQ_SUBVECTORS or None, rerank=QUANT_RERANK)
+    return create_index(INDEX_BACKEND)
+
+
+MODEL_NAME = "cointegrated/rubert-tiny2"
+
+# Кэш эмбеддингов запросов: размер, TTL в секундах (0 — без TTL)
+# и опциональный sqlite-файл, общий для всех воркеров
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "10000"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "0"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")
+
+
+# Микро-батчинг запросов от параллельных клиентов: сколько ждать соседей и максимум в батче
+QUERY_BATCH_SIZE = int(os.getenv("QUERY_BATCH_SIZE", "32"))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+
+
+# Режим поиска: "dense" — только векторы, "hybrid" — векторы + BM25 со слиянием RRF,
+# "prefilter" — BM25 отбирает кандидатов, векторы ранжируют только их
+SEARCH_MODE = os.getenv("RETRIEVER_MODE", "hybrid")
+# Глубина списков для RRF и число кандидатов BM25 в режиме prefilter
+FUSION_DEPTH = int(os.getenv("RETRIEVER_FUSION_DEPTH", "20"))
+PREFILTER_CANDIDATES = int(os.getenv("RETRIEVER_PREFILTER_CANDIDATES", "200"))
+
+# Расширение фильтра, если подходящих вакансий меньше limit: каждый следующий
+# уровень — надмножество предыдущего, последний — весь корпус
+FILTER_WIDENING = (
+    ("city", "profile", "specialization"),
+    ("profile", "specialization"),
+    ("specialization",),
+    (),
+)
+
+# Сверять sha256 файлов версии перед загрузкой (читает индекс с диска целиком)
+VERIFY_CHECKSUM = os.getenv("RETRIEVER_VERIFY_CHECKSUM", "1") == "1"
+
+
+def make_query_cache():
+    return EmbeddingCache(
+        max_size=QUERY_CACHE_SIZE,
+        ttl=QUERY_CACHE_TTL or None,
+        shared_path=QUERY_CACHE_PATH or None
+    )
+
+
+def load_model():
+    """
+    transformers / sentence_transformers импортируются только здесь:
+    импорт модуля (и старт API) не ждет загрузки torch.
+    """
+    from transformers import logging as hf_logging
+    from sentence_transformers import SentenceTransformer
+
+    # --- 🔇 ТИШИНА В ЭФИРЕ ---
+    # Отключаем технические предупреждения HuggingFace и лишний шум
+    hf_logging.set_verbosity_error()
+    logging.getLogger("sentence_transformers").setLevel(logging.ERROR)
+    warnings.filterwarnings("ignore", category=UserWarning)
+    warnings.filterwarnings("ignore", category=FutureWarning)
+
+    # Модель инициализируется уже в "тихом" режиме
+    return SentenceTransformer(MODEL_NAME)
 
-# -------------------------
 
 class VacancyRetriever:
-    def __init__(self, data_path: str = None):
+    # Подмена индекса при горячем обновлении: search берет индекс и записи одной парой
+    _swap_lock = threading.Lock()
+
+    def __init__(self, lazy: bool = False):
+        """
+        Ретривер только загружает готовый индекс: сборка — офлайн,
+        командой python -m src.rag.build_index.
+        lazy=True — ничего не загружать в конструкторе: модель и индекс
+        поднимет warm_up() (в API — в фоне, пока /health/ready отвечает "warming").
+        """
         self.root = pathlib.Path(__file__).resolve().parent.parent.parent
+        self.index_dir = self.root / "data" / "vector_index"
+        # Старый формат (pickle целиком), читаем только для миграции
         self.index_path = self.root / "data" / "vector_index.pkl"
 
-        # Модель инициализируется уже в "тихом" режиме
-        self.model = SentenceTransformer("cointegrated/rubert-tiny2")
+        self.model = None
+        self.encoder = None
+        self.query_cache = make_query_cache()
+        self.store = None
         self.index = None
         self.vacancies = []
+        self.ready = False
 
-        if self.index_path.exists():
-            print("📖 Загрузка поискового индекса...")
-            with open(self.index_path, "rb") as f:
-                data = pickle.load(f)
-                self.index = data["index"]
-                self.vacancies = data["vacancies"]
-        elif data_path:
-            self._build_index(data_path)
+        if not lazy:
+            self.warm_up()
+
+    def _ensure_model(self):
+        if self.model is None:
+            self.model = load_model()
+        if self.encoder is None:
+            self.encoder = MicroBatchEncoder(self.model, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS)
+
+    @property
+    def version(self):
+        """Имя загруженной версии индекса (None — индекса нет)"""
+        return self.store.path.name if self.store is not None else None
+
+    def warm_up(self):
+        """Загрузка модели и текущей версии индекса"""
+        self._ensure_model()
+
+        if current_version_path(self.index_dir):
+            self._load_store()
         else:
-            print("⚠️ Нет данных для поиска. RAG выключен.")
+            print("⚠️ Нет готового индекса (соберите: python -m src.rag.build_index). RAG выключен.")
+
+        # Первый encode заметно дольше остальных: делаем его до приема трафика
+        if self.index is not None:
+            self.model.encode(["прогрев"])
+        self.ready = True
+
+    def _open_store(self, path: pathlib.Path):
+        """Открывает версию и проверяет, что она цела и собрана той же моделью"""
+        store = EmbeddingStore(path)
+        model = store.manifest.get("model")
+        if model != MODEL_NAME:
+            raise ValueError(f"индекс {path.name} собран моделью {model}, а загружена {MODEL_NAME}")
+        if VERIFY_CHECKSUM:
+            broken = EmbeddingStore.verify(path)
+            if broken:
+                raise ValueError(f"индекс {path.name}: не сходится sha256 у {', '.join(broken)}")
+        return store
+
+    def _load_store(self, store: EmbeddingStore = None):
+        if store is None:
+            path = current_version_path(self.index_dir)
+            print(f"📖 Загрузка поискового индекса (mmap): {path.name}...")
+            store = self._open_store(path)
+        if len(store) == 0:
+            print("⚠️ Индекс пуст. RAG выключен.")
+        with self._swap_lock:
+            self.store = store
+            self.index = store.index if len(store) else None
+            self.vacancies = store.records if len(store) else []
+
+    def refresh(self) -> bool:
+        """
+        Горячая подмена: если CURRENT указывает на другую версию, открываем ее
+        и подменяем индекс. Текущие поиски дорабатывают на старой версии
+        (ее файлы остаются в mmap). Битая версия не подхватывается.
+        """
+        path = current_version_path(self.index_dir)
+        if path is None or (self.store is not None and path == self.store.path):
+            return False
+        try:
+            store = self._open_store(path)
+        except Exception as e:
+            print(f"❌ Новая версия индекса не загружена: {e}")
+            return False
+        self._load_store(store)
+        print(f"🔄 Индекс переключен на версию {path.name} ({len(store)} вакансий)")
+        return True
+
+    def _save_store(self, index, top_df: pd.DataFrame):
+        # Каждая сборка — новая версия; CURRENT переключается только после полной записи
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        version = new_version_name()
+        EmbeddingStore.write(self.index_dir / version, index, top_df, MODEL_NAME)
+        publish_version(self.index_dir, version)
+        self._load_store()
+
+    def _previous_embeddings(self) -> Dict:
+        """(vacancy_id, content_hash) -> номер строки в текущей версии индекса"""
+        if self.store is None or self.store.manifest.get("model") != MODEL_NAME:
+            return {}
+        if "content_hash" not in self.store.columns or "vacancy_id" not in self.store.columns:
+            return {}
+        ids = self.store.columns["vacancy_id"].to_list()
+        hashes = self.store.columns["content_hash"].to_list()
+        return {(str(v), h): row for row, (v, h) in enumerate(zip(ids, hashes))}
+
+    def _migrate_pickle(self):
+        print("🔁 Найден старый vector_index.pkl, конвертируем в mmap-формат...")
+        with open(self.index_path, "rb") as f:
+            data = pickle.load(f)
+
+        vectors = vectors_from_legacy_index(data["index"])
+        index = make_index()
+        index.fit(vectors)
+        self._save_store(index, pd.DataFrame(data["vacancies"]))
+        print(f"✅ Миграция завершена: {self.index_dir}")
 
     def _build_index(self, data_path: str):
-        print("⚙️ Создание индекса (векторизация)...")
+        """
+        Инкрементальная сборка: эмбеддинги ключуются по (vacancy_id, хэш embed_text),
+        поэтому заново кодируются только новые и изменившиеся вакансии.
+        Вакансии, выпавшие из топа, просто не попадают в новую версию.
+        """
+        print("⚙️ Обновление индекса (векторизация)...")
+        self._ensure_model()
         df = pd.read_parquet(data_path)
 
         # Фильтруем топ-перформеров
@@ -56,26 +247,175 @@ class VacancyRetriever:
                 top_df['vacancy_description'].fillna('').astype(str).str.slice(0, 500)
         )
 
-        # encode может показывать прогресс-бар, его оставим, чтобы видеть, что процесс идет
-        vectors = self.model.encode(top_df['embed_text'].tolist(), show_progress_bar=True)
+        if top_df.empty:
+            print("⚠️ Нет эталонных вакансий. RAG выключен.")
+            return
+
+        top_df['vacancy_id'] = top_df['vacancy_id'].astype(str)
+        top_df['content_hash'] = [
+            hashlib.sha1(t.encode("utf-8")).hexdigest() for t in top_df['embed_text']
+        ]
+
+        previous = self._previous_embeddings()
+        reuse_rows = np.array([
+            previous.get(key, -1) for key in zip(top_df['vacancy_id'], top_df['content_hash'])
+        ], dtype=np.int64)
+        reused = reuse_rows >= 0
+        to_encode = np.flatnonzero(~reused)
+        print(f"   Переиспользуем: {int(reused.sum())}, кодируем: {len(to_encode)}, "
+              f"удалено из индекса: {len(previous) - int(reused.sum())}")
 
-        self.index = NearestNeighbors(n_neighbors=5, metric="cosine")
-        self.index.fit(vectors)
+        new_vectors = None
+        if len(to_encode):
+            # encode может показывать прогресс-бар, его оставим, чтобы видеть, что процесс идет
+            texts = top_df['embed_text'].iloc[to_encode].tolist()
+            new_vectors = np.asarray(self.model.encode(texts, show_progress_bar=True), dtype=np.float32)
 
-        self.vacancies = top_df.to_dict("records")
+        dim = new_vectors.shape[1] if new_vectors is not None else self.store.dim
+        vectors = np.empty((len(top_df), dim), dtype=np.float32)
+        if reused.any():
+            vectors[reused] = self.store.vectors[reuse_rows[reused]]
+        if new_vectors is not None:
+            vectors[to_encode] = new_vectors
 
-        with open(self.index_path, "wb") as f:
-            pickle.dump({"index": self.index, "vacancies": self.vacancies}, f)
+        index = make_index()
+        index.fit(vectors)
+        self._save_store(index, top_df)
         print("✅ Индекс готов и сохранен.")
 
-    def search(self, query: str, limit: int = 3) -> List[Dict]:
-        if not self.index: return []
+    def _encode_query(self, query: str) -> np.ndarray:
+        # Заголовки повторяются тысячи раз в день: прогон энкодера только на промахе кэша
+        # Нормализованная строка — только ключ; кодируется сам запрос, как без кэша
+        key = normalize_query(query)
+        vec = self.query_cache.get(key)
+        if vec is None:
+            vec = self.encoder.encode(query)
+            self.query_cache.put(key, vec)
+        return vec
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Матрица эмбеддингов: промахи кэша (без повторов) кодируются одним вызовом модели"""
+        keys = [normalize_query(q) for q in queries]
+        vectors = {}
+        missing = {}
+        for key, query in zip(keys, queries):
+            if key in vectors or key in missing:
+                continue
+            vec = self.query_cache.get(key)
+            if vec is None:
+                missing[key] = query
+            else:
+                vectors[key] = vec
+        if missing:
+            for key, vec in zip(missing, self.encoder.encode_many(list(missing.values()))):
+                self.query_cache.put(key, vec)
+                vectors[key] = vec
+        return np.stack([np.asarray(vectors[key], dtype=np.float32) for key in keys])
+
+    def search(self, query: str, limit: int = 3, filters: Dict = None) -> List[Dict]:
+        """
+        filters — {"city": ..., "profile": ..., "specialization": ...}: ищем только
+        среди вакансий с теми же метаданными (сканируется лишь их подмножество).
+        Если их меньше limit, фильтр расширяется по FILTER_WIDENING, а недостающие
+        референсы добираются из более широкой выборки.
+        """
+        with self._swap_lock:
+            snapshot = self.index, self.vacancies, self.store
+        if snapshot[0] is None: return []
+
+        vec = self._encode_query(query)
+        return self._search_vectors(snapshot, [query], vec[None, :], limit, [filters])[0]
+
+    def search_many(self, queries: List[str], limit: int = 3, filters: List[Dict] = None) -> List[List[Dict]]:
+        """
+        То же, что search для каждого запроса, но пачкой: один вызов энкодера
+        на все промахи кэша и один матричный kneighbors на группу запросов
+        с одинаковым фильтром. filters — по словарю на запрос (или None).
+        """
+        with self._swap_lock:
+            snapshot = self.index, self.vacancies, self.store
+        if snapshot[0] is None or not queries:
+            return [[] for _ in queries]
+
+        vecs = self._encode_queries(queries)
+        return self._search_vectors(snapshot, queries, vecs, limit, filters or [None] * len(queries))
+
+    def _search_vectors(self, snapshot, queries: List[str], vecs: np.ndarray, limit: int,
+                        filters: List[Dict]) -> List[List[Dict]]:
+        index, vacancies, store = snapshot
+        n_records = len(vacancies)
+        lexical = store.lexical if store is not None else None
+        use_filters = store is not None and bool(store.filters)
+
+        results = [[] for _ in queries]
+        seen = [set() for _ in queries]
+        scanned = [0] * len(queries)
+        active = list(range(len(queries)))
+        for fields in (FILTER_WIDENING if use_filters else ((),)):
+            # Запросы с одинаковыми условиями уровня ищутся одним kneighbors
+            groups = {}
+            for i in active:
+                conditions = filters[i] or {}
+                key = tuple(
+                    (field, normalize_value(conditions[field])) for field in fields
+                    if field in store.filters and conditions.get(field) is not None
+                    and normalize_value(conditions[field])
+                ) if use_filters else ()
+                groups.setdefault(key, []).append(i)
+
+            for key, members in groups.items():
+                subset = store.filter_rows(dict(key)) if key else None
+                size = n_records if subset is None else len(subset)
+                # Уровни вложены: та же мощность — то же множество, повторно не ищем
+                members = [i for i in members if size > scanned[i]]
+                if not members:
+                    continue
+                ranked = self._rank(index, lexical, [queries[i] for i in members], vecs[members],
+                                    limit, n_records, subset)
+                for i, rows in zip(members, ranked):
+                    scanned[i] = size
+                    for idx in rows:
+                        if idx not in seen[i]:
+                            seen[i].add(idx)
+                            results[i].append(idx)
+
+            active = [i for i in active if len(results[i]) < limit]
+            if not active:
+                break
+        return [[vacancies[idx] for idx in rows[:limit]] for rows in results]
+
+    def _rank(self, index, lexical, queries: List[str], vecs: np.ndarray, limit: int, n_records: int,
+              subset=None) -> List[List[int]]:
+        """Номера строк лучших вакансий по каждому запросу в выбранном SEARCH_MODE"""
+        if lexical is None or SEARCH_MODE == "dense":
+            return self._nearest(index, vecs, limit, n_records, subset)
+
+        if SEARCH_MODE == "prefilter":
+            dense = self._nearest(index, vecs, limit, n_records, subset)
+            ranked = []
+            for query, vec, fallback in zip(queries, vecs, dense):
+                candidates, _ = lexical.search(query, PREFILTER_CANDIDATES, subset)
+                rows = self._nearest(index, vec[None, :], limit, n_records, np.sort(candidates))[0] \
+                    if len(candidates) else []
+                # Лексических кандидатов мало: добираем обычным векторным поиском
+                rows += [idx for idx in fallback if idx not in rows]
+                ranked.append(rows[:limit])
+            return ranked
+
+        depth = max(limit, FUSION_DEPTH)
+        dense = self._nearest(index, vecs, depth, n_records, subset)
+        return [
+            reciprocal_rank_fusion([rows, lexical.search(query, depth, subset)[0].tolist()], limit)
+            for query, rows in zip(queries, dense)
+        ]
+
+    @staticmethod
+    def _nearest(index, vecs: np.ndarray, limit: int, n_records: int, subset=None) -> List[List[int]]:
+        distances, indices = index.kneighbors(vecs, n_neighbors=limit, subset=subset)
+        return [[int(idx) for idx in row if 0 <= idx < n_records] for row in indices]
 
-        vec = self.model.encode([query])
-        distances, indices = self.index.kneighbors(vec, n_neighbors=limit)
 
-        results = []
-        for idx in indices[0]:
-            if idx < len(self.vacancies):
-                results.append(self.vacancies[idx])
-        return results
+if __name__ == "__main__":
+    # Прежняя точка входа: сборка теперь в src.rag.build_index
+    from src.rag.build_index import main
+    main()
@@ -0,0 +1,366 @@
+"""
+Хранилище поискового индекса на диске.
+
+Корень индекса (data/vector_index/) хранит версии и указатель на текущую:
+    CURRENT              — имя активной версии (обновляется атомарно через os.replace)
+    <version>/           — каталог версии в формате ниже
+
+Формат каталога версии:
+    manifest.json        — размерность, число строк, модель, тип индекса, список колонок,
+                           sha256 каждого файла версии
+    embeddings.f32       — непрерывная матрица float32 [count x dim], открывается через np.memmap
+    ivf_*.npy            — служебные массивы индекса (если есть)
+    meta/<col>.bin       — строковая колонка: utf-8 байты всех значений подряд
+    meta/<col>.off.npy   — смещения строк (int64, count + 1)
+    meta/<col>.null.npy  — маска пропусков (только если они есть)
+    meta/<col>.npy       — числовая/булева колонка
+    filters/<field>.*    — инвертированный индекс по метаданным (город, профиль, специализация):
+                           keys.json — нормализованные значения, rows.npy — номера строк,
+                           сгруппированные по значению, off.npy — границы групп (CSR)
+    lexical/             — BM25-индекс по тексту вакансии (формат в src/rag/lexical.py)
+
+Все файлы открываются лениво (mmap), поэтому N воркеров uvicorn делят одну копию
+в page cache, а время старта не зависит от размера корпуса.
+"""
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import time
+import uuid
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+from src.common.text import reference_snippet
+from src.rag.index import load_index
+from src.rag.lexical import LexicalIndex
+
+STORE_FORMAT = 1
+MANIFEST = "manifest.json"
+EMBEDDINGS = "embeddings.f32"
+CURRENT = "CURRENT"
+# Сколько старых версий оставлять на диске (воркеры могут еще держать их через mmap)
+KEEP_VERSIONS = 3
+# Поля, по которым строится инвертированный индекс для фильтрации поиска
+FILTER_FIELDS = ("city", "profile", "specialization")
+# Текст для BM25: embed_text ретривера (заголовок, специализация, начало описания)
+LEXICAL_TEXT = "embed_text"
+# Готовое начало описания для промпта LLM: полный текст читается только по требованию
+SNIPPET_COLUMN = "vacancy_snippet"
+SNIPPET_CHARS = 300
+
+
+def normalize_value(value) -> str:
+    """Ключ фильтра: регистр, ё/е и лишние пробелы не важны"""
+    return " ".join(str(value).lower().replace("ё", "е").split())
+
+
+class StringColumn:
+    def __init__(self, meta_dir: pathlib.Path, name: str):
+        data_path = meta_dir / f"{name}.bin"
+        # np.memmap не умеет открывать пустые файлы
+        if data_path.stat().st_size:
+            self.data = np.memmap(data_path, dtype=np.uint8, mode="r")
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+        self.offsets = np.load(meta_dir / f"{name}.off.npy", mmap_mode="r")
+        null_path = meta_dir / f"{name}.null.npy"
+        self.nulls = np.load(null_path, mmap_mode="r") if null_path.exists() else None
+
+    def __getitem__(self, row: int):
+        if self.nulls is not None and self.nulls[row]:
+            return None
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def to_list(self) -> list:
+        return [self[row] for row in range(len(self.offsets) - 1)]
+
+
+class ArrayColumn:
+    def __init__(self, meta_dir: pathlib.Path, name: str):
+        self.values = np.load(meta_dir / f"{name}.npy", mmap_mode="r")
+
+    def __getitem__(self, row: int):
+        return self.values[row].item()
+
+    def to_list(self) -> list:
+        return self.values.tolist()
+
+
+def _sha256(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksums(path: pathlib.Path) -> dict:
+    """sha256 всех файлов версии, кроме манифеста: путь относительно каталога -> хэш"""
+    return {
+        file.relative_to(path).as_posix(): _sha256(file)
+        for file in sorted(path.rglob("*")) if file.is_file() and file.name != MANIFEST
+    }
+
+
+def _write_column(meta_dir: pathlib.Path, name: str, series: pd.Series) -> str:
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        np.save(meta_dir / f"{name}.npy", series.to_numpy())
+        return "array"
+
+    nulls = series.isna().to_numpy()
+    encoded = [b"" if is_null else str(v).encode("utf-8") for v, is_null in zip(series, nulls)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(meta_dir / f"{name}.bin", "wb") as f:
+        for b in encoded:
+            f.write(b)
+    np.save(meta_dir / f"{name}.off.npy", offsets)
+    if nulls.any():
+        np.save(meta_dir / f"{name}.null.npy", nulls)
+    return "string"
+
+
+def _write_postings(filters_dir: pathlib.Path, name: str, series: pd.Series):
+    keys = series.map(normalize_value, na_action="ignore")
+    codes, uniques = pd.factorize(keys)
+    valid = codes >= 0
+    # Стабильная сортировка: внутри значения номера строк идут по возрастанию
+    rows = np.flatnonzero(valid)[np.argsort(codes[valid], kind="stable")].astype(np.int32)
+    offsets = np.r_[0, np.cumsum(np.bincount(codes[valid], minlength=len(uniques)))].astype(np.int64)
+
+    with open(filters_dir / f"{name}.keys.json", "w", encoding="utf-8") as f:
+        json.dump(list(uniques), f, ensure_ascii=False)
+    np.save(filters_dir / f"{name}.rows.npy", rows)
+    np.save(filters_dir / f"{name}.off.npy", offsets)
+
+
+class PostingsColumn:
+    """Значение поля -> отсортированные номера строк с этим значением"""
+
+    def __init__(self, filters_dir: pathlib.Path, name: str):
+        with open(filters_dir / f"{name}.keys.json", encoding="utf-8") as f:
+            self.keys = {key: i for i, key in enumerate(json.load(f))}
+        self.rows = np.load(filters_dir / f"{name}.rows.npy", mmap_mode="r")
+        self.offsets = np.load(filters_dir / f"{name}.off.npy", mmap_mode="r")
+
+    def rows_for(self, value) -> np.ndarray:
+        i = self.keys.get(normalize_value(value))
+        if i is None:
+            return np.zeros(0, dtype=np.int32)
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+
+class RecordView(Mapping):
+    """
+    Запись-референс без копии данных: два слота (колонки хранилища и номер строки),
+    поле декодируется из mmap только при обращении. Ведет себя как dict
+    (r["vacancy_title"], r.get(...), dict(r), сравнение со словарем).
+    """
+    __slots__ = ("_columns", "_row")
+
+    def __init__(self, columns: dict, row: int):
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, name: str):
+        return self._columns[name][self._row]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return f"RecordView(row={self._row})"
+
+
+class RecordList:
+    """Последовательность записей: RecordView создается на обращение, строки не декодируются"""
+
+    def __init__(self, store: "EmbeddingStore"):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, row: int) -> RecordView:
+        if not 0 <= row < len(self.store):
+            raise IndexError(row)
+        return RecordView(self.store.columns, row)
+
+
+class EmbeddingStore:
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        with open(self.path / MANIFEST, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        if self.count:
+            self.vectors = np.memmap(self.path / EMBEDDINGS, dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+        meta_dir = self.path / "meta"
+        self.columns = {}
+        for name, kind in self.manifest["columns"].items():
+            column_cls = StringColumn if kind == "string" else ArrayColumn
+            self.columns[name] = column_cls(meta_dir, name)
+
+        # Версии без фильтров (собранные раньше) просто ищут без них
+        self.filters = {
+            name: PostingsColumn(self.path / "filters", name) for name in self.manifest.get("filters", [])
+        }
+
+        lexical = self.manifest.get("lexical")
+        self.lexical = LexicalIndex.load(self.path / "lexical", lexical) if lexical else None
+
+        index_info = self.manifest["index"]
+        self.index = load_index(index_info["backend"], self.path, index_info["params"], self.vectors)
+        self.records = RecordList(self)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, row: int) -> dict:
+        return {name: column[row] for name, column in self.columns.items()}
+
+    def filter_rows(self, conditions: dict):
+        """
+        Строки, подходящие под все условия {поле: значение} (пересечение постингов).
+        Пустые значения и поля без индекса не ограничивают выборку;
+        None — ограничений нет вовсе.
+        """
+        rows = None
+        for name, value in conditions.items():
+            if name not in self.filters or value is None or not normalize_value(value):
+                continue
+            postings = self.filters[name].rows_for(value)
+            rows = postings if rows is None else np.intersect1d(rows, postings, assume_unique=True)
+            if len(rows) == 0:
+                break
+        return rows
+
+    @staticmethod
+    def exists(path: pathlib.Path) -> bool:
+        return (pathlib.Path(path) / MANIFEST).exists()
+
+    @staticmethod
+    def write(path: pathlib.Path, index, df: pd.DataFrame, model_name: str):
+        """
+        Записывает обученный индекс и метаданные. Строки сохраняются в порядке
+        index.ids (для IVF — сгруппированными по спискам), чтобы при загрузке
+        индекс работал прямо поверх memmap без перестановок.
+        Запись идет во временный каталог, который затем переименовывается.
+        """
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        (tmp_path / "meta").mkdir(parents=True)
+
+        vectors = np.ascontiguousarray(index.vectors, dtype=np.float32)
+        df = df.reset_index(drop=True)
+        if index.ids is not None:
+            df = df.iloc[index.ids].reset_index(drop=True)
+        if "vacancy_description" in df.columns and SNIPPET_COLUMN not in df.columns:
+            df = df.assign(**{SNIPPET_COLUMN: [
+                reference_snippet(None if pd.isna(d) else d, SNIPPET_CHARS) for d in df["vacancy_description"]
+            ]})
+
+        vectors.tofile(tmp_path / EMBEDDINGS)
+        columns = {name: _write_column(tmp_path / "meta", name, df[name]) for name in df.columns}
+        filters = [name for name in FILTER_FIELDS if name in df.columns]
+        if filters:
+            (tmp_path / "filters").mkdir()
+        for name in filters:
+            _write_postings(tmp_path / "filters", name, df[name])
+        lexical = None
+        if LEXICAL_TEXT in df.columns:
+            lexical = LexicalIndex().fit(df[LEXICAL_TEXT].tolist()).save(tmp_path / "lexical")
+        params = index.save(tmp_path)
+
+        manifest = {
+            "format": STORE_FORMAT,
+            "count": int(len(vectors)),
+            "dim": int(vectors.shape[1]),
+            "model": model_name,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "index": {"backend": index.name, "params": params},
+            "columns": columns,
+            "filters": filters,
+            "lexical": lexical,
+            "sha256": _checksums(tmp_path),
+        }
+        with open(tmp_path / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        if path.exists():
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def verify(path: pathlib.Path) -> list:
+        """
+        Сверяет файлы версии с sha256 из манифеста. Возвращает список
+        поврежденных или отсутствующих файлов (пустой — версия цела).
+        Версии, записанные до появления контрольных сумм, не проверяются.
+        """
+        path = pathlib.Path(path)
+        with open(path / MANIFEST, encoding="utf-8") as f:
+            expected = json.load(f).get("sha256", {})
+        return [
+            name for name, digest in expected.items()
+            if not (path / name).is_file() or _sha256(path / name) != digest
+        ]
+
+
+def current_version_path(root: pathlib.Path):
+    """Каталог активной версии индекса или None, если индекса еще нет"""
+    root = pathlib.Path(root)
+    pointer = root / CURRENT
+    if pointer.exists():
+        version = pointer.read_text(encoding="utf-8").strip()
+        if EmbeddingStore.exists(root / version):
+            return root / version
+    # Плоский формат без версий (первая версия mmap-хранилища)
+    if EmbeddingStore.exists(root):
+        return root
+    return None
+
+
+def new_version_name() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def publish_version(root: pathlib.Path, version: str):
+    """Атомарно переключает CURRENT на новую версию и чистит самые старые"""
+    root = pathlib.Path(root)
+    tmp_pointer = root / f"{CURRENT}.tmp-{os.getpid()}"
+    tmp_pointer.write_text(version, encoding="utf-8")
+    os.replace(tmp_pointer, root / CURRENT)
+
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and EmbeddingStore.exists(p))
+    for old in versions[:-KEEP_VERSIONS]:
+        if old.name != version:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def vectors_from_legacy_index(index) -> np.ndarray:
+    """Достает исходные векторы из индекса старого pickle (sklearn или index.py)"""
+    if hasattr(index, "_fit_X"):
+        # sklearn NearestNeighbors
+        return np.asarray(index._fit_X, dtype=np.float32)
+    vectors = np.asarray(index.vectors, dtype=np.float32)
+    if getattr(index, "ids", None) is not None:
+        restored = np.empty_like(vectors)
+        restored[index.ids] = vectors
+        return restored
+    return vectors
@@ -0,0 +1,143 @@
+import asyncio
+import time
+import threading
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.api.main import app
+from src.api.models import VacancyOut
+
+client = TestClient(app)
+
+DELAY = 0.2
+
+
+class ConcurrencyMeter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def enter(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+class SlowOptimizer(ConcurrencyMeter):
+    """Заглушка LLM: спит как сетевой вызов и считает параллельные вызовы"""
+
+    def __init__(self):
+        super().__init__()
+        self.deadlines = []
+
+    async def aoptimize(self, vac, refs, deadline=None):
+        self.deadlines.append(deadline)
+        self.enter()
+        await asyncio.sleep(DELAY)
+        self.leave()
+        return VacancyOut(
+            input_id=vac.input_id,
+            profile=vac.profile,
+            city=vac.city,
+            vacancy_title=vac.vacancy_title,
+            vacancy_description=vac.vacancy_description,
+            specialization=vac.specialization,
+            improvement_notes=[f"refs={len(refs)}"],
+        )
+
+
+class SlowRetriever(ConcurrencyMeter):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def search(self, query, limit=3, filters=None):
+        return self.search_many([query], limit, [filters])[0]
+
+    def search_many(self, queries, limit=3, filters=None):
+        self.calls.append((queries, filters))
+        self.enter()
+        time.sleep(DELAY)
+        self.leave()
+        return [[{"vacancy_title": query}] for query in queries]
+
+
+def make_payload(n):
+    return {"vacancies": [{
+        "input_id": f"vac_{i}",
+        "profile": "Продавец-кассир",
+        "city": "Москва",
+        "vacancy_title": f"Продавец {i}",
+        "vacancy_description": "Текст",
+        "specialization": "Розница",
+    } for i in range(n)]}
+
+
+def test_batch_runs_concurrently_and_keeps_order():
+    fake = SlowOptimizer()
+    with patch("src.api.main.optimizer", fake), patch("src.api.main.retriever", None), \
+            patch("src.api.main.executor", None):
+        start = time.perf_counter()
+        response = client.post("/optimize", json=make_payload(8))
+        elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    ids = [r["input_id"] for r in response.json()["results"]]
+    assert ids == [f"vac_{i}" for i in range(8)]
+    # Последовательно было бы 8 * DELAY
+    assert elapsed < 4 * DELAY
+    assert fake.max_active > 1
+
+
+def test_batch_retrieval_is_one_call():
+    fake_retriever = SlowRetriever()
+    with patch("src.api.main.optimizer", SlowOptimizer()), patch("src.api.main.retriever", fake_retriever), \
+            patch("src.api.main.executor", None):
+        response = client.post("/optimize", json=make_payload(6))
+
+    assert response.status_code == 200
+    assert len(fake_retriever.calls) == 1
+    queries, filters = fake_retriever.calls[0]
+    assert queries == [f"Продавец {i} Розница" for i in range(6)]
+    assert filters[0] == {"city": "Москва", "profile": "Продавец-кассир", "specialization": "Розница"}
+    assert all(r["improvement_notes"] == ["refs=1"] for r in response.json()["results"])
+
+
+def test_retrieval_pool_limit_is_respected():
+    from concurrent.futures import ThreadPoolExecutor
+
+    fake_retriever = SlowRetriever()
+    pool = ThreadPoolExecutor(max_workers=2)
+    with patch("src.api.main.optimizer", SlowOptimizer()), patch("src.api.main.retriever", fake_retriever), \
+            patch("src.api.main.executor", pool):
+        # Батчи от разных клиентов делят общий пул поиска
+        with ThreadPoolExecutor(max_workers=4) as clients:
+            responses = list(clients.map(lambda _: client.post("/optimize", json=make_payload(2)), range(4)))
+    pool.shutdown()
+
+    assert all(r.status_code == 200 for r in responses)
+    assert fake_retriever.max_active == 2
+    assert len(fake_retriever.calls) == 4
+
+
+def test_deadline_is_propagated():
+    fake = SlowOptimizer()
+    payload = make_payload(2)
+    payload["deadline_seconds"] = 30
+    with patch("src.api.main.optimizer", fake), patch("src.api.main.retriever", None), \
+            patch("src.api.main.executor", None):
+        before = time.monotonic()
+        response = client.post("/optimize", json=payload)
+
+    assert response.status_code == 200
+    assert all(before + 29 < d <= time.monotonic() + 30 for d in fake.deadlines)
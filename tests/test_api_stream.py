@@ -0,0 +1,84 @@
+import asyncio
+import json
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.api.main import app
+from src.api.models import VacancyOut
+from test_api_concurrency import make_payload
+
+client = TestClient(app)
+
+
+class StreamingOptimizer:
+    async def astream_optimize(self, vac, refs, deadline=None):
+        # Первая вакансия генерируется дольше, чтобы события перемешались
+        delay = 0.05 if vac.input_id == "vac_0" else 0.01
+        for word in ["Новый ", "текст ", vac.input_id]:
+            await asyncio.sleep(delay)
+            yield "token", word
+        yield "result", VacancyOut(
+            input_id=vac.input_id, profile=vac.profile, city=vac.city,
+            vacancy_title="Новый", vacancy_description="Новый текст " + vac.input_id,
+            specialization=vac.specialization,
+        )
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_endpoint_emits_tokens_and_results():
+    with patch("src.api.main.optimizer", StreamingOptimizer()), patch("src.api.main.retriever", None), \
+            patch("src.api.main.executor", None):
+        response = client.post("/optimize/stream", json=make_payload(3))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+
+    assert events[-1] == ("done", {"count": 3})
+    # Токены приходят раньше результата своей вакансии
+    first_event = events[0]
+    assert first_event[0] == "token"
+
+    for i in range(3):
+        tokens = [d["delta"] for e, d in events if e == "token" and d["index"] == i]
+        assert "".join(tokens) == f"Новый текст vac_{i}"
+        results = [d["result"] for e, d in events if e == "result" and d["index"] == i]
+        assert len(results) == 1 and results[0]["input_id"] == f"vac_{i}"
+
+    # Быстрые вакансии завершаются, не дожидаясь медленной первой
+    result_order = [d["index"] for e, d in events if e == "result"]
+    assert result_order[-1] == 0
+
+
+class FailingStreamOptimizer(StreamingOptimizer):
+    async def astream_optimize(self, vac, refs, deadline=None):
+        if vac.input_id == "vac_1":
+            # Сбой до первого события (например, при сборке промпта)
+            raise ValueError("сломался промпт")
+        async for event in super().astream_optimize(vac, refs, deadline):
+            yield event
+
+
+def test_stream_reports_failed_vacancy_and_finishes():
+    with patch("src.api.main.optimizer", FailingStreamOptimizer()), patch("src.api.main.retriever", None), \
+            patch("src.api.main.executor", None):
+        response = client.post("/optimize/stream", json=make_payload(3))
+
+    assert response.status_code == 200
+    events = parse_sse(response.text)
+    assert events[-1] == ("done", {"count": 3})
+    errors = [d for e, d in events if e == "error"]
+    assert errors == [{"index": 1, "input_id": "vac_1", "error": "сломался промпт"}]
+    assert sorted(d["index"] for e, d in events if e == "result") == [0, 2]
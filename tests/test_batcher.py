@@ -0,0 +1,81 @@
+import threading
+import time
+import numpy as np
+import pytest
+import sys
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.rag.batcher import MicroBatchEncoder
+
+
+class CountingModel:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self.lock = threading.Lock()
+
+    def encode(self, texts, **kwargs):
+        with self.lock:
+            self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("model is down")
+        time.sleep(0.01)
+        return np.array([[len(t), ord(t[0])] for t in texts], dtype=np.float32)
+
+
+def test_concurrent_queries_share_one_batch():
+    model = CountingModel()
+    encoder = MicroBatchEncoder(model, max_batch_size=16, max_wait_ms=50)
+    texts = [f"вакансия {i}" for i in range(16)]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        vectors = list(pool.map(encoder.encode, texts))
+
+    # Каждый получил свой вектор
+    for text, vec in zip(texts, vectors):
+        assert vec.tolist() == [len(text), ord(text[0])]
+    assert len(model.calls) < 16
+    stats = encoder.stats()
+    assert stats["items"] == 16
+    assert 0 < stats["fill_ratio"] <= 1
+
+
+def test_duplicates_encoded_once():
+    model = CountingModel()
+    encoder = MicroBatchEncoder(model, max_batch_size=8, max_wait_ms=50)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(encoder.encode, ["курьер"] * 8))
+    assert sum(len(c) for c in model.calls) < 8
+
+
+def test_errors_reach_every_caller():
+    encoder = MicroBatchEncoder(CountingModel(fail=True), max_batch_size=4, max_wait_ms=5)
+    with pytest.raises(RuntimeError):
+        encoder.encode("кассир")
+
+
+def test_batch_size_one_is_direct_call():
+    model = CountingModel()
+    encoder = MicroBatchEncoder(model, max_batch_size=1)
+    assert encoder.encode("ab").tolist() == [2, ord("a")]
+    assert encoder._thread is None
+
+
+def test_direct_encode_many_keeps_fill_ratio_in_range():
+    """Большой готовый батч идет в модель одним вызовом, но fill_ratio не выходит за 1"""
+    model = CountingModel()
+    encoder = MicroBatchEncoder(model, max_batch_size=8, max_wait_ms=5)
+    vectors = encoder.encode_many([f"вакансия {i}" for i in range(40)])
+
+    assert len(vectors) == 40 and len(model.calls) == 1
+    stats = encoder.stats()
+    assert stats["items"] == 40 and stats["batches"] == 5
+    assert 0 < stats["fill_ratio"] <= 1
+
+    direct = MicroBatchEncoder(CountingModel(), max_batch_size=1)
+    direct.encode_many(["а", "б", "в"])
+    assert 0 < direct.stats()["fill_ratio"] <= 1
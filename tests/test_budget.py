@@ -0,0 +1,102 @@
+import sys
+import pathlib
+from unittest.mock import patch
+import pytest
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.rag import budget
+from src.rag.budget import PromptBudget, TokenCounter
+
+TEMPLATE = ["system " * 20, "user " * 100]
+
+
+def make_budget(prompt_tokens=1000, context_tokens=32768):
+    return PromptBudget(TokenCounter(name=""), prompt_tokens=prompt_tokens, context_tokens=context_tokens)
+
+
+def test_short_prompt_is_untouched():
+    plan = make_budget().plan(TEMPLATE, "Доставка заказов", ["- Пример 1\n", "- Пример 2\n"])
+    assert plan["description"] == "Доставка заказов"
+    assert len(plan["references"]) == 2
+    assert not plan["trimmed"]
+    # Короткой вакансии хватает минимального ответа
+    assert plan["max_tokens"] == budget.LLM_MIN_OUTPUT_TOKENS
+
+
+def test_references_are_dropped_before_description():
+    counter = TokenCounter(name="")
+    description = "слово " * 200
+    refs = ["- Пример 1: " + "а" * 400 + "\n", "- Пример 2: " + "б" * 400 + "\n"]
+    plan = make_budget().plan(TEMPLATE, description, refs)
+
+    assert plan["description"] == description
+    assert plan["references"] == refs[:1]
+    assert plan["trimmed"]
+    assert plan["prompt_tokens"] <= 1000
+    # Ответ растет с длиной описания
+    assert plan["max_tokens"] > budget.LLM_MIN_OUTPUT_TOKENS
+    assert plan["max_tokens"] >= counter.count(description)
+
+
+def test_long_description_is_compressed_and_truncated():
+    description = "<p>Обязанности:</p>\n\n" + "доставка   заказов клиентам\n" * 1000
+    plan = make_budget().plan(TEMPLATE, description, ["- Пример 1\n"])
+
+    assert plan["trimmed"]
+    assert plan["references"] == []
+    assert plan["prompt_tokens"] <= 1000
+    assert plan["description"].startswith("Обязанности: доставка заказов")
+    assert plan["description"].endswith(budget.TRUNCATION_MARK)
+    assert budget.LLM_MIN_OUTPUT_TOKENS < plan["max_tokens"] <= budget.LLM_MAX_OUTPUT_TOKENS
+
+
+def test_max_tokens_respects_context_window():
+    plan = make_budget(prompt_tokens=5000, context_tokens=5000).plan(TEMPLATE, "текст " * 3000, [])
+    assert plan["prompt_tokens"] + plan["max_tokens"] <= 5000
+    assert plan["max_tokens"] >= budget.LLM_MIN_OUTPUT_TOKENS
+
+
+def test_long_field_is_capped_and_oversized_template_is_rejected():
+    prompt_budget = make_budget()
+    title = "Продавец-кассир " * 200
+    capped = prompt_budget.cap_field(title)
+    assert prompt_budget.counter.count(capped) <= budget.FIELD_TOKENS
+    assert capped.endswith(budget.TRUNCATION_MARK)
+    assert prompt_budget.cap_field("Курьер") == "Курьер"
+
+    with pytest.raises(ValueError, match="не помещается"):
+        prompt_budget.plan(["x" * 5000], "текст", [])
+
+
+def test_usage_is_recorded():
+    prompt_budget = make_budget()
+    plan = prompt_budget.plan(TEMPLATE, "текст", [])
+    prompt_budget.record(plan, completion_tokens=50, latency=0.1)
+    usage = type("Usage", (), {"prompt_tokens": 300, "completion_tokens": 70})()
+    prompt_budget.record(plan, completion_tokens=50, latency=0.1, usage=usage)
+
+    stats = prompt_budget.stats()
+    assert stats["calls"] == 2
+    assert stats["prompt_tokens"] == plan["prompt_tokens"] + 300
+    assert stats["completion_tokens"] == 120
+    assert stats["exact_tokenizer"] is False
+
+
+def test_missing_tokenizer_falls_back_to_estimate():
+    """Офлайн токенизатор не грузится: одна попытка, дальше оценка по длине"""
+    calls = []
+
+    def offline(name):
+        calls.append(name)
+        raise OSError("нет сети")
+
+    counter = TokenCounter(name="Qwen/Qwen2.5-72B-Instruct")
+    with patch("transformers.AutoTokenizer.from_pretrained", offline):
+        assert counter.warm_up() is None
+        assert counter.warm_up() is None
+    assert len(calls) == 1
+    assert not counter.exact
+    assert counter.count("а" * 25) == 10
+    assert counter.truncate("слово " * 100, 10).endswith(budget.TRUNCATION_MARK)
@@ -0,0 +1,82 @@
+import numpy as np
+import sys
+import pathlib
+from unittest.mock import patch
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.rag.cache import EmbeddingCache, RewriteCache, normalize_query
+from test_store import make_retriever, make_corpus
+from src.rag.index import create_index
+
+
+def test_normalize_query():
+    assert normalize_query("  Продавец-кассир   <b>Розница</b> ") == "Продавец-кассир Розница"
+
+
+def test_lru_eviction_and_counters():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("a", np.ones(3))
+    cache.put("b", np.ones(3))
+    assert cache.get("a") is not None  # "a" становится самым свежим
+    cache.put("c", np.ones(3))
+
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["size"] == 2
+
+
+def test_ttl_expiry():
+    cache = EmbeddingCache(max_size=10, ttl=60)
+    with patch("src.rag.cache.time.time", return_value=1000.0):
+        cache.put("a", np.ones(3))
+    with patch("src.rag.cache.time.time", return_value=1030.0):
+        assert cache.get("a") is not None
+    with patch("src.rag.cache.time.time", return_value=1100.0):
+        assert cache.get("a") is None
+
+
+def test_shared_store_between_workers(tmp_path):
+    path = str(tmp_path / "queries.sqlite")
+    worker_a = EmbeddingCache(max_size=10, shared_path=path)
+    worker_b = EmbeddingCache(max_size=10, shared_path=path)
+
+    worker_a.put("курьер", np.arange(4, dtype=np.float32))
+    vec = worker_b.get("курьер")
+    assert np.array_equal(vec, np.arange(4, dtype=np.float32))
+    assert worker_b.stats()["shared_hits"] == 1
+
+
+def test_repeated_title_skips_encoder(tmp_path):
+    vectors, df = make_corpus(dim=16)
+    retriever = make_retriever(tmp_path)
+    retriever.index = create_index("exact").fit(vectors)
+    retriever.vacancies = df.to_dict("records")
+
+    first = retriever.search("Продавец-кассир Розница")
+    second = retriever.search("  Продавец-кассир   <b>Розница</b>")
+    assert first == second
+    # Кодируется исходный запрос, а не ключ кэша
+    assert retriever.model.encoded == ["Продавец-кассир Розница"]
+    assert retriever.query_cache.stats()["hits"] == 1
+
+    # Регистр меняет эмбеддинг, поэтому это другой ключ
+    retriever.search("продавец-кассир розница")
+    assert retriever.model.encoded == ["Продавец-кассир Розница", "продавец-кассир розница"]
+
+
+def test_rewrite_cache_survives_restart_and_evicts(tmp_path):
+    path = str(tmp_path / "rewrites.sqlite")
+    cache = RewriteCache(path, max_entries=2)
+    with patch("src.rag.cache.time.time", side_effect=[1.0, 2.0, 3.0, 4.0]):
+        cache.put("a", {"vacancy_title": "A"})
+        cache.put("b", {"vacancy_title": "B"})
+        assert cache.get("a") == {"vacancy_title": "A"}  # "a" читали недавно
+        cache.put("c", {"vacancy_title": "C"})
+
+    restarted = RewriteCache(path, max_entries=2)
+    assert restarted.get("b") is None
+    assert restarted.get("a") == {"vacancy_title": "A"}
+    assert restarted.get("c") == {"vacancy_title": "C"}
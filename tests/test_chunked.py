@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import sys
+import pathlib
+from unittest.mock import patch
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.data import prepare, chunked
+
+
+def write_raw_parts(raw_dir: pathlib.Path, n_vacancies=300, days=12, seed=0):
+    """Сырые партиции по дням, как их пишет loader.py"""
+    rng = np.random.default_rng(seed)
+    raw_dir.mkdir()
+    responses = np.zeros(n_vacancies, dtype=int)
+    for day in range(days):
+        date = pd.Timestamp("2024-05-01") + pd.Timedelta(days=day)
+        alive = rng.random(n_vacancies) < 0.7
+        responses[alive] += rng.integers(0, 15, alive.sum())
+        ids = np.flatnonzero(alive)
+        pd.DataFrame({
+            "vacancy_id": [f"v{i}" for i in ids],
+            "loaded_at": date + pd.to_timedelta(rng.integers(0, 86_400, len(ids)), unit="s"),
+            "total_responses": responses[ids],
+            "profile": "Курьер",
+            "city": np.where(ids % 5 == 0, None, "Москва"),
+            "vacancy_title": [f"Курьер {i}" for i in ids],
+            "vacancy_description": [f"Описание {i} версии {day}" for i in ids],
+            "specialization": "Доставка",
+        }).to_parquet(raw_dir / f"part-{date:%Y-%m-%d}.parquet", index=False)
+
+
+def test_chunked_matches_in_memory(tmp_path):
+    write_raw_parts(tmp_path / "raw")
+    in_memory = tmp_path / "in_memory.parquet"
+    streamed = tmp_path / "streamed.parquet"
+
+    with patch.object(prepare, "RAW_DIR", tmp_path / "raw"), patch.object(prepare, "DATA_DIR", tmp_path), \
+            patch.object(prepare, "OUTPUT_FILE", in_memory), patch.object(chunked, "SAMPLE_ROWS", 100):
+        prepare.main()
+        # Бюджет заведомо меньше данных: должно получиться несколько партиций
+        stats = chunked.run_chunked(1, output_file=streamed)
+
+    assert stats["n_buckets"] > 1
+    assert stats["rows"] == sum(len(pd.read_parquet(p)) for p in (tmp_path / "raw").glob("*.parquet"))
+    assert stats["peak_rss_mb"] > 0
+
+    expected = pd.read_parquet(in_memory).sort_values("vacancy_id").reset_index(drop=True)
+    actual = pd.read_parquet(streamed).sort_values("vacancy_id").reset_index(drop=True)
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    # Spill-файлы убраны за собой
+    assert not list(tmp_path.glob("prepare-spill-*"))
+
+
+def test_chunked_workers_share_one_pool(tmp_path):
+    write_raw_parts(tmp_path / "raw")
+    single = tmp_path / "single.parquet"
+    pooled = tmp_path / "pooled.parquet"
+    pools = []
+    original = chunked.ProcessPoolExecutor
+
+    def counting_pool(*args, **kwargs):
+        pools.append(kwargs)
+        return original(*args, **kwargs)
+
+    with patch.object(prepare, "RAW_DIR", tmp_path / "raw"), patch.object(prepare, "DATA_DIR", tmp_path), \
+            patch.object(chunked, "SAMPLE_ROWS", 100):
+        chunked.run_chunked(1, output_file=single)
+        with patch.object(chunked, "ProcessPoolExecutor", counting_pool):
+            stats = chunked.run_chunked(1, output_file=pooled, workers=2)
+
+    assert stats["n_buckets"] > 1
+    assert pools == [{"max_workers": 2}]
+    # Пик воркеров попадает в отчет
+    assert stats["workers_peak_rss_mb"] > 0
+
+    expected = pd.read_parquet(single).sort_values("vacancy_id").reset_index(drop=True)
+    actual = pd.read_parquet(pooled).sort_values("vacancy_id").reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected)
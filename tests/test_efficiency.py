@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.data.prepare import calculate_peak_efficiency, calculate_peak_efficiency_batch
+
+
+def make_history(seed, n_vacancies=200, max_snapshots=30):
+    """Случайная история откликов: неравномерные даты, нули в начале, дубли дат"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for v in range(n_vacancies):
+        n = int(rng.integers(1, max_snapshots))
+        start = np.datetime64("2024-01-01") + np.timedelta64(int(rng.integers(0, 60)), "D")
+        offsets = np.sort(rng.integers(0, 40 * 24, size=n))  # часы
+        dates = start + offsets.astype("timedelta64[h]")
+        responses = np.cumsum(rng.integers(0, 15, size=n))
+        # Часть вакансий стартует с нулей (модерация)
+        zeros = int(rng.integers(0, n + 1))
+        responses[:zeros] = 0
+        for d, r in zip(dates, responses):
+            rows.append((f"v{v}", d, int(r)))
+    df = pd.DataFrame(rows, columns=["vacancy_id", "loaded_at", "total_responses"])
+    df["loaded_at"] = df["loaded_at"].astype("datetime64[ns]")
+    # Перемешиваем, чтобы проверить глобальную сортировку
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def reference_efficiency(df):
+    result = {}
+    for vac_id, group in df.groupby("vacancy_id"):
+        group = group.sort_values("loaded_at", kind="stable")
+        result[vac_id] = calculate_peak_efficiency(
+            group["loaded_at"].values, group["total_responses"].values
+        )
+    return result
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_matches_per_group_loop(seed):
+    df = make_history(seed)
+    uniq_ids, efficiency, last_idx, _ = calculate_peak_efficiency_batch(
+        df["vacancy_id"].values, df["loaded_at"].values, df["total_responses"].values
+    )
+    expected = reference_efficiency(df)
+
+    assert list(uniq_ids) == sorted(expected)
+    for vac_id, eff in zip(uniq_ids, efficiency):
+        assert eff == expected[vac_id]
+
+    # last_idx указывает на самую свежую запись вакансии
+    latest = df.groupby("vacancy_id")["loaded_at"].max()
+    picked = df.iloc[last_idx]
+    assert (picked["loaded_at"].values == latest.loc[picked["vacancy_id"]].values).all()
+
+
+def test_single_snapshot_and_all_zeros():
+    df = pd.DataFrame({
+        "vacancy_id": ["a", "b", "b", "b"],
+        "loaded_at": pd.to_datetime(["2024-01-01", "2024-01-01", "2024-01-03", "2024-01-05"]).astype("datetime64[ns]"),
+        "total_responses": [10, 0, 0, 0],
+    })
+    uniq_ids, efficiency, _, _ = calculate_peak_efficiency_batch(
+        df["vacancy_id"].values, df["loaded_at"].values, df["total_responses"].values
+    )
+    assert list(uniq_ids) == ["a", "b"]
+    assert list(efficiency) == [0.0, 0.0]
@@ -0,0 +1,92 @@
+import subprocess
+import threading
+import time
+import sys
+import pathlib
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.api import main
+from src.rag.budget import PromptBudget, TokenCounter
+
+
+class GatedRetriever:
+    """Заглушка ретривера: прогрев завершается, только когда тест откроет gate"""
+
+    def __init__(self, lazy=False):
+        self.gate = threading.Event()
+        self.ready = False
+        self.encoder = None
+        self.version = None
+        self.query_cache = type("Cache", (), {"stats": lambda self: {}})()
+
+    def warm_up(self):
+        self.gate.wait(5)
+        self.ready = True
+
+    def search(self, query, limit=3, filters=None):
+        return []
+
+
+class FailingRetriever(GatedRetriever):
+    def warm_up(self):
+        raise RuntimeError("нет модели")
+
+
+class DummyOptimizer:
+    cache = None
+    budget = PromptBudget(TokenCounter(name=""))
+
+    async def aclose(self):
+        pass
+
+
+def wait_for(client, url, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(url)
+        if response.json()["status"] == status:
+            return response
+        time.sleep(0.01)
+    raise AssertionError(f"{url} не дошел до {status}")
+
+
+def test_ready_only_after_warm_up():
+    with patch.object(main, "VacancyRetriever", GatedRetriever), \
+            patch.object(main, "VacancyOptimizer", DummyOptimizer):
+        with TestClient(main.app) as client:
+            # Порт уже принимает запросы, пока модель грузится
+            assert client.get("/health/live").json() == {"status": "alive"}
+            warming = client.get("/health/ready")
+            assert warming.status_code == 503
+            assert warming.json() == {"status": "warming"}
+            metrics = client.get("/metrics")
+            assert metrics.status_code == 200
+            assert metrics.json()["llm_tokens"]["calls"] == 0
+
+            main.retriever.gate.set()
+            ready = wait_for(client, "/health/ready", "ready")
+            assert ready.status_code == 200
+
+
+def test_failed_warm_up_is_reported():
+    with patch.object(main, "VacancyRetriever", FailingRetriever), \
+            patch.object(main, "VacancyOptimizer", DummyOptimizer):
+        with TestClient(main.app) as client:
+            failed = wait_for(client, "/health/ready", "failed")
+            assert failed.status_code == 503
+            assert "нет модели" in failed.json()["error"]
+            assert client.get("/health/live").status_code == 200
+
+
+def test_retriever_import_does_not_load_model_libraries():
+    """Импорт ретривера (и старт API) не тянет torch/sentence_transformers"""
+    code = (
+        "import sys; import src.rag.retriever; "
+        "print('sentence_transformers' in sys.modules, 'torch' in sys.modules)"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=root_dir, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False"]
@@ -0,0 +1,66 @@
+import shutil
+import numpy as np
+import pandas as pd
+import sys
+import pathlib
+from unittest.mock import patch
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.data import prepare, incremental
+
+
+def write_history(raw_dir: pathlib.Path, days=20, n_vacancies=150, seed=0):
+    """Ежедневные партиции; отклики иногда падают, чтобы окна не были монотонными"""
+    rng = np.random.default_rng(seed)
+    raw_dir.mkdir()
+    for day in range(days):
+        date = pd.Timestamp("2024-06-01") + pd.Timedelta(days=day)
+        ids = np.flatnonzero(rng.random(n_vacancies) < 0.4 + 0.5 * (np.arange(n_vacancies) % 2))
+        # По два снимка в день, иногда с одинаковым временем
+        ids = np.repeat(ids, 2)
+        seconds = rng.integers(0, 4, len(ids)) * 3600
+        pd.DataFrame({
+            "vacancy_id": [f"v{i}" for i in ids],
+            "loaded_at": date + pd.to_timedelta(seconds, unit="s"),
+            "total_responses": rng.integers(0, 60, len(ids)),
+            "profile": "Продавец",
+            "city": np.where(ids % 3 == 0, None, "Казань"),
+            "vacancy_title": [f"Продавец {i}" for i in ids],
+            "vacancy_description": [f"Описание {i} день {day} #{k}" for k, i in enumerate(ids)],
+            "specialization": "Розница",
+        }).to_parquet(raw_dir / f"part-{date:%Y-%m-%d}.parquet", index=False)
+
+
+def test_incremental_equals_full_recompute(tmp_path):
+    write_history(tmp_path / "history")
+    days = sorted((tmp_path / "history").glob("part-*.parquet"))
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    full = tmp_path / "full.parquet"
+    inc = tmp_path / "inc.parquet"
+    state = tmp_path / "state.parquet"
+
+    with patch.object(prepare, "RAW_DIR", raw_dir):
+        # Первый запуск по 12 дням, затем по одному дню
+        for p in days[:12]:
+            shutil.copy(p, raw_dir / p.name)
+        incremental.run_incremental(state_file=state, output_file=inc)
+
+        for p in days[12:]:
+            shutil.copy(p, raw_dir / p.name)
+            stats = incremental.run_incremental(state_file=state, output_file=inc)
+            # Читаются только строки нового дня
+            assert stats["new_rows"] == len(pd.read_parquet(p))
+
+        with patch.object(prepare, "OUTPUT_FILE", full):
+            prepare.main()
+
+        # Повторный запуск без новых данных ничего не меняет
+        assert incremental.run_incremental(state_file=state, output_file=inc)["new_rows"] == 0
+
+    expected = pd.read_parquet(full)
+    actual = pd.read_parquet(inc)
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
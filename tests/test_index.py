@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.rag.index import create_index, ExactIndex, IVFIndex, QuantizedIndex, SQ8Index, PQIndex
+from src.rag.bench_index import synthetic_vectors, recall_at_k
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    return synthetic_vectors(3000, dim=32, n_clusters=40)
+
+
+def test_exact_matches_sklearn(corpus):
+    from sklearn.neighbors import NearestNeighbors
+
+    queries = corpus[:20] + 0.1
+    nn = NearestNeighbors(metric="cosine").fit(corpus)
+    expected_dist, expected_idx = nn.kneighbors(queries, n_neighbors=5)
+
+    dist, idx = ExactIndex().fit(corpus).kneighbors(queries, n_neighbors=5)
+    assert (idx == expected_idx).all()
+    assert np.allclose(dist, expected_dist, atol=1e-5)
+
+
+def test_ivf_full_probe_is_exact(corpus):
+    queries = corpus[:20] + 0.1
+    _, expected = ExactIndex().fit(corpus).kneighbors(queries, n_neighbors=5)
+
+    ivf = IVFIndex(n_lists=16, n_probe=16).fit(corpus)
+    _, idx = ivf.kneighbors(queries, n_neighbors=5)
+    assert (idx == expected).all()
+
+
+def test_ivf_recall(corpus):
+    rng = np.random.default_rng(0)
+    queries = corpus[rng.choice(len(corpus), 50, replace=False)] + 0.05
+    _, truth = ExactIndex().fit(corpus).kneighbors(queries, n_neighbors=10)
+
+    _, found = create_index("ivf", n_probe=8).fit(corpus).kneighbors(queries, n_neighbors=10)
+    assert recall_at_k(found, truth) > 0.9
+
+
+@pytest.mark.parametrize("index_cls, min_raw_recall, max_memory", [
+    (SQ8Index, 0.9, 0.26),
+    (PQIndex, 0.4, 0.15),
+])
+def test_quantized_recall_and_rerank(corpus, index_cls, min_raw_recall, max_memory):
+    rng = np.random.default_rng(0)
+    queries = corpus[rng.choice(len(corpus), 50, replace=False)] + 0.05
+    exact = ExactIndex().fit(corpus)
+    _, truth = exact.kneighbors(queries, n_neighbors=10)
+
+    index = index_cls(rerank=0).fit(corpus)
+    assert index.memory_bytes() <= max_memory * exact.memory_bytes()
+    _, raw = index.kneighbors(queries, n_neighbors=10)
+    assert recall_at_k(raw, truth) > min_raw_recall
+
+    # Точный пересчет кандидатов: расстояния — как у точного индекса
+    index.rerank = 10
+    dist, found = index.kneighbors(queries, n_neighbors=10)
+    assert recall_at_k(found, truth) > max(0.9, recall_at_k(raw, truth))
+    exact_dist = 1.0 - np.einsum("qd,qkd->qk", queries / np.linalg.norm(queries, axis=1, keepdims=True),
+                                 exact.vectors[found])
+    assert np.allclose(dist, exact_dist, atol=1e-5)
+
+
+@pytest.mark.parametrize("backend, params, min_recall", [
+    ("exact", {}, 1.0),
+    ("ivf", {"n_lists": 16, "n_probe": 16}, 1.0),
+    # Большой subset пересекается с n_probe списками — приближенно, как и обычный IVF
+    ("ivf", {"n_lists": 16, "n_probe": 6}, 0.85),
+    ("sq8", {"rerank": 50}, 0.95),
+    ("pq", {"rerank": 100}, 0.95),
+])
+@pytest.mark.parametrize("fraction", [0.02, 0.5])
+def test_subset_search_matches_exact_on_subset(corpus, backend, params, min_recall, fraction):
+    """Поиск с subset = поиск только по этим строкам (маленький и большой subset)"""
+    rng = np.random.default_rng(1)
+    subset = np.sort(rng.choice(len(corpus), int(len(corpus) * fraction), replace=False))
+    queries = corpus[:10] + 0.05
+
+    _, expected = ExactIndex().fit(corpus[subset]).kneighbors(queries, n_neighbors=5)
+    _, found = create_index(backend, **params).fit(corpus).kneighbors(queries, n_neighbors=5, subset=subset)
+    assert np.isin(found, subset).all()
+    assert recall_at_k(found, subset[expected]) >= min_recall
+
+
+def test_subset_smaller_than_limit():
+    vectors = np.eye(4, dtype=np.float32)
+    _, idx = ExactIndex().fit(vectors).kneighbors(vectors[:1], n_neighbors=3, subset=np.array([2, 3]))
+    assert sorted(idx[0]) == [2, 3]
+
+
+def test_limit_larger_than_corpus():
+    vectors = np.eye(3, dtype=np.float32)
+    _, idx = ExactIndex().fit(vectors).kneighbors(vectors[:1], n_neighbors=10)
+    assert idx.shape == (1, 3)
+    assert idx[0, 0] == 0
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_index("annoy")
+
+
+def test_quantized_backend_must_implement_hooks():
+    """Забытый метод квантования — ошибка при создании индекса, а не на первом запросе"""
+    class NoScores(QuantizedIndex):
+        name = "broken"
+
+        def memory_bytes(self):
+            return 0
+
+        def _train(self, vectors):
+            pass
+
+        def _encode(self, vectors):
+            return vectors
+
+    with pytest.raises(TypeError, match="_scores"):
+        NoScores()
+    with pytest.raises(TypeError):
+        QuantizedIndex()
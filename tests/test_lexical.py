@@ -0,0 +1,96 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.rag import retriever as retriever_module
+from src.rag.lexical import LexicalIndex, reciprocal_rank_fusion, tokenize
+from test_store import make_retriever, write_processed
+
+
+def test_tokenize_russian():
+    assert tokenize("Продавец-кассир") == ["продавец", "кассир"]
+    # Падежи сводятся к одной основе, ё -> е, предлоги выбрасываются
+    assert tokenize("кассира с опытом") == tokenize("Кассиры опыт") == ["кассир", "опыт"]
+    assert tokenize("Водитель категории C") == tokenize("водителя категория c")
+    assert tokenize("Учёт") == ["учет"]
+    assert tokenize(None) == []
+
+
+def naive_bm25(texts, query, k1=1.2, b=0.75):
+    docs = [tokenize(t) for t in texts]
+    avgdl = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(term in d for d in docs)
+            if not df:
+                continue
+            tf = doc.count(term)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return np.array(scores)
+
+
+def test_bm25_matches_formula(tmp_path):
+    rng = np.random.default_rng(0)
+    words = ["продавец", "кассир", "водитель", "категории", "C", "курьер", "склад", "смена"]
+    texts = [" ".join(rng.choice(words, rng.integers(1, 12))) for _ in range(300)]
+    query = "продавец-кассир склад"
+
+    index = LexicalIndex().fit(texts)
+    params = index.save(tmp_path / "lexical")
+    loaded = LexicalIndex.load(tmp_path / "lexical", params)
+
+    expected = naive_bm25(texts, query)
+    for idx in (index, loaded):
+        docs, scores = idx.search(query, limit=10)
+        assert np.allclose(scores, np.sort(expected)[::-1][:10], rtol=1e-5)
+        assert np.allclose(expected[docs], scores, rtol=1e-5)
+
+
+def test_truncated_postings_keep_best_documents():
+    texts = ["кассир"] * 50 + ["кассир кассир кассир"] * 3 + ["склад"] * 10
+    index = LexicalIndex(max_postings=5).fit(texts)
+    docs, _ = index.search("кассир", limit=3)
+    assert sorted(docs) == [50, 51, 52]
+
+    # С фильтром постинги читаются целиком
+    docs, _ = index.search("кассир", limit=3, subset=np.array([0, 1, 60]))
+    assert sorted(docs) == [0, 1]
+
+
+def test_reciprocal_rank_fusion():
+    # 7 — высоко в обоих списках, поэтому первый
+    assert reciprocal_rank_fusion([[1, 7, 3], [7, 9]], limit=3) == [7, 1, 9]
+
+
+@pytest.mark.parametrize("mode", ["hybrid", "prefilter"])
+def test_exact_title_tokens_found_by_hybrid_search(tmp_path, monkeypatch, mode):
+    """Эмбеддинги тестовой модели случайны: нужную вакансию находит только BM25"""
+    titles = [f"Сотрудник {i}" for i in range(60)] + ["Водитель категории C"]
+    df = pd.DataFrame({
+        "vacancy_id": [f"v{i}" for i in range(len(titles))],
+        "vacancy_title": titles,
+        "specialization": ["Логистика"] * len(titles),
+        "vacancy_description": ["Работа"] * len(titles),
+        "is_top_performer": [True] * len(titles),
+    })
+    retriever = make_retriever(tmp_path)
+    retriever._build_index(write_processed(tmp_path / "p.parquet", df))
+    assert retriever.store.lexical is not None
+
+    monkeypatch.setattr(retriever_module, "SEARCH_MODE", mode)
+    found = retriever.search("водителя категории C", limit=3)
+    assert len(found) == 3
+    assert "v60" in [r["vacancy_id"] for r in found]
+
+    monkeypatch.setattr(retriever_module, "SEARCH_MODE", "dense")
+    assert len(retriever.search("водителя категории C", limit=3)) == 3
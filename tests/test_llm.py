@@ -0,0 +1,260 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+import sys
+import pathlib
+from types import SimpleNamespace
+from unittest.mock import patch
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from huggingface_hub.errors import HfHubHTTPError
+from src.api.models import VacancyIn
+from src.rag import budget, llm
+from src.rag.llm import VacancyOptimizer
+
+VACANCY = VacancyIn(
+    input_id="v1", profile="Курьер", city="Москва",
+    vacancy_title="Курьер", vacancy_description="Доставка заказов", specialization="Доставка"
+)
+
+GOOD_ANSWER = json.dumps({"vacancy_title": "Курьер на авто", "improvement_notes": ["ok"]}, ensure_ascii=False)
+
+
+def http_error(status: int) -> HfHubHTTPError:
+    request = httpx.Request("POST", "https://example.invalid")
+    return HfHubHTTPError(f"HTTP {status}", response=httpx.Response(status, request=request))
+
+
+def chat_response(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+async def stream_chunks(text: str, size: int = 7):
+    for i in range(0, len(text), size):
+        await asyncio.sleep(0)
+        delta = SimpleNamespace(content=text[i:i + size])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class ScriptedClient:
+    """Асинхронный клиент, который по очереди отдает ошибки/ответы из сценария"""
+    script = []
+    active = 0
+    max_active = 0
+    calls = 0
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def chat_completion(self, stream=False, **kwargs):
+        cls = ScriptedClient
+        cls.last_kwargs = kwargs
+        if stream:
+            step = cls.script.pop(0) if cls.script else GOOD_ANSWER
+            cls.calls += 1
+            if isinstance(step, Exception):
+                raise step
+            return stream_chunks(step)
+        cls.calls += 1
+        cls.active += 1
+        cls.max_active = max(cls.max_active, cls.active)
+        try:
+            step = cls.script.pop(0) if cls.script else GOOD_ANSWER
+            if isinstance(step, float):
+                await asyncio.sleep(step)
+                return chat_response(GOOD_ANSWER)
+            if isinstance(step, Exception):
+                raise step
+            await asyncio.sleep(0.01)
+            return chat_response(step)
+        finally:
+            cls.active -= 1
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def optimizer():
+    ScriptedClient.script = []
+    ScriptedClient.active = ScriptedClient.max_active = ScriptedClient.calls = 0
+    with patch.object(llm, "AsyncInferenceClient", ScriptedClient), \
+            patch.object(llm, "LLM_BACKOFF_BASE", 0.001), \
+            patch.object(llm, "REWRITE_CACHE_SIZE", 0):
+        yield VacancyOptimizer()
+
+
+@pytest.fixture
+def cached_optimizer(tmp_path):
+    ScriptedClient.script = []
+    ScriptedClient.calls = 0
+    with patch.object(llm, "AsyncInferenceClient", ScriptedClient), \
+            patch.object(llm, "LLM_BACKOFF_BASE", 0.001), \
+            patch.object(llm, "REWRITE_CACHE_PATH", str(tmp_path / "rewrites.sqlite")):
+        yield VacancyOptimizer()
+
+
+def test_retries_on_throttling(optimizer):
+    ScriptedClient.script = [http_error(429), http_error(503), GOOD_ANSWER]
+    result = asyncio.run(optimizer.aoptimize(VACANCY, []))
+    assert result.vacancy_title == "Курьер на авто"
+    assert ScriptedClient.calls == 3
+
+
+def test_no_retry_on_client_error(optimizer):
+    ScriptedClient.script = [http_error(400), GOOD_ANSWER]
+    result = asyncio.run(optimizer.aoptimize(VACANCY, []))
+    assert result.improvement_notes[0].startswith("API Error")
+    assert ScriptedClient.calls == 1
+
+
+def test_deadline_cuts_slow_call(optimizer):
+    ScriptedClient.script = [5.0]
+
+    async def run():
+        start = time.monotonic()
+        result = await optimizer.aoptimize(VACANCY, [], deadline=start + 0.1)
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 1.0
+    assert result.improvement_notes[0].startswith("API Error")
+    assert result.vacancy_description == VACANCY.vacancy_description
+
+
+def test_deadline_covers_wait_for_slot(optimizer):
+    """Вызов, простоявший в очереди за слотом, не получает весь остаток дедлайна заново"""
+    ScriptedClient.script = [0.5, 0.5]
+
+    async def run():
+        with patch.object(llm, "LLM_MAX_CONCURRENCY", 1):
+            start = time.monotonic()
+            slow = asyncio.create_task(optimizer.aoptimize(VACANCY, []))
+            await asyncio.sleep(0.01)
+            late = await optimizer.aoptimize(VACANCY, [], deadline=start + 0.3)
+            elapsed = time.monotonic() - start
+            await slow
+            return late, elapsed
+
+    late, elapsed = asyncio.run(run())
+    assert late.improvement_notes[0].startswith("API Error")
+    assert elapsed < 0.45
+    assert ScriptedClient.calls == 1
+
+
+def test_global_concurrency_limit(optimizer):
+    async def run():
+        with patch.object(llm, "LLM_MAX_CONCURRENCY", 3):
+            return await asyncio.gather(*(optimizer.aoptimize(VACANCY, []) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert len(results) == 10
+    assert ScriptedClient.max_active == 3
+
+
+def test_repeated_input_served_from_cache(cached_optimizer):
+    refs = [{"vacancy_id": "ref1", "vacancy_title": "Курьер", "vacancy_description": "..."}]
+    first = asyncio.run(cached_optimizer.aoptimize(VACANCY, refs))
+    assert not first.cache_hit
+
+    # Та же вакансия с правками только в пробелах и другим input_id
+    resubmitted = VACANCY.model_copy(update={
+        "input_id": "v2", "vacancy_description": "  Доставка   заказов\n"
+    })
+    second = asyncio.run(cached_optimizer.aoptimize(resubmitted, refs))
+
+    assert second.cache_hit
+    assert second.input_id == "v2"
+    assert second.vacancy_title == first.vacancy_title
+    assert ScriptedClient.calls == 1
+    assert cached_optimizer.cache.stats()["hits"] == 1
+
+
+def test_cache_key_depends_on_references(cached_optimizer):
+    asyncio.run(cached_optimizer.aoptimize(VACANCY, [{"vacancy_id": "a"}]))
+    result = asyncio.run(cached_optimizer.aoptimize(VACANCY, [{"vacancy_id": "b"}]))
+    assert not result.cache_hit
+    assert ScriptedClient.calls == 2
+
+
+def test_errors_are_not_cached(cached_optimizer):
+    ScriptedClient.script = [http_error(400)]
+    failed = asyncio.run(cached_optimizer.aoptimize(VACANCY, []))
+    assert failed.improvement_notes[0].startswith("API Error")
+
+    retried = asyncio.run(cached_optimizer.aoptimize(VACANCY, []))
+    assert not retried.cache_hit
+    assert retried.vacancy_title == "Курьер на авто"
+
+
+def collect_stream(optimizer, vacancy, refs):
+    async def run():
+        return [event async for event in optimizer.astream_optimize(vacancy, refs)]
+    return asyncio.run(run())
+
+
+def test_stream_yields_tokens_then_result(optimizer):
+    ScriptedClient.script = [http_error(503), GOOD_ANSWER]
+    events = collect_stream(optimizer, VACANCY, [])
+
+    tokens = [payload for kind, payload in events if kind == "token"]
+    assert len(tokens) > 1
+    assert "".join(tokens) == GOOD_ANSWER
+    kind, result = events[-1]
+    assert kind == "result" and result.vacancy_title == "Курьер на авто"
+
+
+def test_stream_served_from_cache(cached_optimizer):
+    collect_stream(cached_optimizer, VACANCY, [])
+    events = collect_stream(cached_optimizer, VACANCY, [])
+    assert len(events) == 1
+    assert events[0][1].cache_hit
+
+
+def test_prompt_uses_reference_snippets(optimizer):
+    refs = [
+        {"vacancy_title": "Курьер", "vacancy_snippet": "Готовый сниппет", "vacancy_description": "Полный текст"},
+        {"vacancy_title": "Кассир", "vacancy_description": "Строка 1\nСтрока 2" + "!" * 400},
+    ]
+    prompt = optimizer._build_messages(VACANCY, refs)[-1]["content"]
+    assert "Курьер | Готовый сниппет..." in prompt
+    assert "Полный текст" not in prompt
+    assert "Кассир | " + ("Строка 1 Строка 2" + "!" * 400)[:300] + "..." in prompt
+
+
+def test_prompt_fits_token_budget(optimizer):
+    long_vacancy = VACANCY.model_copy(update={"vacancy_description": "Доставка заказов по городу. " * 2000})
+    refs = [{"vacancy_title": "Курьер", "vacancy_snippet": "Пример " * 40}] * 2
+    with patch.object(optimizer.budget, "prompt_tokens", 3000):
+        result = asyncio.run(optimizer.aoptimize(long_vacancy, refs))
+        messages, plan = optimizer._build_prompt(long_vacancy, refs)
+
+    assert result.vacancy_title == "Курьер на авто"
+    assert plan["trimmed"] and plan["prompt_tokens"] <= 3000
+    assert ScriptedClient.last_kwargs["max_tokens"] == plan["max_tokens"]
+    assert "Доставка заказов по городу." in messages[-1]["content"]
+    assert optimizer.budget.stats()["calls"] == 1
+
+    # Короткая вакансия получает меньший лимит ответа
+    _, short_plan = optimizer._build_prompt(VACANCY, refs)
+    assert not short_plan["trimmed"] and len(short_plan["references"]) == 2
+    assert short_plan["max_tokens"] < plan["max_tokens"]
+
+
+def test_long_short_fields_do_not_overflow_context(optimizer):
+    huge = VACANCY.model_copy(update={"vacancy_title": "Курьер " * 20000, "city": "Москва " * 20000})
+    messages, plan = optimizer._build_prompt(huge, [])
+    assert plan["trimmed"]
+    assert plan["prompt_tokens"] <= optimizer.budget.prompt_tokens
+    assert plan["max_tokens"] >= budget.LLM_MIN_OUTPUT_TOKENS
+    assert "Курьер Курьер" in messages[-1]["content"]
+
+    # Бюджет, в который не влезает даже шаблон: понятная ошибка в ответе, без вызова LLM
+    with patch.object(optimizer.budget, "prompt_tokens", 10):
+        result = asyncio.run(optimizer.aoptimize(VACANCY, []))
+    assert "не помещается" in result.improvement_notes[0]
+    assert ScriptedClient.calls == 0
@@ -0,0 +1,177 @@
+import json
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import sys
+import pathlib
+from unittest.mock import patch
+from sqlalchemy import create_engine
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.data import loader, prepare
+
+TABLE = "fact_vacancies_cleaned"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """SQLite вместо Postgres: 5 дней данных, пропуск в середине и строка без loaded_at"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}", pool_size=3, max_overflow=0)
+    days = ["2024-03-01", "2024-03-02", "2024-03-04", "2024-03-05"]
+    rows = [{
+        "vacancy_id": f"{day}-{i}",
+        "loaded_at": f"{day} {i % 24:02d}:15:00",
+        "total_responses": i,
+        "vacancy_title": "Курьер",
+    } for day in days for i in range(30)]
+    rows.append({"vacancy_id": "no-date", "loaded_at": None, "total_responses": 0, "vacancy_title": "Курьер"})
+    pd.DataFrame(rows).to_sql(TABLE, engine, index=False)
+    return engine
+
+
+def read_parts(out_dir: pathlib.Path) -> pd.DataFrame:
+    return pd.concat([pd.read_parquet(p) for p in sorted(out_dir.glob("part-*.parquet"))], ignore_index=True)
+
+
+def test_export_splits_by_day(engine, tmp_path):
+    out_dir = tmp_path / "raw"
+    rows = loader.export_table(engine, TABLE, out_dir, workers=3, chunk_size=7)
+
+    assert rows == 121
+    files = sorted(p.name for p in out_dir.glob("part-*.parquet"))
+    # 2024-03-03 пустой — файла нет
+    assert files == [
+        "part-2024-03-01.parquet", "part-2024-03-02.parquet",
+        "part-2024-03-04.parquet", "part-2024-03-05.parquet", "part-null.parquet",
+    ]
+    assert not list(out_dir.glob("*.tmp"))
+
+    df = read_parts(out_dir)
+    assert sorted(df["vacancy_id"]) == sorted(pd.read_sql(f"SELECT vacancy_id FROM {TABLE}", engine)["vacancy_id"])
+
+    manifest = json.loads((out_dir / loader.MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert manifest["partitions"]["2024-03-03"] == {"file": None, "rows": 0}
+    assert manifest["partitions"]["2024-03-01"]["rows"] == 30
+
+
+def test_crashed_export_resumes(engine, tmp_path):
+    out_dir = tmp_path / "raw"
+    original = loader.export_partition
+
+    def flaky(engine, table_name, day, *args, **kwargs):
+        if day == "2024-03-04":
+            raise ConnectionError("connection reset")
+        return original(engine, table_name, day, *args, **kwargs)
+
+    with patch.object(loader, "export_partition", flaky), pytest.raises(ConnectionError):
+        loader.export_table(engine, TABLE, out_dir, workers=1)
+
+    manifest = json.loads((out_dir / loader.MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert "2024-03-04" not in manifest["partitions"]
+    assert not (out_dir / "part-2024-03-04.parquet").exists()
+
+    exported = []
+
+    def counting(engine, table_name, day, *args, **kwargs):
+        exported.append(day)
+        return original(engine, table_name, day, *args, **kwargs)
+
+    with patch.object(loader, "export_partition", counting):
+        loader.export_table(engine, TABLE, out_dir, workers=2)
+
+    # Повторный запуск докачивает только то, чего нет в чекпоинте
+    assert "2024-03-01" not in exported
+    assert "2024-03-04" in exported
+    assert len(read_parts(out_dir)) == 121
+
+
+def test_rerun_refreshes_last_exported_day(engine, tmp_path):
+    """День, который еще заполнялся при выгрузке, дочитывается следующим запуском"""
+    out_dir = tmp_path / "raw"
+    loader.export_table(engine, TABLE, out_dir, workers=2)
+
+    late = pd.DataFrame([{
+        "vacancy_id": f"late-{i}", "loaded_at": f"2024-03-05 23:{i:02d}:00",
+        "total_responses": i, "vacancy_title": "Курьер",
+    } for i in range(3)])
+    late.to_sql(TABLE, engine, index=False, if_exists="append")
+
+    exported = []
+    original = loader.export_partition
+
+    def counting(engine, table_name, day, *args, **kwargs):
+        exported.append(day)
+        return original(engine, table_name, day, *args, **kwargs)
+
+    with patch.object(loader, "export_partition", counting):
+        loader.export_table(engine, TABLE, out_dir, workers=2)
+
+    # Закрытые дни не трогаем, последний и строки без даты — перечитываем
+    assert sorted(exported) == ["2024-03-05", loader.NULL_PARTITION]
+    day = pd.read_parquet(out_dir / "part-2024-03-05.parquet")
+    assert len(day) == 33
+    manifest = json.loads((out_dir / loader.MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert manifest["partitions"]["2024-03-05"]["rows"] == 33
+
+
+def test_rerun_picks_up_new_rows_without_loaded_at(engine, tmp_path):
+    out_dir = tmp_path / "raw"
+    loader.export_table(engine, TABLE, out_dir, workers=2)
+    assert len(pd.read_parquet(out_dir / "part-null.parquet")) == 1
+
+    pd.DataFrame([{"vacancy_id": "no-date-2", "loaded_at": None, "total_responses": 5, "vacancy_title": "Кассир"}]) \
+        .to_sql(TABLE, engine, index=False, if_exists="append")
+    loader.export_table(engine, TABLE, out_dir, workers=2)
+
+    nulls = pd.read_parquet(out_dir / "part-null.parquet")
+    assert sorted(nulls["vacancy_id"]) == ["no-date", "no-date-2"]
+    assert len(read_parts(out_dir)) == 122
+
+
+def test_parquet_is_typed_with_statistics(engine, tmp_path):
+    out_dir = tmp_path / "raw"
+    with patch.object(loader, "ROW_GROUP_SIZE", 10):
+        loader.export_table(engine, TABLE, out_dir, workers=2, chunk_size=7)
+
+    meta = pq.ParquetFile(out_dir / "part-2024-03-01.parquet").metadata
+    assert meta.num_row_groups == 3
+    column = meta.row_group(0).column(meta.schema.names.index("loaded_at"))
+    assert column.compression == "ZSTD"
+    assert column.statistics.has_min_max
+
+    df = pd.read_parquet(out_dir / "part-2024-03-01.parquet")
+    assert pd.api.types.is_datetime64_any_dtype(df["loaded_at"])
+    assert pd.api.types.is_integer_dtype(df["total_responses"])
+
+
+def test_partitions_share_one_schema(engine, tmp_path):
+    """Пустая в отдельный день колонка и целые с пропусками не меняют типы файла"""
+    pd.DataFrame([
+        {"vacancy_id": "all-null", "loaded_at": "2024-03-06 10:00:00", "total_responses": None, "vacancy_title": None},
+        {"vacancy_id": "gap-1", "loaded_at": "2024-03-07 10:00:00", "total_responses": None, "vacancy_title": "Курьер"},
+        {"vacancy_id": "gap-2", "loaded_at": "2024-03-07 11:00:00", "total_responses": 3, "vacancy_title": "Курьер"},
+    ]).to_sql(TABLE, engine, index=False, if_exists="append")
+    out_dir = tmp_path / "raw"
+    loader.export_table(engine, TABLE, out_dir, workers=2)
+
+    schemas = {p.name: pq.read_schema(p).remove_metadata() for p in out_dir.glob("part-*.parquet")}
+    assert len(schemas) == 7
+    first = next(iter(schemas.values()))
+    assert all(schema.equals(first) for schema in schemas.values())
+    assert first.field("total_responses").type == "int64"
+    assert first.field("vacancy_title").type == "string"
+    assert pd.read_parquet(out_dir / "part-2024-03-07.parquet")["total_responses"].tolist()[1] == 3
+
+
+def test_prepare_reads_required_columns_since(engine, tmp_path):
+    out_dir = tmp_path / "raw"
+    loader.export_table(engine, TABLE, out_dir, workers=2)
+
+    with patch.object(prepare, "RAW_DIR", out_dir):
+        df = prepare.load_raw(since="2024-03-04")
+
+    assert set(df.columns) <= set(prepare.REQUIRED_COLS)
+    assert len(df) == 60
+    assert (df["loaded_at"] >= pd.Timestamp("2024-03-04")).all()
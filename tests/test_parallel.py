@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.data.prepare import calculate_peak_efficiency_batch
+from src.data.parallel import parallel_peak_efficiency, shard_bounds, synthetic_history
+
+
+@pytest.mark.parametrize("workers", [2, 3, 8])
+def test_parallel_matches_serial(workers):
+    ids, dates, responses = synthetic_history(5_000, n_vacancies=300, seed=workers)
+    # Одинаковые метки времени внутри вакансии: порядок строк должен совпасть
+    dates[::7] = dates[1::7][:len(dates[::7])]
+
+    uniq, eff, last_idx, _ = calculate_peak_efficiency_batch(ids, dates, responses)
+    p_uniq, p_eff, p_last_idx = parallel_peak_efficiency(ids, dates, responses, workers=workers)
+
+    assert list(p_uniq) == list(uniq)
+    np.testing.assert_array_equal(p_eff, eff)
+    np.testing.assert_array_equal(p_last_idx, last_idx)
+
+
+def test_shards_do_not_split_vacancies():
+    codes = np.sort(np.random.default_rng(0).integers(0, 50, 1_000))
+    bounds = shard_bounds(codes, 4)
+
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(codes)
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+    assert all(codes[start - 1] != codes[start] for start, _ in bounds[1:])
+    assert shard_bounds(np.zeros(0, dtype=np.int64), 4) == []
@@ -0,0 +1,103 @@
+import random
+import re
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.common.quality import QualityAnalyzer
+from src.common.text import basic_issues
+
+
+def oracle_analyze_quality(text: str) -> dict:
+    """Копия прежнего VacancyAdvisor._analyze_quality"""
+    score = 0
+    issues = []
+    text_lower = text.lower()
+    if len(text) < 50:
+        return {"score": 0, "issues": ["Текст отсутствует"]}
+    if len(text) < 300:
+        issues.append("❌ Критически мало текста")
+    elif len(text) > 800:
+        score += 20
+    else:
+        score += 10
+    blocks_found = 0
+    if "обязанност" in text_lower or "задачи" in text_lower:
+        score += 15; blocks_found += 1
+    else:
+        issues.append("❓ Нет блока 'Обязанности'")
+    if "требован" in text_lower or "ищем" in text_lower:
+        score += 15; blocks_found += 1
+    else:
+        issues.append("❓ Нет блока 'Требования'")
+    if "условия" in text_lower or "предлагаем" in text_lower:
+        score += 15; blocks_found += 1
+    else:
+        issues.append("❓ Нет блока 'Условия'")
+    if blocks_found == 3: score += 10
+    money_words = ["руб", "₽", "оклад", "доход", "зарплат", "на руки"]
+    if any(w in text_lower for w in money_words):
+        score += 10
+    else:
+        issues.append("💰 Не указана зарплата")
+    if any(w in text_lower for w in ["график", "5/2", "2/2", "удален"]):
+        score += 10
+    else:
+        issues.append("📅 Не указан график")
+    if "<ul>" in text or "<li>" in text or "•" in text:
+        score += 10
+    else:
+        issues.append("📄 Нет списков")
+    return {"score": min(score, 100), "issues": issues}
+
+
+def oracle_basic_issues(text: str) -> list:
+    """Копия прежнего text.basic_issues"""
+    issues = []
+    if len(text) < 300:
+        issues.append("Слишком короткое описание — мало конкретики")
+    if len(text) > 6000:
+        issues.append("Слишком длинный текст — вероятно, тяжело читать")
+    if not re.search(r"\b(₽|руб|руб\.|€|\$|k\b|тыс)\b", text.lower()):
+        issues.append("Не найдена зарплатная вилка/упоминание компенсации")
+    if not re.search(r"\b(удаленк|remote|гибрид|hybrid)\b", text.lower()):
+        issues.append("Не найдено явное указание формата работы (удалёнка/гибрид/офис)")
+    return issues
+
+
+FRAGMENTS = [
+    "Обязанности:", "задачи", "ТРЕБОВАНИЯ", "ищем", "Условия", "предлагаем", "руб", "руб.", "₽", "100₽",
+    "оклад", "Доход", "зарплата", "на руки", "график", "5/2", "2/2", "удаленка", "Удаленно", "remote",
+    "гибрид", "Hybrid", "k", "50k", "тыс", "€", "$", "<ul>", "<UL>", "<li>", "•", "-", "x", "работа",
+    "склад", "рубка", "ищемся", "\n", " ", "  ", ".", ",",
+]
+
+
+def random_text(rng: random.Random) -> str:
+    n = rng.choice([3, 10, 40, 120, 400, 1500])
+    return "".join(rng.choice(FRAGMENTS) + rng.choice(["", " ", "", "\n"]) for _ in range(n))
+
+
+def test_scores_match_previous_implementation():
+    rng = random.Random(0)
+    analyzer = QualityAnalyzer()
+    texts = [random_text(rng) for _ in range(2000)] + ["", "руб", "x" * 7000]
+
+    for text in texts:
+        assert analyzer.analyze(text) == oracle_analyze_quality(text), text
+        assert basic_issues(text) == oracle_basic_issues(text), text
+
+    batch = analyzer.evaluate_many(texts)
+    assert [r["quality"] for r in batch] == [oracle_analyze_quality(t) for t in texts]
+    assert [r["basic_issues"] for r in batch] == [oracle_basic_issues(t) for t in texts]
+
+
+def test_overlapping_keywords_are_all_found():
+    analyzer = QualityAnalyzer()
+    # "удаленк" (формат) и "удален" (график) начинаются в одной позиции
+    assert analyzer.scan("работа: удаленк, 5/2") >= {"schedule", "basic_format"}
+    # "руб" засчитывается и как зарплата, и как basic_salary
+    assert analyzer.scan("от 100 руб в час") >= {"salary", "basic_salary"}
+    assert "basic_salary" not in analyzer.scan("рубка леса")
@@ -0,0 +1,44 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import sys
+import pathlib
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.common.quality import analyzer
+from src.common.text import heuristic_quality_score
+from src.data.score import score_corpus
+
+DESCRIPTIONS = [
+    None,
+    "Коротко",
+    "Мы ищем курьера. Обязанности: доставка. Требования: ответственность. Условия: график 5/2, "
+    "доход от 80 тыс руб. <ul><li>Удаленк</li></ul>" * 5,
+    "Продавец-консультант, работа в торговом зале. " * 12,
+]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_scores_written_as_sidecar(tmp_path, workers):
+    corpus = tmp_path / "vacancies_processed.parquet"
+    df = pd.DataFrame({
+        "vacancy_id": [f"v{i}" for i in range(60)],
+        "vacancy_title": "Вакансия",
+        "vacancy_description": [DESCRIPTIONS[i % len(DESCRIPTIONS)] for i in range(60)],
+    })
+    df.to_parquet(corpus, index=False, row_group_size=16)
+
+    stats = score_corpus(corpus, tmp_path / "quality.parquet", workers=workers, batch_rows=10)
+    assert stats["rows"] == 60
+    assert stats["rows_per_second"] > 0
+
+    scores = pq.read_table(tmp_path / "quality.parquet").to_pandas()
+    assert list(scores["vacancy_id"]) == list(df["vacancy_id"])
+    for text, row in zip(df["vacancy_description"], scores.itertuples()):
+        text = text if isinstance(text, str) else ""
+        expected = analyzer.analyze(text)
+        assert row.quality_score == expected["score"]
+        assert list(row.quality_issues) == expected["issues"]
+        assert row.heuristic_score == heuristic_quality_score(text, analyzer.basic_issues(text))
@@ -0,0 +1,348 @@
+import hashlib
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+import sys
+import pathlib
+from unittest.mock import patch
+
+root_dir = pathlib.Path(__file__).resolve().parent.parent
+sys.path.append(str(root_dir))
+
+from src.rag.index import create_index
+from src.rag.store import EmbeddingStore, current_version_path
+from src.rag.retriever import VacancyRetriever
+from src.rag.cache import EmbeddingCache
+from src.rag.batcher import MicroBatchEncoder
+
+
+def make_corpus(n=300, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    df = pd.DataFrame({
+        "vacancy_id": [f"v{i}" for i in range(n)],
+        "vacancy_title": [f"Продавец {i}" for i in range(n)],
+        "vacancy_description": [None if i % 7 == 0 else f"Описание «{i}» ✨" * (i % 5) for i in range(n)],
+        "efficiency": rng.random(n) * 100,
+        "is_top_performer": np.ones(n, dtype=bool),
+    })
+    return vectors, df
+
+
+@pytest.mark.parametrize("backend", ["exact", "ivf", "sq8", "pq"])
+def test_store_roundtrip(tmp_path, backend):
+    vectors, df = make_corpus()
+    index = create_index(backend).fit(vectors)
+    EmbeddingStore.write(tmp_path / "idx", index, df, "test-model")
+
+    store = EmbeddingStore(tmp_path / "idx")
+    assert isinstance(store.vectors, np.memmap)
+    assert len(store) == len(df)
+    assert store.manifest["model"] == "test-model"
+
+    queries = vectors[:10]
+    _, expected = index.kneighbors(queries, n_neighbors=5)
+    _, found = store.index.kneighbors(queries, n_neighbors=5)
+
+    # Строки хранилища могут быть переставлены (IVF), сравниваем по содержимому записей
+    for exp_row, found_row in zip(expected, found):
+        for e, f in zip(exp_row, found_row):
+            original = df.iloc[e]
+            record = store.records[f]
+            assert record["vacancy_id"] == original["vacancy_id"]
+            if pd.isna(original["vacancy_description"]):
+                assert record["vacancy_description"] is None
+            else:
+                assert record["vacancy_description"] == original["vacancy_description"]
+            assert record["efficiency"] == pytest.approx(original["efficiency"])
+            assert record["is_top_performer"] is True
+
+
+class FakeModel:
+    """Детерминированный энкодер: вектор зависит только от текста"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        rows = []
+        for t in texts:
+            seed = int.from_bytes(hashlib.sha1(t.encode("utf-8")).digest()[:8], "little")
+            rows.append(np.random.default_rng(seed).standard_normal(16))
+        return np.array(rows, dtype=np.float32)
+
+
+def make_retriever(tmp_path):
+    retriever = VacancyRetriever.__new__(VacancyRetriever)
+    retriever.index_dir = tmp_path / "vector_index"
+    retriever.index_path = tmp_path / "vector_index.pkl"
+    retriever.model = FakeModel()
+    retriever.query_cache = EmbeddingCache(max_size=100)
+    retriever.encoder = MicroBatchEncoder(retriever.model, max_batch_size=1)
+    retriever.store = None
+    retriever.index = None
+    retriever.vacancies = []
+    return retriever
+
+
+def test_legacy_pickle_migration(tmp_path):
+    from sklearn.neighbors import NearestNeighbors
+
+    vectors, df = make_corpus()
+    legacy_index = NearestNeighbors(n_neighbors=5, metric="cosine").fit(vectors)
+    with open(tmp_path / "vector_index.pkl", "wb") as f:
+        pickle.dump({"index": legacy_index, "vacancies": df.to_dict("records")}, f)
+
+    retriever = make_retriever(tmp_path)
+    retriever._migrate_pickle()
+
+    assert current_version_path(retriever.index_dir) is not None
+    _, expected = legacy_index.kneighbors(vectors[:5], n_neighbors=3)
+    for q, exp_row in zip(vectors[:5], expected):
+        _, found = retriever.index.kneighbors(q[None, :], n_neighbors=3)
+        got = [retriever.vacancies[i]["vacancy_id"] for i in found[0]]
+        assert got == [df.iloc[i]["vacancy_id"] for i in exp_row]
+
+
+def write_processed(path, df):
+    df.to_parquet(path, index=False)
+    return str(path)
+
+
+def test_incremental_build_encodes_only_changes(tmp_path):
+    df = pd.DataFrame({
+        "vacancy_id": [f"v{i}" for i in range(20)],
+        "vacancy_title": [f"Курьер {i}" for i in range(20)],
+        "specialization": ["Доставка"] * 20,
+        "vacancy_description": [f"Описание {i}" for i in range(20)],
+        "is_top_performer": [True] * 20,
+    })
+    retriever = make_retriever(tmp_path)
+    retriever._build_index(write_processed(tmp_path / "p1.parquet", df))
+    first_version = current_version_path(retriever.index_dir)
+    assert len(retriever.model.encoded) == 20
+
+    # Одна вакансия изменилась, одна выпала из топа, одна новая
+    df.loc[3, "vacancy_description"] = "Новое описание"
+    df.loc[5, "is_top_performer"] = False
+    df = pd.concat([df, pd.DataFrame([{
+        "vacancy_id": "v_new", "vacancy_title": "Кассир", "specialization": "Розница",
+        "vacancy_description": "Текст", "is_top_performer": True,
+    }])], ignore_index=True)
+
+    retriever.model.encoded.clear()
+    retriever._build_index(write_processed(tmp_path / "p2.parquet", df))
+
+    assert sorted(retriever.model.encoded) == sorted([
+        "Курьер 3 Доставка Новое описание", "Кассир Розница Текст"
+    ])
+    assert current_version_path(retriever.index_dir) != first_version
+    ids = set(retriever.store.columns["vacancy_id"].to_list())
+    assert "v5" not in ids and "v_new" in ids and len(ids) == 20
+
+    # Переиспользованные векторы совпадают с пересчитанными с нуля
+    fresh = make_retriever(tmp_path / "fresh")
+    fresh._build_index(str(tmp_path / "p2.parquet"))
+    for vid in ["v0", "v3", "v_new"]:
+        row_a = retriever.store.columns["vacancy_id"].to_list().index(vid)
+        row_b = fresh.store.columns["vacancy_id"].to_list().index(vid)
+        assert np.allclose(retriever.store.vectors[row_a], fresh.store.vectors[row_b], atol=1e-6)
+
+
+def build_corpus_df(n=20, description="Описание"):
+    return pd.DataFrame({
+        "vacancy_id": [f"v{i}" for i in range(n)],
+        "vacancy_title": [f"Курьер {i}" for i in range(n)],
+        "specialization": ["Доставка"] * n,
+        "vacancy_description": [f"{description} {i}" for i in range(n)],
+        "is_top_performer": [True] * n,
+    })
+
+
+def test_build_publishes_verified_version_and_api_hot_swaps(tmp_path):
+    from src.rag.build_index import build
+
+    source = write_processed(tmp_path / "p1.parquet", build_corpus_df())
+    first = build(source, retriever=make_retriever(tmp_path))
+    assert EmbeddingStore.verify(first) == []
+    assert set(EmbeddingStore(first).manifest["sha256"]) >= {"embeddings.f32", "meta/vacancy_id.bin"}
+
+    # "Сервис": только загружает опубликованную версию
+    serving = make_retriever(tmp_path)
+    serving._load_store()
+    assert serving.version == first.name
+    assert serving.refresh() is False
+
+    source = write_processed(tmp_path / "p2.parquet", build_corpus_df(n=25, description="Новое"))
+    second = build(source, retriever=make_retriever(tmp_path))
+    assert second != first
+
+    assert serving.refresh() is True
+    assert serving.version == second.name
+    assert len(serving.vacancies) == 25
+    assert len(serving.search("Курьер 3 Доставка", limit=3)) == 3
+
+
+def test_broken_version_is_not_swapped_in(tmp_path):
+    from src.rag.build_index import build
+
+    first = build(write_processed(tmp_path / "p1.parquet", build_corpus_df()), retriever=make_retriever(tmp_path))
+    serving = make_retriever(tmp_path)
+    serving._load_store()
+
+    second = build(write_processed(tmp_path / "p2.parquet", build_corpus_df(description="Новое")),
+                   retriever=make_retriever(tmp_path))
+    with open(second / "embeddings.f32", "r+b") as f:
+        f.write(b"\xff\xff\xff\xff")
+    assert EmbeddingStore.verify(second) == ["embeddings.f32"]
+
+    assert serving.refresh() is False
+    assert serving.version == first.name
+
+
+def test_build_after_model_change_rebuilds_from_scratch(tmp_path):
+    from src.rag import retriever as retriever_module
+    from src.rag.build_index import build
+
+    source = write_processed(tmp_path / "p1.parquet", build_corpus_df())
+    first = build(source, retriever=make_retriever(tmp_path))
+
+    with patch.object(retriever_module, "MODEL_NAME", "new-model"):
+        builder = make_retriever(tmp_path)
+        second = build(source, retriever=builder)
+
+    assert second != first
+    assert EmbeddingStore(second).manifest["model"] == "new-model"
+    # Векторы старой модели не переиспользованы: закодировано все заново
+    assert len(builder.model.encoded) == len(build_corpus_df())
+
+
+def test_concurrent_build_is_refused(tmp_path):
+    from src.rag.build_index import BuildLock, build
+
+    retriever = make_retriever(tmp_path)
+    with BuildLock(retriever.index_dir):
+        with pytest.raises(RuntimeError, match="уже идет"):
+            build(write_processed(tmp_path / "p1.parquet", build_corpus_df()), retriever=retriever)
+    assert current_version_path(retriever.index_dir) is None
+
+
+def test_filtered_search_widens_when_too_few(tmp_path):
+    cities = ["Москва"] * 2 + ["Казань"] * 18
+    df = build_corpus_df()
+    df["city"] = cities
+    df["profile"] = ["Курьер"] * 10 + ["Кассир"] * 10
+    retriever = make_retriever(tmp_path)
+    retriever._build_index(write_processed(tmp_path / "p.parquet", df))
+
+    assert retriever.store.filter_rows({"city": " МОСКВА "}).tolist() == sorted(
+        retriever.store.columns["vacancy_id"].to_list().index(f"v{i}") for i in (0, 1)
+    )
+    assert retriever.store.filter_rows({"city": "Москва", "profile": "Кассир"}).tolist() == []
+    assert retriever.store.filter_rows({"city": None}) is None
+
+    # Точное совпадение по всем полям
+    found = retriever.search("Курьер 15", limit=3,
+                             filters={"city": "Казань", "profile": "Кассир", "specialization": "Доставка"})
+    assert len(found) == 3
+    assert all(r["city"] == "Казань" and r["profile"] == "Кассир" for r in found)
+
+    # В Москве всего 2 курьера: они идут первыми, третий — из расширенной выборки
+    found = retriever.search("Курьер 15", limit=3,
+                             filters={"city": "Москва", "profile": "Курьер", "specialization": "Доставка"})
+    assert {r["vacancy_id"] for r in found[:2]} == {"v0", "v1"}
+    assert found[2]["profile"] == "Курьер" and found[2]["city"] == "Казань"
+
+    # Неизвестный город: сразу следующий уровень, без потери результатов
+    found = retriever.search("Курьер 15", limit=3, filters={"city": "Омск", "profile": "Кассир",
+                                                            "specialization": "Доставка"})
+    assert len(found) == 3 and all(r["profile"] == "Кассир" for r in found)
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid", "prefilter"])
+def test_search_many_matches_single_search(tmp_path, monkeypatch, mode):
+    from src.rag import retriever as retriever_module
+
+    monkeypatch.setattr(retriever_module, "SEARCH_MODE", mode)
+    df = build_corpus_df(n=40)
+    df["city"] = ["Москва", "Казань", "Омск", "Москва"] * 10
+    df["profile"] = ["Курьер"] * 30 + ["Кассир"] * 10
+    builder = make_retriever(tmp_path)
+    builder._build_index(write_processed(tmp_path / "p.parquet", df))
+
+    queries = [f"Курьер {i} Доставка" for i in range(12)] + ["Курьер 3 Доставка"]
+    filters = [
+        None,
+        {"city": "Москва", "profile": "Курьер", "specialization": "Доставка"},
+        {"city": "Казань", "profile": "Кассир", "specialization": "Доставка"},
+        {"city": "Сочи", "profile": "Кассир", "specialization": "Доставка"},
+    ] * 3 + [None]
+
+    retriever = make_retriever(tmp_path)
+    retriever._load_store()
+    calls = []
+    encode = retriever.model.encode
+    retriever.model.encode = lambda texts, **kwargs: calls.append(list(texts)) or encode(texts, **kwargs)
+    batch = retriever.search_many(queries, limit=3, filters=filters)
+    # Все 12 уникальных запросов закодированы одним вызовом модели
+    assert len(calls) == 1 and len(calls[0]) == 12
+    assert retriever.encoder.stats()["items"] == 12
+
+    single = make_retriever(tmp_path)
+    single._load_store()
+    expected = [single.search(q, limit=3, filters=f) for q, f in zip(queries, filters)]
+    assert batch == expected
+    assert all(len(refs) == 3 for refs in batch)
+
+
+class ExplodingColumn:
+    def __getitem__(self, row):
+        raise AssertionError("полный текст не должен читаться")
+
+
+def test_record_views_decode_lazily_and_carry_snippet(tmp_path):
+    vectors, df = make_corpus(n=20)
+    df.loc[1, "vacancy_description"] = "Первая строка\nвторая строка " + "х" * 500
+    EmbeddingStore.write(tmp_path / "idx", create_index("exact").fit(vectors), df, "test-model")
+    store = EmbeddingStore(tmp_path / "idx")
+
+    record = store.records[1]
+    assert not hasattr(record, "__dict__")
+    assert record == store.record(1) and dict(record)["vacancy_id"] == "v1"
+    assert record["vacancy_snippet"] == ("Первая строка вторая строка " + "х" * 500)[:300]
+    # Пустое описание — пустой сниппет
+    assert store.records[0]["vacancy_snippet"] == "" and store.records[0].get("vacancy_description") is None
+
+    store.columns["vacancy_description"] = ExplodingColumn()
+    assert record["vacancy_title"] == "Продавец 1"
+    with pytest.raises(AssertionError):
+        record["vacancy_description"]
+    with pytest.raises(IndexError):
+        store.records[len(store)]
+
+
+def test_concurrent_small_batches_share_one_model_call(tmp_path):
+    """Одиночные search_many из параллельных запросов (демо) идут через микробатчер"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    builder = make_retriever(tmp_path)
+    builder._build_index(write_processed(tmp_path / "p.parquet", build_corpus_df()))
+
+    retriever = make_retriever(tmp_path)
+    retriever._load_store()
+    calls = []
+    encode = retriever.model.encode
+    retriever.model.encode = lambda texts, **kwargs: calls.append(list(texts)) or encode(texts, **kwargs)
+    retriever.encoder = MicroBatchEncoder(retriever.model, max_batch_size=16, max_wait_ms=200)
+
+    queries = [f"Курьер {i} Доставка" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda q: retriever.search_many([q], limit=3)[0], queries))
+
+    assert len(calls) == 1 and sorted(calls[0]) == sorted(queries)
+    assert retriever.encoder.stats()["items"] == 8
+    single = make_retriever(tmp_path)
+    single._load_store()
+    assert results == [single.search(q, limit=3) for q in queries]